@@ -0,0 +1,556 @@
+import itertools
+import math
+import threading
+import time
+from typing import Dict, Iterator, List, NamedTuple, Optional
+
+import cv2
+import numpy as np
+
+from src.stats.timestamps import format_timestamp, now_us, parse_timestamp
+from supervisely.annotation.annotation import Annotation, AnnotationJsonFields
+from supervisely.annotation.label import Label
+from supervisely.annotation.obj_class import ObjClass
+from supervisely.annotation.tag import TagJsonFields
+from supervisely.api.dataset_api import DatasetInfo
+from supervisely.api.image_api import ImageInfo
+from supervisely.api.module_api import ApiField
+from supervisely.api.project_api import ProjectInfo
+from supervisely.geometry.bitmap import Bitmap
+from supervisely.geometry.constants import CLASS_ID
+from supervisely.geometry.point_location import PointLocation
+from supervisely.geometry.polygon import Polygon
+from supervisely.geometry.rectangle import Rectangle
+from supervisely.imaging import image as sly_image
+from supervisely.project.project_meta import ProjectMeta
+
+# Number of items per request of the SDK methods (see e.g. `ImageApi._download_batch`)
+DOWNLOAD_BATCH_SIZE = 50
+TAGS_BATCH_SIZE = 100
+
+# Geometry of the synthetic classes, in the order of the classes
+_GEOMETRIES = (Polygon, Rectangle, Bitmap)
+
+
+class ProjectSpec(NamedTuple):
+    """
+    Shape of the synthetic project served by `FakeApi`.
+
+    :param images: Total number of images.
+    :param datasets: Number of datasets the images are spread over.
+    :param width: Width of the images.
+    :param height: Height of the images.
+    :param labels_per_image: Mean number of labels per image (Poisson distributed).
+    :param label_size: Max side of a label relative to the image side.
+    :param classes: Number of object classes ("class_0" is a polygon class, "class_1" a
+        rectangle class, "class_2" a bitmap class and so on).
+    :param distinct_images: Number of distinct pixel contents. The images reuse them, so large
+        projects don't have to be generated pixel by pixel (the hashes are still unique).
+    :param duplicate_ratio: Fraction of the images that are copies (same hash) of other images.
+    :param seed: Seed of the generator, the same spec always produces the same project.
+    """
+
+    images: int = 1000
+    datasets: int = 1
+    width: int = 1024
+    height: int = 1024
+    labels_per_image: float = 5.0
+    label_size: float = 0.2
+    classes: int = 2
+    distinct_images: int = 8
+    duplicate_ratio: float = 0.0
+    seed: int = 0
+
+
+def _named(cls, **fields):
+    """Create an SDK info namedtuple with the given fields (the rest are None)."""
+    return cls(**{**dict.fromkeys(cls._fields), **fields})
+
+
+class FakeServer:
+    """
+    In-memory state of the synthetic project and the request accounting shared by the APIs.
+
+    Every API method counts the requests the SDK would send (e.g. one request per 50
+    downloaded images) and sleeps `latency` seconds per request, plus the transfer time
+    of the downloaded bytes if `bandwidth_mbps` is set. The sleeps of concurrent threads
+    overlap, as the requests of a real client would.
+
+    :param spec: Shape of the project.
+    :param latency: Latency of a request in seconds.
+    :param bandwidth_mbps: Download bandwidth in MB/s, 0 for unlimited.
+    """
+
+    def __init__(self, spec: ProjectSpec, latency: float = 0.0, bandwidth_mbps: float = 0.0):
+        self.spec = spec
+        self.latency = max(float(latency), 0.0)
+        self.bandwidth = max(float(bandwidth_mbps), 0.0) * 1024 * 1024
+        self.project_id = 1
+        self.calls: Dict[str, int] = {}
+        self._lock = threading.RLock()
+        self._ids = itertools.count(1_000_000)
+        self.custom_data: Dict = {}
+        obj_classes = [
+            ObjClass(f"class_{i}", _GEOMETRIES[i % len(_GEOMETRIES)], sly_id=i + 1)
+            for i in range(spec.classes)
+        ]
+        self.meta = ProjectMeta(obj_classes=obj_classes)
+        self.collections: Dict[int, Dict] = {}
+        rng = np.random.default_rng(spec.seed)
+        self.contents = [self._encode(self._texture(rng)) for _ in range(spec.distinct_images)]
+        self.datasets = {ds_id: f"ds_{ds_id}" for ds_id in range(1, spec.datasets + 1)}
+        self.images: Dict[int, Dict] = {}
+        self.anns: Dict[int, List[Dict]] = {}
+        created_at = now_us()
+        for i in range(spec.images):
+            img_id = i + 1
+            content = int(rng.integers(spec.distinct_images))
+            img_hash = f"img-{img_id}"
+            if i > 0 and rng.random() < spec.duplicate_ratio:
+                source = self.images[int(rng.integers(1, img_id))]
+                content, img_hash = source["content"], source["hash"]
+            self.images[img_id] = {
+                "dataset_id": i % spec.datasets + 1,
+                "content": content,
+                "hash": img_hash,
+                "created_at": created_at,
+                "updated_at": created_at,
+                "tags": [],
+                "meta": {},
+            }
+            self.anns[img_id] = self._labels_json(rng, obj_classes)
+
+    def _texture(self, rng: np.random.Generator) -> np.ndarray:
+        height, width = self.spec.height, self.spec.width
+        small = rng.integers(0, 256, (max(height // 32, 2), max(width // 32, 2), 3))
+        img = cv2.resize(small.astype(np.uint8), (width, height), interpolation=cv2.INTER_CUBIC)
+        noise = rng.normal(0, 8, img.shape)
+        return np.clip(img + noise, 0, 255).astype(np.uint8)
+
+    @staticmethod
+    def _encode(img: np.ndarray) -> bytes:
+        return cv2.imencode(".jpg", img[:, :, ::-1], [cv2.IMWRITE_JPEG_QUALITY, 90])[1].tobytes()
+
+    def _labels_json(self, rng: np.random.Generator, obj_classes: List[ObjClass]) -> List[Dict]:
+        height, width = self.spec.height, self.spec.width
+        max_side = max(int(min(height, width) * self.spec.label_size), 4)
+        labels = []
+        for _ in range(rng.poisson(self.spec.labels_per_image)):
+            obj_class = obj_classes[int(rng.integers(len(obj_classes)))]
+            h, w = (int(v) for v in rng.integers(2, max_side, 2))
+            top, left = int(rng.integers(0, height - h)), int(rng.integers(0, width - w))
+            if obj_class.geometry_type is Rectangle:
+                geometry = Rectangle(top, left, top + h - 1, left + w - 1)
+            elif obj_class.geometry_type is Bitmap:
+                mask = np.zeros((h, w), dtype=np.uint8)
+                axes = (max(w // 2, 1), max(h // 2, 1))
+                cv2.ellipse(mask, (w // 2, h // 2), axes, 0, 0, 360, 1, -1)
+                geometry = Bitmap(mask.astype(bool), origin=PointLocation(top, left))
+            else:
+                angles = np.sort(rng.uniform(0, 2 * np.pi, 12))
+                radius = rng.uniform(0.5, 1.0, 12)
+                rows = top + h / 2 + np.sin(angles) * radius * h / 2
+                cols = left + w / 2 + np.cos(angles) * radius * w / 2
+                geometry = Polygon([PointLocation(r, c) for r, c in zip(rows, cols)])
+            labels.append(Label(geometry, obj_class))
+        data = Annotation((height, width), labels).to_json()[AnnotationJsonFields.LABELS]
+        for obj, label in zip(data, labels):
+            obj[ApiField.ID] = next(self._ids)
+            obj[CLASS_ID] = label.obj_class.sly_id
+        return data
+
+    def request(self, name: str, count: int = 1, nbytes: int = 0) -> None:
+        """Account `count` requests of the method and wait for their latency."""
+        with self._lock:
+            self.calls[name] = self.calls.get(name, 0) + count
+        delay = self.latency * count
+        if self.bandwidth > 0:
+            delay += nbytes / self.bandwidth
+        if delay > 0:
+            time.sleep(delay)
+
+    @property
+    def requests(self) -> int:
+        """Total number of requests."""
+        with self._lock:
+            return sum(self.calls.values())
+
+    def reset_calls(self) -> None:
+        with self._lock:
+            self.calls = {}
+
+    def touch(self, img_id: int) -> None:
+        """Mark the image as updated (as the server does on any change of the image)."""
+        self.images[img_id]["updated_at"] = now_us()
+
+    def new_id(self) -> int:
+        return next(self._ids)
+
+    def image_info(self, img_id: int) -> ImageInfo:
+        img = self.images[img_id]
+        return _named(
+            ImageInfo,
+            id=img_id,
+            name=f"{img_id}.jpg",
+            hash=img["hash"],
+            ext="jpg",
+            mime="image/jpeg",
+            size=len(self.contents[img["content"]]),
+            width=self.spec.width,
+            height=self.spec.height,
+            labels_count=len(self.anns[img_id]),
+            dataset_id=img["dataset_id"],
+            project_id=self.project_id,
+            created_at=format_timestamp(img["created_at"]),
+            updated_at=format_timestamp(img["updated_at"]),
+            meta=dict(img["meta"]),
+            tags=[dict(tag) for tag in img["tags"]],
+        )
+
+    def dataset_info(self, dataset_id: int) -> DatasetInfo:
+        ids = [i for i, img in self.images.items() if img["dataset_id"] == dataset_id]
+        updated_at = max([self.images[i]["updated_at"] for i in ids], default=now_us())
+        return _named(
+            DatasetInfo,
+            id=dataset_id,
+            name=self.datasets[dataset_id],
+            project_id=self.project_id,
+            images_count=len(ids),
+            items_count=len(ids),
+            updated_at=format_timestamp(updated_at),
+        )
+
+    def tag_name(self, tag_meta_id: int) -> Optional[str]:
+        tag_meta = self.meta.get_tag_meta_by_id(tag_meta_id)
+        return None if tag_meta is None else tag_meta.name
+
+
+class _ProjectApi:
+    def __init__(self, server: FakeServer):
+        self.server = server
+
+    def get_info_by_id(self, id: int) -> ProjectInfo:
+        self.server.request("project.get_info_by_id")
+        return _named(
+            ProjectInfo,
+            id=id,
+            name="Synthetic Project",
+            images_count=len(self.server.images),
+            items_count=len(self.server.images),
+            datasets_count=len(self.server.datasets),
+            custom_data=dict(self.server.custom_data),
+        )
+
+    def get_meta(self, id: int, with_settings: bool = False) -> Dict:
+        self.server.request("project.get_meta")
+        return self.server.meta.to_json()
+
+    def update_meta(self, id: int, meta: ProjectMeta) -> ProjectMeta:
+        self.server.request("project.update_meta")
+        if isinstance(meta, dict):
+            meta = ProjectMeta.from_json(meta)
+        tag_metas = [
+            tag_meta if tag_meta.sly_id is not None else tag_meta.clone(sly_id=self.server.new_id())
+            for tag_meta in meta.tag_metas
+        ]
+        self.server.meta = meta.clone(tag_metas=tag_metas)
+        return self.server.meta
+
+    def get_custom_data(self, id: int) -> Dict:
+        self.server.request("project.get_custom_data")
+        return dict(self.server.custom_data)
+
+    def update_custom_data(self, id: int, data: Dict, silent: bool = False) -> Dict:
+        self.server.request("project.update_custom_data")
+        self.server.custom_data = dict(data)
+        return dict(data)
+
+
+class _DatasetApi:
+    def __init__(self, server: FakeServer):
+        self.server = server
+
+    def get_list(self, project_id: int, filters=None, recursive: bool = False, **kwargs):
+        self.server.request("dataset.get_list")
+        return [self.server.dataset_info(ds_id) for ds_id in self.server.datasets]
+
+    def get_info_by_id(self, id: int, raise_error: bool = False) -> DatasetInfo:
+        self.server.request("dataset.get_info_by_id")
+        return self.server.dataset_info(id)
+
+
+class _ImageTagApi:
+    def __init__(self, server: FakeServer):
+        self.server = server
+
+    def add_to_entities_json(
+        self,
+        project_id: int,
+        tags_list: List[Dict],
+        batch_size: int = TAGS_BATCH_SIZE,
+        log_progress: bool = False,
+    ) -> List[int]:
+        requests = math.ceil(len(tags_list) / batch_size)
+        self.server.request("image.tag.add_to_entities_json", requests)
+        ids = []
+        ts = format_timestamp(now_us())
+        for tag in tags_list:
+            img_id = tag[ApiField.ENTITY_ID]
+            tag_id = self.server.new_id()
+            self.server.images[img_id]["tags"].append(
+                {
+                    ApiField.TAG_ID: tag[ApiField.TAG_ID],
+                    ApiField.VALUE: tag.get(ApiField.VALUE),
+                    ApiField.ID: tag_id,
+                    ApiField.CREATED_AT: ts,
+                    ApiField.UPDATED_AT: ts,
+                }
+            )
+            self.server.touch(img_id)
+            ids.append(tag_id)
+        return ids
+
+
+class _ImageApi:
+    def __init__(self, server: FakeServer):
+        self.server = server
+        self.tag = _ImageTagApi(server)
+
+    def get_list_generator(
+        self,
+        dataset_id: int = None,
+        filters: Optional[List[Dict]] = None,
+        sort: str = "id",
+        sort_order: str = "asc",
+        limit: Optional[int] = None,
+        force_metadata_for_links: bool = False,
+        batch_size: Optional[int] = None,
+        project_id: int = None,
+    ) -> Iterator[List[ImageInfo]]:
+        since = None
+        for f in filters or []:
+            if f[ApiField.FIELD] == ApiField.UPDATED_AT and f[ApiField.OPERATOR] == ">=":
+                since = parse_timestamp(f[ApiField.VALUE])
+        ids = [
+            i
+            for i, img in sorted(self.server.images.items())
+            if img["dataset_id"] == dataset_id and (since is None or img["updated_at"] >= since)
+        ]
+        batch_size = batch_size or 500
+        for start in range(0, max(len(ids), 1), batch_size):
+            self.server.request("image.get_list")
+            yield [self.server.image_info(i) for i in ids[start : start + batch_size]]
+
+    def download_bytes(self, dataset_id: int, ids: List[int], progress_cb=None) -> List[bytes]:
+        contents = [self.server.contents[self.server.images[i]["content"]] for i in ids]
+        self.server.request(
+            "image.download",
+            math.ceil(len(ids) / DOWNLOAD_BATCH_SIZE),
+            nbytes=sum(len(c) for c in contents),
+        )
+        if progress_cb is not None:
+            progress_cb(len(ids))
+        return contents
+
+    def download_nps(
+        self, dataset_id: int, ids: List[int], progress_cb=None, keep_alpha: bool = False
+    ) -> List[np.ndarray]:
+        return [
+            sly_image.read_bytes(img_bytes, keep_alpha)
+            for img_bytes in self.download_bytes(dataset_id, ids, progress_cb)
+        ]
+
+    def update_tag_value(self, tag_id: int, value) -> Dict:
+        self.server.request("image.update_tag_value")
+        for img_id, img in self.server.images.items():
+            for tag in img["tags"]:
+                if tag[ApiField.ID] == tag_id:
+                    tag[ApiField.VALUE] = value
+                    tag[ApiField.UPDATED_AT] = format_timestamp(now_us())
+                    self.server.touch(img_id)
+                    return {"success": True}
+        raise KeyError(f"Tag {tag_id} not found")
+
+    def set_custom_sort_bulk(self, ids: List[int], sort_values: List[str]) -> Dict:
+        self.server.request("image.set_custom_sort_bulk")
+        for img_id, value in zip(ids, sort_values):
+            self.server.images[img_id]["meta"][ApiField.CUSTOM_SORT] = value
+            self.server.touch(img_id)
+        return {"success": True}
+
+
+class _AnnotationApi:
+    def __init__(self, server: FakeServer):
+        self.server = server
+
+    def download_json_batch(
+        self, dataset_id: int, image_ids: List[int], progress_cb=None, **kwargs
+    ) -> List[Dict]:
+        self.server.request(
+            "annotation.download_json_batch", math.ceil(len(image_ids) / DOWNLOAD_BATCH_SIZE)
+        )
+        height, width = self.server.spec.height, self.server.spec.width
+        anns = []
+        for img_id in image_ids:
+            tags = []
+            for tag in self.server.images[img_id]["tags"]:
+                tags.append(
+                    {
+                        TagJsonFields.TAG_NAME: self.server.tag_name(tag[ApiField.TAG_ID]),
+                        TagJsonFields.VALUE: tag[ApiField.VALUE],
+                        TagJsonFields.ID: tag[ApiField.ID],
+                    }
+                )
+            anns.append(
+                {
+                    AnnotationJsonFields.IMG_DESCRIPTION: "",
+                    AnnotationJsonFields.IMG_SIZE: {
+                        AnnotationJsonFields.IMG_SIZE_HEIGHT: height,
+                        AnnotationJsonFields.IMG_SIZE_WIDTH: width,
+                    },
+                    AnnotationJsonFields.IMG_TAGS: tags,
+                    AnnotationJsonFields.LABELS: [dict(obj) for obj in self.server.anns[img_id]],
+                }
+            )
+        if progress_cb is not None:
+            progress_cb(len(image_ids))
+        return anns
+
+
+class _AdvancedApi:
+    def __init__(self, server: FakeServer):
+        self.server = server
+
+    def remove_tags_from_images(
+        self, tag_meta_ids: List[int], image_ids: List[int], progress_cb=None
+    ) -> None:
+        self.server.request(
+            "advanced.remove_tags_from_images", math.ceil(len(image_ids) / TAGS_BATCH_SIZE)
+        )
+        for img_id in image_ids:
+            img = self.server.images[img_id]
+            img["tags"] = [t for t in img["tags"] if t[ApiField.TAG_ID] not in tag_meta_ids]
+            self.server.touch(img_id)
+        if progress_cb is not None:
+            progress_cb(len(image_ids))
+
+
+class _EntitiesCollectionApi:
+    def __init__(self, server: FakeServer):
+        self.server = server
+
+    def get_info_by_name(self, parent_id: int, name: str, fields: List[str] = []):
+        self.server.request("entities_collection.get_info_by_name")
+        for collection_id, collection in self.server.collections.items():
+            if collection["name"] == name:
+                return self._info(collection_id)
+        return None
+
+    def create(self, project_id: int, name: str, *args, **kwargs):
+        self.server.request("entities_collection.create")
+        collection_id = self.server.new_id()
+        self.server.collections[collection_id] = {"name": name, "items": []}
+        return self._info(collection_id)
+
+    def remove(self, id: int, force: bool = False) -> None:
+        self.server.request("entities_collection.remove")
+        self.server.collections.pop(id, None)
+
+    def add_items(self, id: int, items: List[int]) -> List[Dict[str, int]]:
+        self.server.request("entities_collection.add_items")
+        self.server.collections[id]["items"].extend(items)
+        return [{"id": item} for item in items]
+
+    def get_items(self, collection_id: int, *args, **kwargs) -> List[ImageInfo]:
+        items = self.server.collections[collection_id]["items"]
+        self.server.request("entities_collection.get_items", max(math.ceil(len(items) / 500), 1))
+        return [self.server.image_info(i) for i in items]
+
+    def _info(self, collection_id: int):
+        name = self.server.collections[collection_id]["name"]
+        return _CollectionInfo(collection_id, name, self.server.project_id)
+
+
+class _CollectionInfo(NamedTuple):
+    id: int
+    name: str
+    project_id: int
+
+
+class FakeApi:
+    """
+    In-process stand-in of `supervisely.Api` serving a synthetic project, for benchmarks.
+
+    Only the methods used by the app are implemented, with the signatures of the SDK.
+    Images are served as JPEG bytes and decoded like the SDK does, annotations as JSON with
+    class ids and image tags, so the decode costs of the app are measured. Request counts
+    are accumulated in `calls` (by method) and the latency is injected per request
+    (see `FakeServer`).
+
+    :param spec: Shape of the synthetic project.
+    :param latency: Latency of a request in seconds.
+    :param bandwidth_mbps: Download bandwidth in MB/s, 0 for unlimited.
+    """
+
+    def __init__(
+        self,
+        spec: Optional[ProjectSpec] = None,
+        latency: float = 0.0,
+        bandwidth_mbps: float = 0.0,
+    ):
+        self.server = FakeServer(spec or ProjectSpec(), latency, bandwidth_mbps)
+        self.headers: Dict[str, str] = {}
+        self.project = _ProjectApi(self.server)
+        self.dataset = _DatasetApi(self.server)
+        self.image = _ImageApi(self.server)
+        self.annotation = _AnnotationApi(self.server)
+        self.advanced = _AdvancedApi(self.server)
+        self.entities_collection = _EntitiesCollectionApi(self.server)
+
+    @property
+    def project_id(self) -> int:
+        return self.server.project_id
+
+    @property
+    def calls(self) -> Dict[str, int]:
+        return dict(self.server.calls)
+
+    def edit_images(self, ratio: float, seed: int = 1) -> List[int]:
+        """
+        Simulate relabeling: move the first label of a fraction of the images.
+
+        :return: IDs of the edited images.
+        """
+        rng = np.random.default_rng(seed)
+        ids = [i for i in self.server.images if rng.random() < ratio]
+        for img_id in ids:
+            objects = self.server.anns[img_id]
+            if objects:
+                obj = objects[0] = dict(objects[0])
+                obj[ApiField.ID] = self.server.new_id()
+                if "points" in obj:
+                    points = np.array(obj["points"]["exterior"], dtype=np.int64)
+                    points += int(rng.choice([-2, -1, 1, 2]))
+                    obj["points"] = {**obj["points"], "exterior": points.clip(0).tolist()}
+            self.server.touch(img_id)
+        return ids
+
+    def set_image_tag(self, tag_name: str, img_ids: List[int]) -> None:
+        """Assign the tag to the images, as a user would in the labeling tool."""
+        tag_meta = self.server.meta.get_tag_meta(tag_name)
+        ts = format_timestamp(now_us())
+        for img_id in img_ids:
+            self.server.images[img_id]["tags"].append(
+                {
+                    ApiField.TAG_ID: tag_meta.sly_id,
+                    ApiField.VALUE: None,
+                    ApiField.ID: self.server.new_id(),
+                    ApiField.CREATED_AT: ts,
+                    ApiField.UPDATED_AT: ts,
+                }
+            )
+            self.server.touch(img_id)
+
+    def target_class(self) -> str:
+        """Name of the first class of the project."""
+        return self.server.meta.obj_classes.items()[0].name
@@ -0,0 +1,343 @@
+"""
+Offline benchmarks of the statistics, filtering and tagging paths against `FakeApi`.
+
+Example:
+    python -m benchmarks.run --images 2000 --latency-ms 20 --output results.json
+    python -m benchmarks.run --images 2000 --latency-ms 20 --baseline results.json
+
+With `--baseline` the results are compared with a previous run of the same configuration and
+the command fails (exit code 1) if any benchmark regressed by more than `--tolerance`.
+"""
+
+import argparse
+import json
+import logging
+import sys
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from benchmarks.fake_api import FakeApi, ProjectSpec
+from src.components.accept_anomalies import TAG_ACCEPTED_BOUNDARY, AcceptAnomaliesNode
+from src.components.run import RunNode
+from src.components.statistics import Statictics
+from src.stats.batching import BatchSizer, current_rss
+from src.stats.metrics import DefaultImgTags
+from src.stats.workers import _worker_calculate
+from supervisely.sly_logger import logger
+
+# Metrics of a result and whether a larger value is better (see `find_regressions`)
+COMPARED = {
+    "images_per_s": True,
+    "calls_per_image": False,
+    "peak_rss_mb": False,
+    "batch_p99_ms": False,
+}
+
+
+# Arguments that don't affect the results
+_NOT_CONFIG = ("output", "baseline", "tolerance", "verbose")
+
+
+class RssSampler:
+    """
+    Samples the resident memory of the process in a background thread.
+    Used as a context manager, `peak` is the highest sample of the block.
+
+    :param interval: Sampling interval in seconds.
+    """
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, current_rss())
+
+    def __enter__(self) -> "RssSampler":
+        self.peak = current_rss()
+        self._thread = threading.Thread(target=self._run, name="rss-sampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss())
+
+
+def _result(
+    name: str,
+    images: int,
+    seconds: float,
+    calls: Dict[str, int],
+    peak_rss: int,
+    batch_times: List[float],
+) -> Dict:
+    total_calls = sum(calls.values())
+    times_ms = np.array(batch_times or [seconds], dtype=np.float64) * 1000
+    return {
+        "name": name,
+        "images": images,
+        "seconds": round(seconds, 3),
+        "images_per_s": round(images / seconds, 1) if seconds > 0 else 0.0,
+        "api_calls": total_calls,
+        "calls_per_image": round(total_calls / images, 4) if images else 0.0,
+        "peak_rss_mb": round(peak_rss / 1024 / 1024, 1),
+        "batches": len(batch_times),
+        "batch_p50_ms": round(float(np.percentile(times_ms, 50)), 2),
+        "batch_p99_ms": round(float(np.percentile(times_ms, 99)), 2),
+        "calls": dict(sorted(calls.items())),
+    }
+
+
+def _measure(name: str, api: FakeApi, images: int, func: Callable[[List[float]], None]) -> Dict:
+    """Run `func` once and collect the wall time, the API calls and the peak memory."""
+    api.server.reset_calls()
+    batch_times: List[float] = []
+    with RssSampler() as rss:
+        start = time.perf_counter()
+        func(batch_times)
+        seconds = time.perf_counter() - start
+    return _result(name, images, seconds, api.calls, rss.peak, batch_times)
+
+
+class BatchTimer:
+    """
+    Records the batch latency of the statistics loop: the wall time between the batches it
+    completes. `BatchSizer.observe` is called once per completed batch, so the sizer of the
+    node is wrapped.
+
+    :param sizer: The batch sizer of the statistics node.
+    """
+
+    def __init__(self, sizer: BatchSizer):
+        self.times: List[float] = []
+        self._last = 0.0
+        start, observe = sizer.start, sizer.observe
+
+        def on_start() -> None:
+            self._last = time.perf_counter()
+            start()
+
+        def on_batch() -> int:
+            now = time.perf_counter()
+            self.times.append(now - self._last)
+            self._last = now
+            return observe()
+
+        sizer.start, sizer.observe = on_start, on_batch
+
+
+def _create_stats_node(api: FakeApi, args: argparse.Namespace) -> Statictics:
+    node = Statictics(
+        api=api,
+        project_id=api.project_id,
+        workers=args.workers,
+        prefetch_depth=args.prefetch_depth,
+        metrics=args.metrics,
+        sync_interval=args.sync_interval,
+        warm_start=False,
+        intensity_channel=args.channel,
+        memory_budget_mb=args.memory_budget_mb,
+        max_batch_size=args.max_batch_size,
+        tile_size=args.tile_size,
+    )
+    node.set_selected_class(api.target_class())
+    if node.pool.workers > 1:
+        # the worker processes are started (and import the app) once per app lifetime,
+        # the startup is not measured
+        executor = node.pool.executor
+        warm_up = [executor.submit(_worker_calculate, None, {}, [], None) for _ in range(8)]
+        for future in warm_up:
+            future.result()
+    return node
+
+
+def bench_statistics(
+    api: FakeApi, node: Statictics, timer: BatchTimer, name: str, images: int
+) -> Dict:
+    """Time `Statictics.calculate_statistics` of the selected class."""
+
+    def func(batch_times: List[float]) -> None:
+        timer.times = batch_times
+        node.calculate_statistics(node.selected_class)
+
+    result = _measure(name, api, images, func)
+    # seconds of each stage, from the profiler of the node (see `StageProfiler`)
+    stages = node.profiler.summary()["stages"]
+    result["stages"] = {stage: values["seconds"] for stage, values in stages.items()}
+    return result
+
+
+def bench_filter(api: FakeApi, node: RunNode, filters: Dict, stats: Dict, repeat: int) -> Dict:
+    """Time `RunNode._filter_images` (one batch per call)."""
+
+    def func(batch_times: List[float]) -> None:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            node._filter_images(filters, stats)
+            batch_times.append(time.perf_counter() - start)
+
+    images = len(stats["image_ids"]) * repeat
+    return _measure("filter_images", api, images, func)
+
+
+def bench_accept(
+    api: FakeApi, run_node: RunNode, node: AcceptAnomaliesNode, filters: Dict, stats: Dict
+) -> Dict:
+    """
+    Time `AcceptAnomaliesNode.run` on the collection of the filtered images, with the
+    boundary tags on the first and the last image of the collection.
+    """
+    node._validate_project_meta()
+    collection_id = run_node.run(filters, stats)
+    items = api.server.collections[collection_id]["items"]
+    api.set_image_tag(TAG_ACCEPTED_BOUNDARY, [items[0], items[-1]])
+
+    def func(batch_times: List[float]) -> None:
+        start = time.perf_counter()
+        node.run(collection_id)
+        batch_times.append(time.perf_counter() - start)
+
+    return _measure("accept_anomalies", api, len(items), func)
+
+
+def run_benchmarks(args: argparse.Namespace) -> Dict:
+    spec = ProjectSpec(
+        images=args.images,
+        datasets=args.datasets,
+        width=args.width,
+        height=args.height,
+        labels_per_image=args.labels,
+        label_size=args.label_size,
+        classes=args.classes,
+        distinct_images=args.distinct_images,
+        duplicate_ratio=args.duplicate_ratio,
+        seed=args.seed,
+    )
+    api = FakeApi(spec, latency=args.latency_ms / 1000, bandwidth_mbps=args.bandwidth_mbps)
+    results = []
+
+    stats_node = _create_stats_node(api, args)
+    timer = BatchTimer(stats_node.sizer)
+    try:
+        results.append(bench_statistics(api, stats_node, timer, "statistics_full", spec.images))
+        edited = api.edit_images(args.edit_ratio, seed=args.seed + 1)
+        name = "statistics_incremental"
+        results.append(bench_statistics(api, stats_node, timer, name, max(len(edited), 1)))
+    finally:
+        stats_node.pool.shutdown()
+    stats = stats_node.stats
+
+    filters = {
+        "min_area": float(np.nanmedian(stats[DefaultImgTags.MAX_AREA.value])),
+        "min_num_labels": 0,
+        "sort_by": args.sort_by,
+    }
+    run_node = RunNode(api=api, project_id=api.project_id)
+    results.append(bench_filter(api, run_node, filters, stats, args.repeat))
+    accept_node = AcceptAnomaliesNode(api=api, project_id=api.project_id)
+    results.append(bench_accept(api, run_node, accept_node, filters, stats))
+
+    config = {k: v for k, v in vars(args).items() if k not in _NOT_CONFIG}
+    return {"config": config, "results": results}
+
+
+def find_regressions(current: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """
+    Compare the results with the baseline.
+
+    :return: Descriptions of the metrics that are worse than the baseline by more than
+        `tolerance` (relative).
+    """
+    if current["config"] != baseline.get("config"):
+        logger.warning("The baseline was measured with a different configuration.")
+    previous = {r["name"]: r for r in baseline.get("results", [])}
+    regressions = []
+    for result in current["results"]:
+        base = previous.get(result["name"])
+        if base is None:
+            continue
+        for metric, higher_is_better in COMPARED.items():
+            value, ref = result[metric], base.get(metric)
+            if not ref:
+                continue
+            change = (value - ref) / ref
+            if (-change if higher_is_better else change) > tolerance:
+                regressions.append(
+                    f"{result['name']}.{metric}: {ref} -> {value} ({change * 100:+.1f}%)"
+                )
+    return regressions
+
+
+def format_table(results: List[Dict]) -> str:
+    columns = ["name", "images", "seconds", "images_per_s", "calls_per_image"]
+    columns += ["peak_rss_mb", "batches", "batch_p50_ms", "batch_p99_ms"]
+    rows = [columns] + [[str(r[c]) for c in columns] for r in results]
+    widths = [max(len(row[i]) for row in rows) for i in range(len(columns))]
+    return "\n".join("  ".join(v.ljust(w) for v, w in zip(row, widths)) for row in rows)
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    project = parser.add_argument_group("synthetic project")
+    project.add_argument("--images", type=int, default=1000)
+    project.add_argument("--datasets", type=int, default=1)
+    project.add_argument("--width", type=int, default=1024)
+    project.add_argument("--height", type=int, default=1024)
+    project.add_argument("--labels", type=float, default=5.0, help="mean labels per image")
+    project.add_argument("--label-size", type=float, default=0.2, help="relative to the image")
+    project.add_argument("--classes", type=int, default=2)
+    project.add_argument("--distinct-images", type=int, default=8)
+    project.add_argument("--duplicate-ratio", type=float, default=0.0)
+    project.add_argument("--edit-ratio", type=float, default=0.1, help="for the incremental run")
+    project.add_argument("--seed", type=int, default=0)
+    server = parser.add_argument_group("server")
+    server.add_argument("--latency-ms", type=float, default=0.0, help="per request")
+    server.add_argument("--bandwidth-mbps", type=float, default=0.0, help="0 for unlimited")
+    app = parser.add_argument_group("app")
+    app.add_argument("--workers", type=int, default=1)
+    app.add_argument("--prefetch-depth", type=int, default=2)
+    app.add_argument("--metrics", type=lambda s: s.split(","), default=None)
+    app.add_argument("--channel", default="all")
+    app.add_argument("--memory-budget-mb", type=int, default=0)
+    app.add_argument("--max-batch-size", type=int, default=0, help="0 for the app default")
+    app.add_argument("--tile-size", type=int, default=0)
+    app.add_argument("--sync-interval", type=float, default=2.0)
+    app.add_argument("--sort-by", default=DefaultImgTags.AVG_INTENSITY_DIFF.value)
+    app.add_argument("--repeat", type=int, default=20, help="calls of _filter_images")
+    parser.add_argument("--output", help="save the results as JSON")
+    parser.add_argument("--baseline", help="JSON results of a previous run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--verbose", action="store_true", help="keep the app logs")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    if not args.verbose:
+        logger.setLevel(logging.ERROR)
+    report = run_benchmarks(args)
+    print(format_table(report["results"]))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = find_regressions(report, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
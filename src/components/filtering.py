@@ -1,6 +1,7 @@
 from typing import Callable, Dict, List, Optional, Tuple
 
 from src.components.base_element import BaseActionElement
+from src.stats.metrics import DefaultImgTags, get_metric, metric_names
 from supervisely.app.content import DataJson
 from supervisely.app.widgets import (
     Button,
@@ -26,6 +27,13 @@ class CustomFilters(SolutionElement):
     This class is a placeholder for the custom filters functionality.
     """
 
+    # metrics used by each filter (see `required_metrics`)
+    FILTER_METRICS = {
+        "min_num_labels": DefaultImgTags.NUMBER_OF_LABELS.value,
+        "max_num_labels": DefaultImgTags.NUMBER_OF_LABELS.value,
+        "min_area": DefaultImgTags.MAX_AREA.value,
+    }
+
     def __init__(
         self,
         x: int = 0,
@@ -34,6 +42,11 @@ class CustomFilters(SolutionElement):
         **kwargs,
     ):
         super().__init__(*args, **kwargs)
+        # additional (registered, not default) metrics offered for sorting, they are calculated
+        # once they are used (see `required_metrics`)
+        default_metrics = metric_names(default_only=True)
+        self.extra_metrics = [m for m in metric_names() if m not in default_metrics]
+        self._on_filters_saved_callback = None
         self.card = self._create_card()
         self.node = SolutionCardNode(content=self.card, x=x, y=y)
         self.modals = [self.modal]
@@ -328,6 +341,8 @@ class CustomFilters(SolutionElement):
             items.append(RadioGroup.Item("_max_intensity_diff", "Maximum Intensity Difference"))
         if min_intensity_diff:
             items.append(RadioGroup.Item("_min_intensity_diff", "Minimum Intensity Difference"))
+        for name in self.extra_metrics:
+            items.append(RadioGroup.Item(name, get_metric(name).title))
         return items
 
     def _update_sort_options(self) -> None:
@@ -356,6 +371,28 @@ class CustomFilters(SolutionElement):
         DataJson()[self.widget_id]["filters"] = filters
         DataJson().send_changes()
         logger.info("Filters saved", extra={"filters": filters})
+        if callable(self._on_filters_saved_callback):
+            self._on_filters_saved_callback(filters)
+
+    def on_filters_saved(self, func: Callable) -> Callable:
+        """
+        Decorator to register a callback function that will be called with the filters
+        when they are saved.
+        Usage:
+            @instance.on_filters_saved
+            def my_callback(filters):
+                ...
+        """
+        self._on_filters_saved_callback = func
+        return func
+
+    @classmethod
+    def required_metrics(cls, filters: Dict) -> List[str]:
+        """Names of the metrics the filters and the sorting use."""
+        metrics = [cls.FILTER_METRICS[key] for key in filters if key in cls.FILTER_METRICS]
+        if filters.get("sort_by"):
+            metrics.append(filters["sort_by"])
+        return [m for m in metric_names() if m in metrics]
 
     def _get_filters_from_widges(self) -> Dict:
         """
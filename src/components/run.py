@@ -181,12 +181,9 @@ class RunNode(BaseActionElement):
         sort_by = filters.get("sort_by")
 
         image_ids = np.asarray(stats.get("image_ids", []))
-        max_area_stats = np.asarray(stats.get("_max_area", []))
-        total_area = np.asarray(stats.get("_total_area", []))
-        num_labels = np.asarray(stats.get("_labels", []))
-        avg_intensity_diff = np.asarray(stats.get("_avg_intensity_diff", []))
-        min_intensity_diff = np.asarray(stats.get("_min_intensity_diff", []))
-        max_intensity_diff = np.asarray(stats.get("_max_intensity_diff", []))
+        # metrics that were not calculated for an image are NaN in the store columns
+        max_area_stats = np.asarray(stats.get("_max_area", []), dtype=float)
+        num_labels = np.asarray(stats.get("_labels", []), dtype=float)
 
         sets = []
 
@@ -231,18 +228,10 @@ class RunNode(BaseActionElement):
 
         intersection_indices = sorted(list(intersections))
 
-        if sort_by == "_labels":
-            sorted_indices = np.argsort(num_labels[intersection_indices])
-        elif sort_by == "_max_area":
-            sorted_indices = np.argsort(max_area_stats[intersection_indices])
-        elif sort_by == "_total_area":
-            sorted_indices = np.argsort(total_area[intersection_indices])
-        elif sort_by == "_avg_intensity_diff":
-            sorted_indices = np.argsort(avg_intensity_diff[intersection_indices])
-        elif sort_by == "_min_intensity_diff":
-            sorted_indices = np.argsort(min_intensity_diff[intersection_indices])
-        elif sort_by == "_max_intensity_diff":
-            sorted_indices = np.argsort(max_intensity_diff[intersection_indices])
+        if sort_by in stats:
+            # any calculated metric can be used for sorting (see `metrics.register_metric`)
+            sort_values = np.asarray(stats[sort_by], dtype=float)
+            sorted_indices = np.argsort(sort_values[intersection_indices])
         else:
             sorted_indices = np.arange(len(intersection_indices))
 
@@ -1,38 +1,53 @@
-from collections import defaultdict
-from copy import deepcopy
-from datetime import datetime, timezone
-from typing import Callable, Dict, List, Optional, Tuple
+import os
+import threading
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
 
-import cv2
 import numpy as np
 
 from src.components.base_element import BaseActionElement
-from supervisely._utils import get_or_create_event_loop
-from supervisely.annotation.annotation import Annotation
-from supervisely.annotation.label import Label
+from src.stats.ann_decoder import TargetAnnotation, TargetAnnotationDecoder
+from src.stats.batching import BatchSizer
+from src.stats.cache import ImageCache
+from src.stats.change_feed import ChangeFeed
+from src.stats.checkpoint import StatsCheckpoint
+from src.stats.fingerprint import NO_FINGERPRINT, image_fingerprint
+from src.stats.image_stats import calculate_image_statistics
+from src.stats.index import ImageIndex
+from src.stats.metrics import DefaultImgTags, get_metric, metric_names, needs_pixels
+from src.stats.pipeline import Prefetcher, StatsBatch
+from src.stats.pixels import CHANNEL_ALL, PixelSource, accuracy_report
+from src.stats.profiler import (
+    STAGE_ANNOTATIONS,
+    STAGE_DECODE,
+    STAGE_DOWNLOAD,
+    STAGE_LISTING,
+    STAGE_METRICS,
+    STAGE_SEND_CHANGES,
+    StageProfiler,
+)
+from src.stats.store import StatsStore
+from src.stats.sync import DataJsonSync, Throttle
+from src.stats.tag_writer import TagUpdate, TagWriter
+from src.stats.timestamps import NEVER, now_us, parse_timestamp, parse_timestamps
+from src.stats.warm_start import (
+    STATS_CHANNEL_KEY,
+    STATS_CLASS_KEY,
+    STATS_FINGERPRINT_TAG,
+    WarmStart,
+    fingerprint_tag_value,
+)
+from src.stats.workers import StatsWorkerPool
 from supervisely.annotation.tag_meta import TagApplicableTo, TagMeta, TagValueType
 from supervisely.api.api import Api
+from supervisely.api.dataset_api import DatasetInfo
+from supervisely.api.image_api import ImageInfo
+from supervisely.api.project_api import ProjectInfo
 from supervisely.app.content import DataJson
 from supervisely.app.exceptions import show_dialog
 from supervisely.app.widgets import Button, Icons, SlyTqdm, SolutionCard
-from supervisely.collection.str_enum import StrEnum
 from supervisely.project.project_meta import ProjectMeta
 from supervisely.sly_logger import logger
 from supervisely.solution.base_node import Automation, SolutionCardNode
-from supervisely.task.progress import tqdm_sly
-
-
-class DefaultImgTags(StrEnum):
-    MAX_AREA = "_max_area"
-    TOTAL_AREA = "_total_area"
-    NUMBER_OF_LABELS = "_labels"
-    AVG_INTENSITY_DIFF = "_avg_intensity_diff"
-    MIN_INTENSITY_DIFF = "_min_intensity_diff"
-    MAX_INTENSITY_DIFF = "_max_intensity_diff"
-
-
-# class DefaultObjTags(StrEnum):
-#     INTENSITY_DIFF = "_intensity_diff"
 
 
 class StatisticsAuto(Automation):
@@ -65,10 +80,43 @@ class Statictics(BaseActionElement):
         x: int = 0,
         y: int = 0,
         dataset_id: Optional[int] = None,
+        workers: int = 1,
+        prefetch_depth: int = 2,
+        upload_queue_depth: int = 4,
+        tag_flush_size: int = 1000,
+        tag_flush_age: float = 10.0,
+        tag_inplace_limit: int = 100,
+        metrics: Optional[List[str]] = None,
+        checkpoint_dir: Optional[str] = None,
+        store_mmap_dir: Optional[str] = None,
+        sync_interval: float = 2.0,
+        warm_start: bool = False,
+        classes: Optional[List[str]] = None,
+        preview_max_side: int = 0,
+        preview_quality: int = 95,
+        preview_sample: int = 10,
+        cache_dir: Optional[str] = None,
+        cache_size_mb: int = 0,
+        dedup_memory_mb: int = 256,
+        intensity_channel: str = "all",
+        memory_budget_mb: int = 0,
+        max_batch_size: int = 0,
+        tile_size: int = 0,
+        listing_page_size: int = 500,
         *args,
         **kwargs,
     ):
         super().__init__(*args, **kwargs)
+        if memory_budget_mb > 0 and dedup_memory_mb > memory_budget_mb // 2:
+            # the images kept for deduplication are counted against the memory budget
+            logger.warning(
+                f"Deduplication memory ({dedup_memory_mb} MB) is limited to a half of the "
+                f"memory budget ({memory_budget_mb} MB)."
+            )
+            dedup_memory_mb = memory_budget_mb // 2
+        if max_batch_size <= 0:
+            # without a budget the batches are not sized by the image resolution
+            max_batch_size = 500 if memory_budget_mb > 0 else 50
         self.api = api
         self.project_id = project_id
         self.dataset_id = dataset_id
@@ -76,10 +124,79 @@ class Statictics(BaseActionElement):
 
         self.card = self._create_card()
         self.automation = StatisticsAuto(self.run)
+        self.pool = StatsWorkerPool(workers, tile_size=tile_size)
+        self.cache = None
+        if cache_dir is not None and cache_size_mb > 0:
+            self.cache = ImageCache(cache_dir, cache_size_mb * 1024 * 1024)
+        self.pixels = PixelSource(
+            api,
+            max_side=preview_max_side,
+            quality=preview_quality,
+            cache=self.cache,
+            memory_mb=dedup_memory_mb,
+            channel=intensity_channel,
+            tile_size=tile_size,
+        )
+        self.preview_sample = preview_sample
+        self._preview_checked = False
+        # the prefetched batches, the one being calculated and the one being downloaded
+        self.sizer = BatchSizer(
+            memory_budget_mb,
+            in_flight=prefetch_depth + 2,
+            max_images=max_batch_size,
+            channels=3 if self.pixels.channel == CHANNEL_ALL else 1,
+            max_side=self.pixels.max_side,
+            reserved_mb=dedup_memory_mb,
+            tile_size=tile_size,
+        )
+        self.feed = ChangeFeed(api, project_id, dataset_id, page_size=listing_page_size)
+        self.profiler = StageProfiler()
+        self.prefetch_depth = prefetch_depth
+        self.upload_queue_depth = upload_queue_depth
+        self.tag_flush_size = tag_flush_size
+        self.tag_flush_age = tag_flush_age
+        self.tag_inplace_limit = tag_inplace_limit
+        checkpoint_path = None
+        if checkpoint_dir is not None:
+            name = f"stats_{project_id}_{dataset_id or 'all'}.json"
+            checkpoint_path = os.path.join(checkpoint_dir, name)
+        # metric columns are added for each calculated class (see `_column`)
+        columns = {"image_ids": np.int64, "updated_at": np.int64, "fingerprint": np.int64}
+        self.store = StatsStore(columns, mmap_dir=store_mmap_dir)
+        self.checkpoint = StatsCheckpoint(
+            checkpoint_path, self._get_checkpoint_state, store=self.store
+        )
+        self._checkpoint_restored = False
+        # bulk state is kept out of DataJson, it is persisted by the checkpoint.
+        # Image-level "last updates" are stored in the "updated_at" column of the store.
+        self._dataset_updates: Dict[int, int] = {}
+        self.index = ImageIndex()
+        self.sync = DataJsonSync(self.widget_id, min_interval=sync_interval)
+        self._progress_throttle = Throttle(sync_interval)
+        self._pixels_throttle = Throttle(sync_interval)
+        self.warm_start = warm_start
+        # classes calculated in addition to the selected one ("*" for all classes)
+        self.classes = list(classes or [])
+        self._class_ids: Dict[str, int] = {}
+        # store columns with the IDs of the statistics tags, by tag meta ID
+        self._tag_columns: Dict[int, str] = {}
+        # calculated images without labels of the target class in the current run
+        self._unlabeled = 0
+        self._state_classes: Optional[List[int]] = None
+        # metrics of the calculated statistics (see `_mark_stale`)
+        self._state_metrics: Optional[List[str]] = None
         self.node = SolutionCardNode(content=self.card, x=x, y=y)
 
+        # guards the run and metrics state, `run` and `set_metrics` are called from UI threads
+        self._lock = threading.Lock()
         self.in_progress = False
+        self._calculating = False
+        # metrics set during a calculation, applied after it (see `set_metrics`)
+        self._pending_metrics: Optional[List[str]] = None
         self.selected_class = None
+        self.metrics = metric_names(default_only=True)
+        if metrics:
+            self.set_metrics(metrics)
 
         @self.run_btn.click
         def on_run_click():
@@ -154,263 +271,761 @@ class Statictics(BaseActionElement):
         self.selected_class = class_name
         logger.info(f"Selected class for statistics calculation: {self.selected_class}")
 
+    def set_metrics(self, metrics: List[str]) -> bool:
+        """
+        Set the metrics to be calculated. Image pixels are downloaded only if
+        any of the metrics requires them (e.g. intensity difference).
+        The metrics do not change during a calculation: metrics set while it is in progress
+        are applied after it finishes and `run` calculates them in one more run.
+        The images are recalculated on the next run if metrics are added (see `_mark_stale`).
+
+        :param metrics: Names of the registered metrics (see `metrics.register_metric`).
+        :return: True if the metrics differ from the previously set ones.
+        """
+        unknown = [m for m in metrics if m not in metric_names()]
+        if unknown:
+            raise ValueError(f"Unknown metrics: {unknown}")
+        metrics = [m for m in metric_names() if m in metrics]
+        with self._lock:
+            requested = self.metrics if self._pending_metrics is None else self._pending_metrics
+            if metrics == requested:
+                return False
+            if self._calculating:
+                self._pending_metrics = metrics
+                logger.info(f"Metrics {metrics} will be calculated after the current run.")
+                return True
+            self.metrics = metrics
+        logger.info(f"Metrics for statistics calculation: {self.metrics}")
+        return True
+
+    @property
+    def needs_pixels(self) -> bool:
+        return needs_pixels(self.metrics)
+
     def run(self):
-        self.hide_is_finished_badge()
-        self.show_in_progress_badge()
-        self.run_btn.disable()
         if not self.selected_class:
             msg = "Class is not selected for statistics calculation."
             logger.warning(msg)
             show_dialog(title="Warning", description=msg, status="warning")
-            self.run_btn.enable()
-            return
-        if self.in_progress:
-            logger.debug("Statistics calculation is already in progress.")
             return
-        self.in_progress = True
-        self.calculate_statistics(self.selected_class)
-        self._trigger_stats_calculated()  # Trigger the callback after calculation
-        self.hide_in_progress_badge()
-        self.show_is_finished_badge()
-        self.in_progress = False
-        self.run_btn.enable()
+        with self._lock:
+            if self.in_progress:
+                logger.debug("Statistics calculation is already in progress.")
+                return
+            self.in_progress = True
+        self.hide_is_finished_badge()
+        self.show_in_progress_badge()
+        self.run_btn.disable()
+        try:
+            metrics = None
+            # metrics set during the run are calculated by one more run (see `set_metrics`)
+            while metrics != self.metrics:
+                metrics = self.metrics
+                self.calculate_statistics(self.selected_class)
+            self._trigger_stats_calculated()  # Trigger the callback after calculation
+            self.show_is_finished_badge()
+        finally:
+            self.hide_in_progress_badge()
+            self.in_progress = False
+            self.run_btn.enable()
+
+    def run_in_background(self) -> None:
+        """Start `run` in a background thread, so the caller (e.g. a UI callback) is not blocked."""
+        threading.Thread(target=self.run, name="stats-run", daemon=True).start()
 
-    def get_updates_state(self) -> Dict:
-        if "last_updates" not in DataJson()[self.widget_id]:
-            DataJson()[self.widget_id]["last_updates"] = {}
-            DataJson().send_changes()
-        return DataJson()[self.widget_id]["last_updates"]
+    def get_image_index(self) -> ImageIndex:
+        return self.index
 
-    def get_img_idx_map(self) -> Dict:
-        if "img_idx_map" not in DataJson()[self.widget_id]:
-            DataJson()[self.widget_id]["img_idx_map"] = {}
-            DataJson().send_changes()
-        return DataJson()[self.widget_id]["img_idx_map"]
+    @staticmethod
+    def _column(metric: str, class_id: int) -> str:
+        """Name of the store column with the metric of the class."""
+        return f"{metric}.{class_id}"
+
+    @staticmethod
+    def _tag_column(metric: str) -> str:
+        """Name of the store column with the IDs of the metric tags (0 if unknown)."""
+        return f"tag_id.{metric}"
 
     @property
-    def stats(self) -> Dict:
+    def stats(self) -> Dict[str, np.ndarray]:
         """
-        Get the statistics for the project/dataset from DataJson.
-        If statistics are not present, initialize them.
+        Get the statistics of the selected class for the project/dataset.
+        Returns a copy of the columns ("image_ids" and a column for each metric).
+        Metrics that were not calculated for the image are NaN.
+        Switching between the calculated classes does not require recalculation.
         """
-        res = {}
-        for default_tag in DefaultImgTags.values():
-            if default_tag in DataJson()[self.widget_id]:
-                res[default_tag] = DataJson()[self.widget_id][default_tag]
-        if "image_ids" in DataJson()[self.widget_id]:
-            res["image_ids"] = DataJson()[self.widget_id]["image_ids"]
-        return deepcopy(res)
+        image_ids = np.array(self.store.column("image_ids"))
+        stats = {"image_ids": image_ids}
+        class_id = self._class_ids.get(self.selected_class)
+        columns = self.store.columns
+        for metric in metric_names():
+            name = self._column(metric, class_id)
+            if class_id is not None and name in columns:
+                stats[metric] = np.array(self.store.column(name)[: len(image_ids)])
+            else:
+                stats[metric] = np.full(len(image_ids), np.nan)
+        return stats
 
-    def calculate_statistics(self, target_class: str) -> dict:
+    def calculate_statistics(self, target_class: str) -> None:
         """
         Calculate statistics for the given target class in the project/dataset.
+        The metrics set during the calculation are applied after it (see `set_metrics`).
 
         :param target_class: The class for which to calculate statistics.
-        :return: A dictionary containing the statistics.
         """
-        img_tags_to_upload = []
+        with self._lock:
+            self._calculating = True
+        try:
+            self._calculate_statistics(target_class)
+        finally:
+            with self._lock:
+                self._calculating = False
+                pending, self._pending_metrics = self._pending_metrics, None
+                if pending is not None:
+                    self.metrics = pending
+            if pending is not None:
+                logger.info(f"Metrics for statistics calculation: {pending}")
+
+    def _calculate_statistics(self, target_class: str) -> None:
         project_info = self.api.project.get_info_by_id(self.project_id)
         meta = self._validate_project_meta()
-        if self.dataset_id is not None:
-            datasets = [self.api.dataset.get_info_by_id(self.dataset_id)]
-            if datasets[0].project_id != self.project_id:
-                raise ValueError(
-                    f"Dataset {self.dataset_id} does not belong to project {self.project_id}."
-                )
+        datasets = self.feed.list_datasets()
+
+        classes = self._get_classes(meta, target_class)
+        self._class_ids = {name: meta.get_obj_class(name).sly_id for name in classes}
+        class_ids = sorted(self._class_ids.values())
+        if not self._checkpoint_restored:
+            self._restore_checkpoint(class_ids)
+            self._checkpoint_restored = True
+        elif self._state_classes != class_ids:
+            self._reset_state()
+        elif not set(self.metrics) <= set(self._state_metrics or []):
+            self._mark_stale([m for m in self.metrics if m not in (self._state_metrics or [])])
+        self._state_classes = class_ids
+        self._state_metrics = list(self.metrics)
+        for class_id in class_ids:
+            for metric in metric_names():
+                self.store.add_column(self._column(metric, class_id), np.float64)
+        for name in metric_names() + [STATS_FINGERPRINT_TAG]:
+            self.store.add_column(self._tag_column(name), np.int64)
+        self._tag_columns = {
+            meta.get_tag_meta(name).sly_id: self._tag_column(name) for name in self._tag_names
+        }
+        index = self.get_image_index()
+
+        tags_class = (project_info.custom_data or {}).get(STATS_CLASS_KEY)
+        tags_channel = (project_info.custom_data or {}).get(STATS_CHANNEL_KEY, CHANNEL_ALL)
+        warm_start = None
+        if tags_class == target_class and tags_channel == self.pixels.channel:
+            if self.warm_start and classes == [target_class]:
+                warm_start = WarmStart(self.metrics)
         else:
-            datasets = self.api.dataset.get_list(self.project_id, recursive=True)
-
-        last_updated_map = self.get_updates_state()
-        img_idx_map = self.get_img_idx_map()
-
-        for default_tag in DefaultImgTags.values():
-            if default_tag not in DataJson()[self.widget_id]:
-                DataJson()[self.widget_id][default_tag] = []
-                DataJson().send_changes()
-        if "image_ids" not in DataJson()[self.widget_id]:
-            DataJson()[self.widget_id]["image_ids"] = []
-            DataJson().send_changes()
+            # the tags are stamped again after they are rewritten (see `_set_stats_class`),
+            # tags of another intensity channel are recalculated (see `image_fingerprint`)
+            self._clear_stats_class(project_info)
+            if tags_class != target_class and len(index) > 0:
+                self._resync_tags(meta, tags_class, target_class)
+
         total = project_info.images_count if self.dataset_id is None else datasets[0].images_count
+        prefetcher = Prefetcher(
+            lambda: self._iter_batches(datasets, meta, classes, target_class, warm_start),
+            depth=self.prefetch_depth,
+        )
+        writer = TagWriter(
+            self.api,
+            self.project_id,
+            max_buffer=self.tag_flush_size,
+            max_age=self.tag_flush_age,
+            depth=self.upload_queue_depth,
+            on_progress=self._update_tags_progress,
+            on_commit=self.checkpoint.commit,
+            max_inplace=self.tag_inplace_limit,
+            profiler=self.profiler,
+            on_added=self._on_tags_added,
+        )
+        # "last updates" are committed only after the tags of the batch are uploaded
+        self.checkpoint.start(
+            self._commit_updates, classes=class_ids, metrics=self.metrics, settings=self._settings
+        )
+        self._update_tags_progress(0, 0)
+        self.sizer.start()
+        self.profiler.start()
+        self._unlabeled = 0
+        seq = 0
         self.pbar.show()
-        with self.pbar(total=total, message=f"Processing...") as pbar:
-            for dataset in datasets:
-                ds_updated_at_state = last_updated_map.get(dataset.id)
-                if not self._recently_updated(dataset.updated_at, ds_updated_at_state):
+        try:
+            with self.pbar(total=total, message=f"Processing...") as pbar:
+                for batch in prefetcher:
+                    if batch.skipped > 0:
+                        pbar.update(batch.skipped)
+                    if batch.restored:
+                        self._apply_restored(batch.restored, index)
+                    if batch.unchanged or batch.restored:
+                        seq += 1
+                        ids = np.array(batch.unchanged + list(batch.restored), dtype=np.int64)
+                        updated_at = np.full(len(ids), now_us(), dtype=np.int64)
+                        self.checkpoint.stage(seq, ("images", ids, updated_at))
+                        writer.mark(seq)
+                        pbar.update(len(ids))
+                    if batch.infos:
+                        seq += 1
+                        updated_at = self._process_batch(batch, meta, index, writer, target_class)
+                        ids = np.array([info.id for info in batch.infos], dtype=np.int64)
+                        self.checkpoint.stage(seq, ("images", ids, updated_at))
+                        writer.mark(seq)
+                        self.sizer.observe()
+                        batch_profile = self.profiler.end_batch()
+                        logger.debug("Statistics batch profile.", extra={"stages": batch_profile})
+                        self._update_pixel_stats()
+                        self.sync.set("summary", self.store.summary())
+                        with self.profiler.stage(STAGE_SEND_CHANGES):
+                            self.sync.flush()
+                        pbar.update(len(batch.infos))
+                    if batch.dataset_done:
+                        seq += 1
+                        self.checkpoint.stage(seq, ("dataset", batch.dataset.id, now_us()))
+                        self.checkpoint.stage(seq, ("cursor", batch.dataset.id, batch.cursor))
+                        writer.mark(seq)
+        finally:
+            writer.join()
+            if self.cache is not None:
+                self.cache.flush()
+            self.pbar.hide()
+        self.profiler.stop()
+        if self._unlabeled > 0:
+            # reported once per run, sparse projects have many images without the class
+            logger.warning(
+                f"{self._unlabeled} calculated images have no labels of the class {target_class}."
+            )
+        self.checkpoint.save()
+        self._set_stats_class(target_class)
+        self._report_memory()
+        self._report_profile()
+
+        self._update_pixel_stats(force=True)
+        self.sync.set("summary", self.store.summary())
+        self.sync.flush(force=True)
+
+    def _iter_batches(
+        self,
+        datasets: List[DatasetInfo],
+        meta: ProjectMeta,
+        classes: List[str],
+        target_class: str,
+        warm_start: Optional[WarmStart] = None,
+    ) -> Iterator[StatsBatch]:
+        """
+        Lists the images of the datasets that were updated since the last calculation
+        (see `ChangeFeed`) and downloads their annotations. Pixels are downloaded lazily:
+        only if an active metric needs them and only for images that have labels of the
+        calculated classes. Images whose content fingerprint did not change (e.g. only tags were
+        added) are not recalculated. New images whose statistics tags were calculated for the
+        same fingerprint are restored from the tag values if `warm_start` is set.
+        Executed in the prefetch thread.
+        """
+        decoder = TargetAnnotationDecoder(meta, classes, self._tag_names)
+        for dataset in datasets:
+            ds_updated_at_state = self._dataset_updates.get(dataset.id, NEVER)
+            if parse_timestamp(dataset.updated_at) <= ds_updated_at_state:
+                logger.debug(
+                    f"Skipping dataset {dataset.name} in project {self.project_id} "
+                    f"due to no updates since last calculation."
+                )
+                yield StatsBatch(dataset, skipped=dataset.images_count)
+                continue
+
+            listed = 0
+            cursor = self.feed.cursors.get(dataset.id, NEVER)
+            pages = self.profiler.iterate(STAGE_LISTING, self.feed.iter_changes(dataset))
+            for batch in pages:
+                # the freshness of the whole page is checked with one comparison
+                rows = self.index.lookup([img_info.id for img_info in batch])
+                state = self.store.take("updated_at", rows, default=NEVER)
+                curr = parse_timestamps([img_info.updated_at for img_info in batch])
+                listed += len(batch)
+                cursor = max(cursor, int(curr.max()))
+                img_infos = [info for info, fresh in zip(batch, curr > state) if fresh]
+                skipped = len(batch) - len(img_infos)
+                if skipped > 0:
                     logger.debug(
-                        f"Skipping dataset {dataset.name} in project {self.project_id} "
+                        f"Skipping {skipped} images in dataset {dataset.name} "
                         f"due to no updates since last calculation."
                     )
-                    pbar.update(dataset.images_count)
+                if not img_infos:
+                    yield StatsBatch(dataset, skipped=skipped)
                     continue
-                img_tags_to_delete = defaultdict(set)
-
-                for batch in self.api.image.get_list_generator(dataset.id, batch_size=50):
-                    img_infos = []
-                    for img_info in batch:
-                        if self._recently_updated(
-                            img_info.updated_at, last_updated_map.get(img_info.id)
-                        ):
-                            img_infos.append(img_info)
-                    if len(batch) - len(img_infos) > 0:
-                        logger.debug(
-                            f"Skipping {len(batch) - len(img_infos)} images in dataset {dataset.name} "
-                            f"due to no updates since last calculation."
-                        )
-                        pbar.update(len(batch) - len(img_infos))
-                    if not img_infos:
-                        continue
 
-                    img_ids = [img_info.id for img_info in img_infos]
-                    # loop = get_or_create_event_loop()
-                    # img_np = loop.run_until_complete(self.api.image.download_nps_async(img_ids))
-                    img_np = self.api.image.download_nps(dataset_id=dataset.id, ids=img_ids)
+                img_ids = [img_info.id for img_info in img_infos]
+                with self.profiler.stage(STAGE_ANNOTATIONS, len(img_ids)):
                     anns = self.api.annotation.download_json_batch(dataset.id, img_ids)
-                    anns = [Annotation.from_json(ann, meta) for ann in anns]
-
-                    for img, ann, info in zip(img_np, anns, img_infos):
-                        exists = info.id in img_idx_map
-                        img_stats = self._calculate_image_statistics(img, ann, target_class)
-                        if not exists:
-                            DataJson()[self.widget_id]["image_ids"].append(info.id)
-                            # DataJson().send_changes()
-                        now = datetime.now(timezone.utc)
-                        last_updated_map[info.id] = now.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
-
-                        for key, value in img_stats.items():
-                            need_add = True
-                            if ann.img_tags.has_key(key):
-                                if ann.img_tags.get(key).value == value:
-                                    need_add = False
-                                else:
-                                    tag_meta = meta.get_tag_meta(key)
-                                    img_tags_to_delete[tag_meta.sly_id].add(info.id)
-
-                            if need_add:
-                                img_tags_to_upload.append(
-                                    {
-                                        "tagId": meta.get_tag_meta(key).sly_id,
-                                        "entityId": info.id,
-                                        "value": value,
-                                    }
-                                )
-
-                            if not exists:
-                                DataJson()[self.widget_id][key].append(value)
-                                # DataJson().send_changes()
-                            elif need_add:
-                                DataJson()[self.widget_id][key][img_idx_map[info.id]] = value
-                                # DataJson().send_changes()
-                        if not exists:
-                            img_idx_map[info.id] = len(img_idx_map)
-                    DataJson().send_changes()
-                    pbar.update(len(img_infos))
-                if len(img_tags_to_delete) > 0:
-                    logger.info(
-                        f"Removing {len(img_tags_to_delete)} tags from images in dataset {dataset.name}."
+                with self.profiler.stage(STAGE_DECODE, len(anns)):
+                    anns = [decoder.decode(ann) for ann in anns]
+                target_labels = [ann.labels for ann in anns]
+
+                # statistics of another intensity channel or preview size are recalculated
+                fingerprints = [
+                    image_fingerprint(info.hash, labels, self.metrics, self._variant)
+                    for info, labels in zip(img_infos, target_labels)
+                ]
+                rows = self.index.lookup(img_ids)
+                state = self.store.take("fingerprint", rows, default=NO_FINGERPRINT)
+                changed, unchanged, restored = [], [], {}
+                for i, (ann, fingerprint, stored) in enumerate(zip(anns, fingerprints, state)):
+                    info = img_infos[i]
+                    if fingerprint == stored and self._tags_match(ann, rows[i], target_class, info):
+                        unchanged.append(img_ids[i])
+                        continue
+                    values = None
+                    if warm_start is not None and rows[i] < 0:
+                        values = warm_start.tag_values(ann, info.hash, fingerprint)
+                    if values is not None:
+                        restored[img_ids[i]] = self._restored_row(
+                            values, ann, fingerprint, target_class
+                        )
+                    else:
+                        changed.append(i)
+                if unchanged:
+                    logger.debug(
+                        f"Skipping {len(unchanged)} images in dataset {dataset.name}: "
+                        f"updated, but the content fingerprint did not change."
+                    )
+                if restored:
+                    logger.debug(
+                        f"Restored statistics of {len(restored)} images in dataset "
+                        f"{dataset.name} from their tags."
                     )
-                    img_ids = set()
-                    tag_ids = set()
-                    for tag_id, img_ids_set in img_tags_to_delete.items():
-                        img_ids.update(img_ids_set)
-                        tag_ids.add(tag_id)
-                    p = tqdm_sly(desc="Removing tags from entities", total=len(img_ids))
-                    self.api.advanced.remove_tags_from_images(
-                        list(tag_ids), list(img_ids), p.update
+                if not changed:
+                    yield StatsBatch(
+                        dataset, unchanged=unchanged, restored=restored, skipped=skipped
                     )
+                    continue
+                img_infos = [img_infos[i] for i in changed]
+                anns = [anns[i] for i in changed]
+                target_labels = [target_labels[i] for i in changed]
+                fingerprints = [fingerprints[i] for i in changed]
+
+                # images are downloaded in batches that fit the memory budget (see `BatchSizer`)
+                downloads = [self.needs_pixels and any(labels.values()) for labels in target_labels]
+                for n, idxs in enumerate(self.sizer.split(img_infos, downloads)):
+                    img_np = [None] * len(idxs)
+                    img_sizes = [None] * len(idxs)
+                    pixel_idxs = [j for j, i in enumerate(idxs) if downloads[i]]
+                    if pixel_idxs:
+                        infos = [img_infos[idxs[j]] for j in pixel_idxs]
+                        with self.profiler.stage(STAGE_DOWNLOAD, len(infos)):
+                            nps, sizes = self.pixels.download(dataset.id, infos)
+                        for j, img, size in zip(pixel_idxs, nps, sizes):
+                            img_np[j] = img
+                            img_sizes[j] = size
+                    # the images that are not recalculated are reported with the first batch
+                    first = n == 0
+                    yield StatsBatch(
+                        dataset,
+                        [img_infos[i] for i in idxs],
+                        img_np,
+                        [anns[i] for i in idxs],
+                        [target_labels[i] for i in idxs],
+                        fingerprints=[fingerprints[i] for i in idxs],
+                        img_sizes=img_sizes,
+                        unchanged=unchanged if first else [],
+                        restored=restored if first else {},
+                        skipped=skipped if first else 0,
+                    )
+            # images that were not listed by the feed are not changed
+            unchanged = max(dataset.images_count - listed, 0)
+            yield StatsBatch(dataset, skipped=unchanged, dataset_done=True, cursor=cursor)
 
-                last_updated_map[dataset.id] = datetime.now(timezone.utc).strftime(
-                    "%Y-%m-%dT%H:%M:%S.%fZ"
+    def _process_batch(
+        self,
+        batch: StatsBatch,
+        meta: ProjectMeta,
+        index: ImageIndex,
+        writer: TagWriter,
+        target_class: str,
+    ) -> np.ndarray:
+        """
+        Calculates statistics of all calculated classes for the downloaded batch, updates
+        the state and schedules the tag changes (of the target class) for upload.
+
+        :return: The "last update" time of the batch images, to be committed after upload.
+        """
+        now = now_us()
+        img_tags_to_upload = []
+        img_tags_to_update = []
+
+        with self.profiler.stage(STAGE_METRICS, len(batch.infos)):
+            batch_stats = self.pool.map(batch.imgs, batch.labels, self.metrics, batch.img_sizes)
+        if not self._preview_checked and any(batch.img_sizes):
+            self._preview_checked = True
+            self._report_preview_accuracy(batch, batch_stats)
+        rows = index.lookup([info.id for info in batch.infos])
+        new_ids, new_rows = [], []
+
+        items = zip(batch.anns, batch.infos, batch_stats, rows, batch.fingerprints)
+        for ann, info, class_stats, row, fingerprint in items:
+            exists = row >= 0
+            img_stats = class_stats[target_class]
+            if not ann.labels[target_class]:
+                self._unlabeled += 1
+            # inactive metrics are not calculated and stay NaN
+            values = {"fingerprint": fingerprint}
+
+            if self.warm_start:
+                # the content the values are calculated for (see `WarmStart`)
+                img_stats = {**img_stats, STATS_FINGERPRINT_TAG: None}
+            for key, value in img_stats.items():
+                if key == STATS_FINGERPRINT_TAG:
+                    value = fingerprint_tag_value(info.hash, fingerprint)
+                tag_meta_id = meta.get_tag_meta(key).sly_id
+                tag = ann.img_tags.get(key)
+                if tag is not None and tag.sly_id is not None:
+                    values[self._tag_column(key)] = tag.sly_id
+                if tag is None or tag.value is None:
+                    img_tags_to_upload.append(
+                        {
+                            "tagId": tag_meta_id,
+                            "entityId": info.id,
+                            "value": value,
+                        }
+                    )
+                elif tag.value != value:
+                    img_tags_to_update.append(TagUpdate(tag_meta_id, info.id, tag.sly_id, value))
+
+            for class_name, stats in class_stats.items():
+                class_id = self._class_ids[class_name]
+                values.update({self._column(k, class_id): v for k, v in stats.items()})
+            if not exists:
+                new_rows.append(self.store.append({"image_ids": info.id, **values}))
+                new_ids.append(info.id)
+            else:
+                self.store.update(int(row), values)
+        # rows are added to the index after they are written to the store
+        index.add(new_ids, new_rows)
+
+        # only the changed values are written, existing tags are updated in place
+        writer.update(img_tags_to_update)
+        writer.add(img_tags_to_upload)
+        return np.full(len(batch.infos), now, dtype=np.int64)
+
+    def _report_preview_accuracy(self, batch: StatsBatch, batch_stats: List[Dict]) -> None:
+        """
+        Compare the statistics calculated on the previews with the full resolution ones on
+        a sample of the batch images (downloaded once per task) and report the errors.
+        """
+        idxs = [i for i, size in enumerate(batch.img_sizes) if size is not None]
+        idxs = idxs[: self.preview_sample]
+        if not idxs:
+            return
+        metrics = [m for m in self.metrics if get_metric(m).needs_pixels]
+        infos = [batch.infos[i] for i in idxs]
+        originals = self.pixels.download_originals(batch.dataset.id, infos)
+        reference, approx = [], []
+        for i, img in zip(idxs, originals):
+            for class_name, labels in batch.labels[i].items():
+                stats = calculate_image_statistics(
+                    img, labels, metrics, tile_size=self.pool.tile_size
                 )
-        self.pbar.hide()
+                reference.append(stats)
+                approx.append({m: batch_stats[i][class_name][m] for m in metrics})
+        report = accuracy_report(reference, approx)
+        logger.info(
+            f"Preview accuracy (max side {self.pixels.max_side} px, {len(idxs)} images).",
+            extra={"report": report},
+        )
+        if report:
+            max_error = max(r["max_rel_error"] for r in report.values())
+            self.card.update_property("Preview max error", f"{max_error * 100:.1f}%")
 
-        if img_tags_to_upload:
-            logger.info(f"Uploading {len(img_tags_to_upload)} tags to images.")
-            self.api.image.tag.add_to_entities_json(
-                self.project_id, img_tags_to_upload, log_progress=True
-            )
+    def _restored_row(
+        self, values: Dict[str, float], ann: TargetAnnotation, fingerprint: int, target_class: str
+    ) -> Dict:
+        """
+        Store values of an image restored from its tags (see `WarmStart`): the metrics of the
+        target class, the fingerprint and the tag IDs, so the image is not recalculated
+        until it changes.
+        """
+        class_id = self._class_ids[target_class]
+        row = {self._column(k, class_id): v for k, v in values.items()}
+        row["fingerprint"] = fingerprint
+        for name in self._tag_names:
+            tag = ann.img_tags.get(name)
+            if tag is not None and tag.sly_id is not None:
+                row[self._tag_column(name)] = tag.sly_id
+        return row
 
-        if last_updated_map:
-            DataJson()[self.widget_id]["last_updates"] = last_updated_map
-            DataJson().send_changes()
-            logger.debug("Last updates state saved.")
+    def _apply_restored(self, restored: Dict[int, Dict], index: ImageIndex) -> None:
+        """Add the rows restored from the tags (see `_restored_row`) to the store."""
+        ids, rows = list(restored), []
+        for img_id in ids:
+            rows.append(self.store.append({"image_ids": img_id, **restored[img_id]}))
+        index.add(ids, rows)
 
-        if img_idx_map:
-            DataJson()[self.widget_id]["img_idx_map"] = img_idx_map
-            DataJson().send_changes()
-            logger.debug("Image index map saved.")
+    def _get_classes(self, meta: ProjectMeta, target_class: str) -> List[str]:
+        """Names of the classes to calculate: the configured classes and the target class."""
+        if meta.get_obj_class(target_class) is None:
+            raise ValueError(f"Class {target_class} is not found in the project meta.")
+        if "*" in self.classes:
+            classes = [obj_class.name for obj_class in meta.obj_classes]
+        else:
+            classes = [name for name in self.classes if meta.get_obj_class(name) is not None]
+        if target_class not in classes:
+            classes.append(target_class)
+        return classes
 
-    def _recently_updated(self, curr: str, state: Optional[str] = None) -> bool:
-        if state is None:
-            return True
-        curr_dt = datetime.strptime(curr, "%Y-%m-%dT%H:%M:%S.%fZ")
-        state_dt = datetime.strptime(state, "%Y-%m-%dT%H:%M:%S.%fZ")
-        return curr_dt > state_dt
+    def _reset_state(self) -> None:
+        """Forget the calculated statistics (e.g. when the calculated classes are changed)."""
+        logger.info("Calculated classes are changed, statistics will be recalculated.")
+        self.store.clear()
+        self.index = ImageIndex()
+        self._dataset_updates = {}
+        self.feed.reset()
 
-    def _calculate_image_statistics(
-        self, img: np.array, ann: Annotation, target_class: str
-    ) -> dict:
+    def _mark_stale(self, metrics: List[str]) -> None:
+        """
+        Recalculate all images on the next run when metrics are added: the values of the added
+        metrics are cleared and the "last updates" are forgotten, so every image is listed
+        again (its fingerprint includes the metrics, see `image_fingerprint`).
         """
-        Calculate statistics for a single image.
+        logger.info(f"Metrics {metrics} are added, statistics will be recalculated.")
+        size = len(self.index)
+        rows = np.arange(size)
+        for metric in metrics:
+            for class_id in self._class_ids.values():
+                name = self._column(metric, class_id)
+                if name in self.store.columns:
+                    self.store.update_many(name, rows, np.nan)
+        self.store.update_many("updated_at", rows, NEVER)
+        self._dataset_updates = {}
+        self.feed.reset()
 
-        :param img_info: The image information.
-        :param ann: The annotation for the image.
-        :param target_class: The class for which to calculate statistics.
-        :return: A dictionary containing the statistics for the image.
-        """
-        target_labels = [l for l in ann.labels if l.obj_class.name == target_class]
-        if not target_labels:
-            logger.warning(f"No labels found for class '{target_class}' in the image.")
-            return {
-                DefaultImgTags.NUMBER_OF_LABELS.value: 0,
-                DefaultImgTags.MAX_AREA.value: 0,
-                DefaultImgTags.TOTAL_AREA.value: 0,
-                DefaultImgTags.AVG_INTENSITY_DIFF.value: 0.0,
-                DefaultImgTags.MAX_INTENSITY_DIFF.value: 0.0,
-                DefaultImgTags.MIN_INTENSITY_DIFF.value: 0.0,
-            }
-
-        areas = np.array([label.geometry.area for label in target_labels])
-        intensity_diffs = np.array([self._calculate_intensity_diff(img, l) for l in target_labels])
+    def _resync_tags(self, meta: ProjectMeta, tags_class: Optional[str], target_class: str) -> None:
+        """
+        Rewrite the statistics tags of the already calculated images with the values of
+        the target class, when the tags hold the values of another class. Only the values
+        that differ are written, no images or annotations are downloaded. If the class of
+        the current tags is unknown, all values are written.
+        """
+        size = len(self.index)
+        image_ids = self.store.column("image_ids")[:size]
+        new_id = self._class_ids[target_class]
+        old_id = self._class_ids.get(tags_class)
+        updates = []
+        for metric in self.metrics:
+            new = self.store.column(self._column(metric, new_id))[:size]
+            old = np.full(size, np.nan)
+            if old_id is not None:
+                old = self.store.column(self._column(metric, old_id))[:size]
+            tag_ids = self.store.column(self._tag_column(metric))[:size]
+            tag_meta_id = meta.get_tag_meta(metric).sly_id
+            for i in np.flatnonzero(~np.isnan(new) & (new != old)):
+                # tags with a known ID are updated in place, the others are re-added
+                tag_id = int(tag_ids[i]) or None
+                updates.append(TagUpdate(tag_meta_id, int(image_ids[i]), tag_id, float(new[i])))
+        logger.info(
+            f"Switching statistics tags from class {tags_class} to {target_class}: "
+            f"{len(updates)} tag values to write."
+        )
+        if not updates:
+            return
+        writer = TagWriter(
+            self.api,
+            self.project_id,
+            max_buffer=self.tag_flush_size,
+            max_age=self.tag_flush_age,
+            depth=self.upload_queue_depth,
+            on_progress=self._update_tags_progress,
+            max_inplace=self.tag_inplace_limit,
+            on_added=self._on_tags_added,
+        )
+        try:
+            # submitted in chunks of the in-place limit, so the values are updated in place
+            step = max(writer.max_inplace, 1)
+            for start in range(0, len(updates), step):
+                writer.update(updates[start : start + step])
+        finally:
+            writer.join()
 
-        return {
-            DefaultImgTags.NUMBER_OF_LABELS.value: len(target_labels),
-            DefaultImgTags.MAX_AREA.value: np.max(areas) if areas.size > 0 else 0,
-            DefaultImgTags.TOTAL_AREA.value: np.sum(areas) if areas.size > 0 else 0,
-            DefaultImgTags.AVG_INTENSITY_DIFF.value: (
-                np.mean(intensity_diffs) if intensity_diffs.size > 0 else 0.0
-            ),
-            DefaultImgTags.MAX_INTENSITY_DIFF.value: (
-                np.max(intensity_diffs) if intensity_diffs.size > 0 else 0.0
-            ),
-            DefaultImgTags.MIN_INTENSITY_DIFF.value: (
-                np.min(intensity_diffs) if intensity_diffs.size > 0 else 0.0
-            ),
-        }
+    def _on_tags_added(self, tags: List[Dict], ids: List[int]) -> None:
+        """
+        Store the IDs of the uploaded statistics tags, so their values can be updated in place
+        (see `_resync_tags`). Called from the tag writer thread.
+        """
+        rows = self.index.lookup([tag["entityId"] for tag in tags])
+        by_column: Dict[str, Tuple[List[int], List[int]]] = {}
+        for tag, tag_id, row in zip(tags, ids, rows):
+            column = self._tag_columns.get(tag["tagId"])
+            if column is not None and row >= 0:
+                col_rows, col_ids = by_column.setdefault(column, ([], []))
+                col_rows.append(int(row))
+                col_ids.append(tag_id)
+        for column, (col_rows, col_ids) in by_column.items():
+            self.store.update_many(column, np.array(col_rows), np.array(col_ids, dtype=np.int64))
 
-    def _calculate_intensity_diff(self, img: np.array, label: Label) -> float:
+    def _clear_stats_class(self, project_info: ProjectInfo) -> None:
         """
-        Computes intensity difference between mask and its 1-pixel outer border (neighbors).
+        The statistics tags can be trusted only if they were calculated for the target class
+        and intensity channel. They are stored in the project custom data when the calculation
+        is finished and removed while tags of another class or channel are being written.
         """
-        mask = np.full(img.shape[:2], fill_value=False)
-        label.draw(mask, color=True, thickness=0)
+        custom_data = project_info.custom_data or {}
+        keys = (STATS_CLASS_KEY, STATS_CHANNEL_KEY)
+        if any(key in custom_data for key in keys):
+            custom_data = {k: v for k, v in custom_data.items() if k not in keys}
+            self.api.project.update_custom_data(self.project_id, custom_data)
 
-        if not np.any(mask):
-            return 0.0
+    def _set_stats_class(self, target_class: str) -> None:
+        """
+        Stamp the class and the intensity channel of the statistics tags after a complete run.
+        All stored values are calculated with the current settings: a checkpoint of other
+        settings is not restored (see `_restore_checkpoint`).
+        """
+        custom_data = self.api.project.get_custom_data(self.project_id)
+        channel = self.pixels.channel
+        if (
+            custom_data.get(STATS_CLASS_KEY) != target_class
+            or custom_data.get(STATS_CHANNEL_KEY, CHANNEL_ALL) != channel
+        ):
+            custom_data[STATS_CLASS_KEY] = target_class
+            custom_data[STATS_CHANNEL_KEY] = channel
+            self.api.project.update_custom_data(self.project_id, custom_data)
 
-        # Get the outer border of the mask
-        kernel = np.ones((3, 3), np.uint8)
-        outer_border = cv2.dilate(mask.astype(np.uint8), kernel, iterations=1) - mask.astype(
-            np.uint8
-        )
-        # Calculate the average intensity in the mask and its outer border
-        if img.ndim == 3:
-            mask_intensity = np.mean(img[mask]) if np.any(mask) else 0.0
-            border_intensity = np.mean(img[outer_border > 0]) if np.any(outer_border) else 0.0
+    def _tags_match(
+        self, ann: TargetAnnotation, row: int, target_class: str, info: ImageInfo
+    ) -> bool:
+        """
+        Check that the tags of the image hold the values stored for the row, i.e. the
+        statistics tags were not removed or edited since they were uploaded.
+        """
+        if row < 0:
+            return False
+        class_id = self._class_ids[target_class]
+        for key in self.metrics:
+            tag = ann.img_tags.get(key)
+            if tag is None or tag.value != self.store.take(self._column(key, class_id), [row])[0]:
+                return False
+        if self.warm_start:
+            tag = ann.img_tags.get(STATS_FINGERPRINT_TAG)
+            fingerprint = int(self.store.take("fingerprint", [row])[0])
+            if tag is None or tag.value != fingerprint_tag_value(info.hash, fingerprint):
+                return False
+        return True
+
+    def _commit_updates(self, payload: Tuple) -> None:
+        """Applies the committed "last updates". Called from the tag writer thread."""
+        kind, key, updated_at = payload
+        if kind == "dataset":
+            self._dataset_updates[key] = updated_at
+        elif kind == "cursor":
+            self.feed.advance(key, updated_at)
         else:
-            mask_intensity = img[mask].mean() if np.any(mask) else 0.0
-            border_intensity = img[outer_border > 0].mean() if np.any(outer_border) else 0.0
+            self.store.update_many("updated_at", self.index.lookup(key), updated_at)
 
-        return abs(mask_intensity - border_intensity)
+    @property
+    def _settings(self) -> Dict:
+        """Settings the statistics values depend on, besides the classes and the metrics."""
+        return {
+            "channel": self.pixels.channel,
+            "max_side": self.pixels.max_side,
+            "quality": self.pixels.quality,
+        }
+
+    @property
+    def _variant(self) -> str:
+        """The non-default `_settings` for the fingerprint (see `image_fingerprint`)."""
+        parts = []
+        if self.pixels.channel != CHANNEL_ALL:
+            parts.append(self.pixels.channel)
+        if self.pixels.max_side > 0:
+            parts.append(f"preview {self.pixels.max_side}px q{self.pixels.quality}")
+        return "|".join(parts)
+
+    def _get_checkpoint_state(self) -> Dict:
+        # the store is saved up to the index size: rows are appended to the store before they
+        # are added to the index, so the snapshot is consistent. The index itself is rebuilt
+        # from the "image_ids" column on restore.
+        return {
+            "rows": len(self.index),
+            "datasets": list(self._dataset_updates.items()),
+            "cursors": list(self.feed.cursors.items()),
+        }
+
+    def _restore_checkpoint(self, class_ids: List[int]) -> None:
+        """Restore the state committed by the previous (interrupted) run of the task."""
+        data = DataJson()[self.widget_id]
+        # bulk state is not stored in DataJson anymore (left by previous app versions)
+        for key in DefaultImgTags.values() + ["image_ids", "last_updates", "img_idx_map"]:
+            data.pop(key, None)
+        checkpoint = self.checkpoint.load()
+        if checkpoint is not None:
+            # the values depend on the settings, the restored "last updates" would skip the images
+            current = {"classes": class_ids, "metrics": self.metrics, "settings": self._settings}
+            changed = [key for key, value in current.items() if checkpoint.get(key) != value]
+            if changed:
+                logger.info(
+                    f"Statistics checkpoint was calculated with other {', '.join(changed)}, "
+                    f"ignoring it."
+                )
+                checkpoint = None
+        if checkpoint is None or not self.store.load(self.checkpoint.store_path):
+            return
+        self._dataset_updates = {int(k): int(v) for k, v in checkpoint.get("datasets", [])}
+        self.feed.reset()
+        for dataset_id, cursor in checkpoint.get("cursors", []):
+            self.feed.advance(int(dataset_id), int(cursor))
+        self.index = ImageIndex(self.store.column("image_ids"))
+        self.sync.set("summary", self.store.summary())
+        self.sync.flush(force=True)
+        logger.info(
+            f"Statistics restored from checkpoint: {len(self.index)} images, "
+            f"resuming from the last committed batch."
+        )
+
+    def _update_tags_progress(self, flushed: int, pending: int) -> None:
+        if not self._progress_throttle.ready(force=pending == 0):
+            return
+        self.card.update_property("Tags uploaded", str(flushed))
+        self.card.update_property("Tags pending", str(pending))
+
+    def _update_pixel_stats(self, force: bool = False) -> None:
+        if not self._pixels_throttle.ready(force=force):
+            return
+        if self.pixels.deduplicated > 0:
+            self.card.update_property("Duplicate images", str(self.pixels.deduplicated))
+        if self.pixels.recent_hits > 0:
+            self.card.update_property("Recent image hits", str(self.pixels.recent_hits))
+        if self.cache is not None:
+            hits, misses = self.cache.hits, self.cache.misses
+            self.card.update_property("Image cache hits", f"{hits} / {hits + misses}")
+            self.sync.set("cache", self.cache.summary())
+
+    def _report_memory(self) -> None:
+        summary = self.sizer.summary()
+        logger.info(
+            f"Statistics run peak memory: {summary['peak_rss_mb']} MB.", extra={"memory": summary}
+        )
+        self.card.update_property("Peak memory", f"{summary['peak_rss_mb']:.0f} MB")
+        self.sync.set("memory", summary)
+
+    def _report_profile(self) -> None:
+        """Log the per-stage profile of the run and show the slowest stages on the card."""
+        profile = self.profiler.summary()
+        slowest = [
+            f"{name.replace('_', ' ')} {profile['stages'][name]['share'] * 100:.0f}%"
+            for name in self.profiler.slowest()
+        ]
+        logger.info(
+            f"Statistics run took {profile['wall_s']:.1f} s, slowest stages: {', '.join(slowest)}.",
+            extra={"profile": profile},
+        )
+        self.card.update_property("Last run", f"{profile['wall_s']:.1f} s")
+        if slowest:
+            self.card.update_property("Slowest stages", ", ".join(slowest))
+        self.sync.set("profile", profile)
+
+    @property
+    def _tag_names(self) -> List[str]:
+        """Names of the tags written by the node: the metrics and the fingerprint tag."""
+        return self.metrics + ([STATS_FINGERPRINT_TAG] if self.warm_start else [])
 
     def _validate_project_meta(self) -> ProjectMeta:
         """
@@ -418,12 +1033,16 @@ class Statictics(BaseActionElement):
         """
         meta = ProjectMeta.from_json(self.api.project.get_meta(self.project_id))
         need_updated = False
-        for tag_name in DefaultImgTags.values():
+        for tag_name in self._tag_names:
             tag_name = str(tag_name)
             if not meta.tag_metas.has_key(tag_name):
+                if tag_name == STATS_FINGERPRINT_TAG:
+                    value_type = TagValueType.ANY_STRING
+                else:
+                    value_type = get_metric(tag_name).tag_type
                 tag_meta = TagMeta(
                     tag_name,
-                    TagValueType.ANY_NUMBER,
+                    value_type,
                     applicable_to=TagApplicableTo.IMAGES_ONLY,
                 )
                 meta = meta.add_tag_meta(tag_meta)
@@ -1,9 +1,11 @@
 import src.nodes as n
 import src.sly_globals as g
 import supervisely as sly
+from src.stats.metrics import DefaultImgTags
 
 app = sly.Application(layout=n.layout)
 app.call_before_shutdown(n.stats_node.automation.scheduler.shutdown)  # ? check this
+app.call_before_shutdown(n.stats_node.pool.shutdown)
 
 
 # * Class Selector Node: allows user to select a class for filtering
@@ -48,6 +50,19 @@ def _on_run_node_click():
     n.run_node.show_is_finished_badge()
 
 
+# * Filters Node: with STATS_METRICS=auto only the metrics used by the filters are calculated
+def _set_filter_metrics(filters) -> bool:
+    metrics = n.filters_node.required_metrics(filters or {})
+    metrics = metrics or [DefaultImgTags.NUMBER_OF_LABELS.value]
+    return n.stats_node.set_metrics(metrics)
+
+
+@n.filters_node.on_filters_saved
+def on_filters_saved(filters):
+    if g.STATS_METRICS_AUTO and _set_filter_metrics(filters) and n.stats_node.selected_class:
+        n.stats_node.run_in_background()
+
+
 @n.stats_node.on_stats_calculated
 def on_stats_calculated():
     n.run_node.card.enable()
@@ -68,6 +83,8 @@ def on_accept_node_run_click():
 sly.app.restore_data_state(g.task_id)
 
 # * Some restoration logic (!AFTER restore_data_state)
+if g.STATS_METRICS_AUTO:
+    _set_filter_metrics(n.filters_node.filters)
 if n.class_selector.selected_class:
     n.class_selector.hide_warning_badge()
     n.check_every_node.show_automation_details()
@@ -32,6 +32,29 @@ stats_node = Statictics(
     y=BASE_Y + 320,
     project_id=g.project.id,
     dataset_id=g.dataset_id,
+    workers=g.STATS_WORKERS,
+    prefetch_depth=g.STATS_PREFETCH_DEPTH,
+    upload_queue_depth=g.STATS_UPLOAD_QUEUE_DEPTH,
+    tag_flush_size=g.STATS_TAG_FLUSH_SIZE,
+    tag_flush_age=g.STATS_TAG_FLUSH_AGE,
+    tag_inplace_limit=g.STATS_TAG_INPLACE_LIMIT,
+    metrics=g.STATS_METRICS,
+    checkpoint_dir=g.STATS_CHECKPOINT_DIR,
+    store_mmap_dir=g.STATS_STORE_DIR,
+    sync_interval=g.STATS_SYNC_INTERVAL,
+    warm_start=g.STATS_WARM_START,
+    classes=g.STATS_CLASSES,
+    preview_max_side=g.STATS_PREVIEW_MAX_SIDE,
+    preview_quality=g.STATS_PREVIEW_QUALITY,
+    preview_sample=g.STATS_PREVIEW_SAMPLE,
+    cache_dir=g.STATS_CACHE_DIR,
+    cache_size_mb=g.STATS_CACHE_SIZE_MB,
+    dedup_memory_mb=g.STATS_DEDUP_MEMORY_MB,
+    intensity_channel=g.STATS_INTENSITY_CHANNEL,
+    memory_budget_mb=g.STATS_MEMORY_BUDGET_MB,
+    max_batch_size=g.STATS_MAX_BATCH_SIZE,
+    listing_page_size=g.STATS_LISTING_PAGE_SIZE,
+    tile_size=g.STATS_TILE_SIZE,
 )
 
 filters_node = CustomFilters(x=BASE_X, y=BASE_Y + 420)
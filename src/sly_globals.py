@@ -21,3 +21,54 @@ AUTOMATION_INTERVAL = 60  # Default automation interval in seconds
 project = api.project.get_info_by_id(project_id)
 custom_data = project.custom_data
 collection_id = None
+
+# * Statistics engine settings
+STATS_WORKERS = int(os.getenv("STATS_WORKERS", 1))  # Number of processes for statistics calculation
+STATS_PREFETCH_DEPTH = int(os.getenv("STATS_PREFETCH_DEPTH", 2))  # Batches downloaded ahead
+STATS_UPLOAD_QUEUE_DEPTH = int(os.getenv("STATS_UPLOAD_QUEUE_DEPTH", 4))  # Pending tag uploads
+# Comma-separated metrics to calculate (tag names, e.g. "_labels,_max_area"). The default metrics
+# by default, additional ones: "_total_perimeter", "_min_compactness", "_avg_contrast_std".
+# "auto" calculates only the metrics used by the saved filters and sorting.
+# Image pixels are downloaded only if an intensity metric is enabled.
+STATS_METRICS = [m.strip() for m in os.getenv("STATS_METRICS", "").split(",") if m.strip()]
+STATS_METRICS_AUTO = STATS_METRICS == ["auto"]
+if STATS_METRICS_AUTO:
+    STATS_METRICS = []
+STATS_TAG_FLUSH_SIZE = int(os.getenv("STATS_TAG_FLUSH_SIZE", 1000))  # Tags per upload request
+STATS_TAG_FLUSH_AGE = float(os.getenv("STATS_TAG_FLUSH_AGE", 10))  # Max seconds tags wait in buffer
+# Directory for the statistics checkpoint (allows to resume after the task restart)
+STATS_CHECKPOINT_DIR = os.path.join(sly.app.get_data_dir(), "checkpoints")
+# Keep statistics columns in memory-mapped files instead of RAM (for very large projects)
+STATS_STORE_MMAP = os.getenv("STATS_STORE_MMAP", "false").lower() in ("1", "true", "yes")
+STATS_STORE_DIR = os.path.join(sly.app.get_data_dir(), "stats_store") if STATS_STORE_MMAP else None
+STATS_SYNC_INTERVAL = float(os.getenv("STATS_SYNC_INTERVAL", 2))  # Min seconds between UI updates
+# Restore statistics of new images from their up-to-date tag values instead of recalculating them
+STATS_WARM_START = os.getenv("STATS_WARM_START", "false").lower() in ("1", "true", "yes")
+# Changed tag values per batch updated in place (one request each); above it tags are re-added
+STATS_TAG_INPLACE_LIMIT = int(os.getenv("STATS_TAG_INPLACE_LIMIT", 100))
+# Comma-separated classes whose statistics are calculated in the same pass as the selected
+# class ("*" for all classes), switching to any of them does not require recalculation
+STATS_CLASSES = [c.strip() for c in os.getenv("STATS_CLASSES", "").split(",") if c.strip()]
+# Download server-side resized previews (longest side in px) for the intensity metrics instead of
+# the originals, 0 for full resolution. Accuracy on a sample is reported on the first batch.
+STATS_PREVIEW_MAX_SIDE = int(os.getenv("STATS_PREVIEW_MAX_SIDE", 0))
+STATS_PREVIEW_QUALITY = int(os.getenv("STATS_PREVIEW_QUALITY", 95))  # JPEG quality of previews
+STATS_PREVIEW_SAMPLE = int(os.getenv("STATS_PREVIEW_SAMPLE", 10))  # Images in the accuracy report
+# Max size (MB) of the on-disk LRU cache of decoded images (by image hash), 0 to disable
+STATS_CACHE_SIZE_MB = int(os.getenv("STATS_CACHE_SIZE_MB", 0))
+STATS_CACHE_DIR = os.path.join(sly.app.get_data_dir(), "image_cache")
+# Recently downloaded images kept in memory to share them with identical images (same hash)
+STATS_DEDUP_MEMORY_MB = int(os.getenv("STATS_DEDUP_MEMORY_MB", 256))
+# Image plane of the intensity metrics: "all" (mean of the RGB channels), "luma" (BT.601 luminance),
+# "red", "green" or "blue". Single planes are decoded directly and take 3x less memory.
+STATS_INTENSITY_CHANNEL = os.getenv("STATS_INTENSITY_CHANNEL", "all").strip().lower()
+# Memory for the decoded images: the batches in flight and STATS_DEDUP_MEMORY_MB. Batches are
+# sized from the image resolution to fit it (0 for no limit). Peak memory is reported after a run.
+STATS_MEMORY_BUDGET_MB = int(os.getenv("STATS_MEMORY_BUDGET_MB", 0))
+# Max images per batch, 0 for the default: 50, or 500 with a memory budget (batches are sized to it)
+STATS_MAX_BATCH_SIZE = int(os.getenv("STATS_MAX_BATCH_SIZE", 0))
+# Images per listing request of the updated images (split into batches of STATS_MAX_BATCH_SIZE)
+STATS_LISTING_PAGE_SIZE = int(os.getenv("STATS_LISTING_PAGE_SIZE", 500))
+# Labels larger than a tile of this size (px) are processed tile by tile with memory bounded by
+# the tile size (same values) and larger images are spilled to disk, 0 to keep them in memory
+STATS_TILE_SIZE = int(os.getenv("STATS_TILE_SIZE", 0))
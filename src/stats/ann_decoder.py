@@ -0,0 +1,93 @@
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional
+
+from supervisely.annotation.annotation import AnnotationJsonFields
+from supervisely.annotation.json_geometries_map import GET_GEOMETRY_FROM_STR
+from supervisely.annotation.label import Label, LabelJsonFields
+from supervisely.annotation.obj_class import ObjClass
+from supervisely.annotation.tag import TagJsonFields
+from supervisely.geometry.any_geometry import AnyGeometry
+from supervisely.geometry.constants import CLASS_ID, GEOMETRY_SHAPE, GEOMETRY_TYPE
+from supervisely.project.project_meta import ProjectMeta
+
+
+class ImageTag(NamedTuple):
+    """
+    An image tag read from the annotation JSON.
+
+    :param sly_id: ID of the tag instance (None if not returned by the server).
+    :param value: The tag value.
+    """
+
+    sly_id: Optional[int]
+    value: Any
+
+
+class TargetAnnotation(NamedTuple):
+    """
+    The part of an image annotation needed for the statistics.
+
+    :param labels: Labels of each target class, by class name (empty lists for absent classes).
+    :param img_tags: Image tags of the metrics by tag name.
+    """
+
+    labels: Dict[str, List[Label]]
+    img_tags: Dict[str, ImageTag]
+
+
+class TargetAnnotationDecoder:
+    """
+    Decodes only the labels of the target classes and the metric tags of the annotation JSON,
+    instead of building every label, tag and geometry with `Annotation.from_json`.
+    Objects of other classes are skipped by their class id (or title), the tags of the
+    labels are not decoded.
+
+    :param meta: The project meta.
+    :param target_classes: Names of the target classes.
+    :param tag_names: Names of the image tags to read (e.g. the metrics).
+    """
+
+    def __init__(self, meta: ProjectMeta, target_classes: List[str], tag_names: Iterable[str]):
+        self.target_classes = list(target_classes)
+        self._by_id: Dict[int, ObjClass] = {}
+        self._by_name: Dict[str, ObjClass] = {}
+        for name in self.target_classes:
+            obj_class = meta.get_obj_class(name)
+            if obj_class is None:
+                continue
+            self._by_name[name] = obj_class
+            if obj_class.sly_id is not None:
+                self._by_id[obj_class.sly_id] = obj_class
+        self.tag_names = set(tag_names)
+
+    def _get_class(self, data: Dict) -> Optional[ObjClass]:
+        class_id = data.get(CLASS_ID)
+        if class_id is not None and self._by_id:
+            return self._by_id.get(class_id)
+        return self._by_name.get(data.get(LabelJsonFields.OBJ_CLASS_NAME))
+
+    def _decode_label(self, data: Dict, obj_class: ObjClass) -> Label:
+        geometry_type = obj_class.geometry_type
+        if geometry_type is AnyGeometry:
+            geometry_type = GET_GEOMETRY_FROM_STR(data.get(GEOMETRY_TYPE) or data[GEOMETRY_SHAPE])
+        return Label(
+            geometry_type.from_json(data),
+            obj_class,
+            sly_id=data.get(LabelJsonFields.ID),
+        )
+
+    def decode(self, data: Dict) -> TargetAnnotation:
+        """
+        Decode the annotation JSON (as returned by `api.annotation.download_json_batch`).
+        """
+        labels = {name: [] for name in self.target_classes}
+        if self._by_name:
+            for obj in data.get(AnnotationJsonFields.LABELS, []):
+                obj_class = self._get_class(obj)
+                if obj_class is not None:
+                    labels[obj_class.name].append(self._decode_label(obj, obj_class))
+        img_tags = {}
+        for tag in data.get(AnnotationJsonFields.IMG_TAGS, []):
+            name = tag.get(TagJsonFields.TAG_NAME)
+            if name in self.tag_names:
+                img_tags[name] = ImageTag(tag.get(TagJsonFields.ID), tag.get(TagJsonFields.VALUE))
+        return TargetAnnotation(labels, img_tags)
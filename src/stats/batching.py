@@ -0,0 +1,158 @@
+import os
+import resource
+import threading
+from typing import Dict, List, Optional
+
+from src.stats.pixels import preview_size
+from supervisely.api.image_api import ImageInfo
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def current_rss() -> int:
+    """Resident memory of the current process in bytes."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        # the peak of the process lifetime is the best estimate without procfs
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class BatchSizer:
+    """
+    Splits the images into download batches that fit a memory budget.
+
+    The memory of a batch is estimated from `ImageInfo.width/height` (the preview size if
+    previews are downloaded) and the number of decoded channels. The budget is shared by all
+    batches in flight: the prefetched ones, the one being calculated and the one being downloaded.
+    Batches of small images grow up to `max_images`, so thumbnails are downloaded with few
+    requests, while very large images are downloaded one by one.
+
+    Originals larger than a tile are spilled to disk (see `PixelSource`), only about a tile of
+    such an image is resident at a time, so it counts as a tile.
+
+    Memory held outside the batches that grows during the run (e.g. the recently downloaded
+    images kept for deduplication, see `PixelSource`) is `reserved` from the budget, so the
+    batches share only the rest of it.
+
+    The estimate does not cover copies (e.g. the shared memory of the workers) and decoder
+    buffers, so the sizer adapts: after each batch the resident memory of the process above
+    its level at the start of the run is compared with the budget, and the batches shrink when
+    it is exceeded and grow back when there is room. The peak resident memory of the run is
+    reported by `summary`.
+
+    :param budget_mb: Memory budget of the decoded images in MB, 0 for no limit.
+    :param in_flight: Number of batches held in memory at once.
+    :param max_images: Max number of images in a batch.
+    :param channels: Number of channels of the decoded images.
+    :param max_side: Max side of the downloaded previews, 0 for originals (see `PixelSource`).
+    :param reserved_mb: Part of the budget held outside the batches, in MB.
+    :param tile_size: Originals with more pixels than a tile of this size are spilled to disk.
+    """
+
+    MIN_SCALE = 1 / 16
+    MAX_SCALE = 4.0
+
+    def __init__(
+        self,
+        budget_mb: int = 0,
+        in_flight: int = 4,
+        max_images: int = 500,
+        channels: int = 3,
+        max_side: int = 0,
+        reserved_mb: int = 0,
+        tile_size: int = 0,
+    ):
+        self.budget = max(int(budget_mb), 0) * 1024 * 1024
+        self.reserved = min(max(int(reserved_mb), 0) * 1024 * 1024, self.budget)
+        self.in_flight = max(int(in_flight), 1)
+        self.max_images = max(int(max_images), 1)
+        self.channels = channels
+        self.max_side = max_side
+        self.tile_size = max(int(tile_size or 0), 0)
+        self.scale = 1.0
+        self._lock = threading.Lock()
+        self._baseline = 0
+        self._peak = 0
+        self._batches = 0
+        self._largest = 0
+
+    @property
+    def batch_bytes(self) -> int:
+        """Current target size of a batch in bytes."""
+        return int((self.budget - self.reserved) / self.in_flight * self.scale)
+
+    def image_bytes(self, info: ImageInfo) -> int:
+        """Estimated size of the decoded image."""
+        height, width = preview_size(info.width or 0, info.height or 0, self.max_side)
+        pixels = height * width
+        if self.tile_size > 0 and (height, width) == (info.height, info.width):
+            pixels = min(pixels, self.tile_size * self.tile_size)
+        return pixels * self.channels
+
+    def split(
+        self, infos: List[ImageInfo], needs_pixels: Optional[List[bool]] = None
+    ) -> List[List[int]]:
+        """
+        Split the images into consecutive batches that fit the current batch size.
+
+        :param infos: The images.
+        :param needs_pixels: For each image, whether it is downloaded (all by default).
+            Images that are not downloaded only count against `max_images`.
+        :return: Indices of the images of each batch.
+        """
+        if needs_pixels is None:
+            needs_pixels = [True] * len(infos)
+        limit = self.batch_bytes if self.budget > 0 else 0
+        batches, batch, size = [], [], 0
+        for i, (info, pixels) in enumerate(zip(infos, needs_pixels)):
+            nbytes = self.image_bytes(info) if pixels else 0
+            full = len(batch) >= self.max_images or (limit and size + nbytes > limit)
+            if batch and full:
+                batches.append(batch)
+                batch, size = [], 0
+            batch.append(i)
+            size += nbytes
+        if batch:
+            batches.append(batch)
+        with self._lock:
+            self._batches += len(batches)
+            self._largest = max([self._largest] + [len(b) for b in batches])
+        return batches
+
+    def start(self) -> None:
+        """Start a new run: resets the peak and takes the current memory as the baseline."""
+        with self._lock:
+            self._baseline = self._peak = current_rss()
+            self._batches = self._largest = 0
+
+    def observe(self) -> int:
+        """
+        Sample the resident memory after a batch and adapt the batch size to it.
+
+        :return: The resident memory in bytes.
+        """
+        rss = current_rss()
+        with self._lock:
+            self._peak = max(self._peak, rss)
+            if self.budget > 0:
+                used = rss - self._baseline
+                if used > self.budget:
+                    self.scale = max(self.scale / 2, self.MIN_SCALE)
+                elif used < self.budget * 0.5:
+                    self.scale = min(self.scale * 1.25, self.MAX_SCALE)
+        return rss
+
+    def summary(self) -> Dict:
+        """Peak resident memory of the run and the batch sizes."""
+        with self._lock:
+            return {
+                "peak_rss_mb": round(self._peak / 1024 / 1024, 1),
+                "baseline_rss_mb": round(self._baseline / 1024 / 1024, 1),
+                "budget_mb": self.budget // 1024 // 1024,
+                "reserved_mb": self.reserved // 1024 // 1024,
+                "batch_mb": round(self.batch_bytes / 1024 / 1024, 1),
+                "batches": self._batches,
+                "largest_batch": self._largest,
+            }
@@ -0,0 +1,226 @@
+import hashlib
+import os
+import queue
+import tempfile
+import threading
+import weakref
+from collections import OrderedDict
+from typing import Dict, Optional
+
+import numpy as np
+
+from supervisely.sly_logger import logger
+
+
+class ImageCache:
+    """
+    On-disk LRU cache of decoded images, addressed by the image content (`ImageInfo.hash`).
+
+    Entries are stored as `.npy` files and returned memory-mapped, so a hit skips both the
+    download and the decode. The total size of the entries is capped by `max_bytes`, the
+    least recently used entries are evicted first. Recency survives restarts: it is kept
+    in the modification time of the files.
+
+    `put_async` writes the entries in a background thread, so the download path does not wait
+    for the disk. It blocks only if the writer falls behind by `write_queue` images.
+
+    :param cache_dir: Directory for the entries (created if missing).
+    :param max_bytes: Max total size of the entries in bytes.
+    :param write_queue: Max number of images waiting to be written by `put_async`.
+    """
+
+    SUFFIX = ".npy"
+
+    def __init__(self, cache_dir: str, max_bytes: int, write_queue: int = 8):
+        self.cache_dir = cache_dir
+        self.max_bytes = max(int(max_bytes), 0)
+        self.hits = 0
+        self.misses = 0
+        self._writes = queue.Queue(maxsize=max(int(write_queue), 1))
+        self._writer: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._size = 0
+        os.makedirs(cache_dir, exist_ok=True)
+        self._scan()
+
+    def _scan(self) -> None:
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if not name.endswith(self.SUFFIX):
+                if name.endswith(".tmp"):
+                    os.remove(path)  # left by an interrupted write
+                continue
+            stat = os.stat(path)
+            entries.append((stat.st_mtime, name[: -len(self.SUFFIX)], stat.st_size))
+        for _, key, size in sorted(entries):
+            self._entries[key] = size
+            self._size += size
+        self._evict()
+
+    @staticmethod
+    def key(image_hash: str, variant: str = "") -> str:
+        """
+        Cache key of the image content.
+
+        :param image_hash: Hash of the image (ImageInfo.hash).
+        :param variant: Distinguishes the decoded forms of the same image (e.g. preview size).
+        """
+        return hashlib.blake2b(f"{image_hash}|{variant}".encode(), digest_size=16).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key + self.SUFFIX)
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        """Returns the read-only memory-mapped image or None if it is not cached."""
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        path = self._path(key)
+        try:
+            os.utime(path)
+            return np.load(path, mmap_mode="r")
+        except (OSError, ValueError) as e:
+            logger.warning(f"Failed to read cached image {path}: {e}")
+            self._remove(key)
+            return None
+
+    def put(self, key: str, img: np.ndarray) -> None:
+        """Store the image, evicting the least recently used entries if needed."""
+        if img.nbytes > self.max_bytes:
+            return
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                np.save(f, np.ascontiguousarray(img))
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Failed to cache image {path}: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        size = os.path.getsize(path)
+        with self._lock:
+            self._size += size - self._entries.pop(key, 0)
+            self._entries[key] = size
+            self._evict()
+
+    def put_async(self, key: str, img: np.ndarray) -> None:
+        """Schedule `put` in the background writer thread."""
+        if img.nbytes > self.max_bytes:
+            return
+        with self._lock:
+            if self._writer is None:
+                self._writer = threading.Thread(
+                    target=self._write_loop, name="image-cache-writer", daemon=True
+                )
+                self._writer.start()
+        self._writes.put((key, img))
+
+    def flush(self) -> None:
+        """Wait until the scheduled images are written."""
+        if self._writer is not None:
+            self._writes.join()
+
+    def _write_loop(self) -> None:
+        while True:
+            key, img = self._writes.get()
+            try:
+                self.put(key, img)
+            except Exception as e:  # pylint: disable=broad-except
+                logger.warning(f"Failed to cache image: {e}")
+            finally:
+                self._writes.task_done()
+
+    def _evict(self) -> None:
+        while self._size > self.max_bytes and self._entries:
+            key, size = self._entries.popitem(last=False)
+            self._size -= size
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def _remove(self, key: str) -> None:
+        with self._lock:
+            self._size -= self._entries.pop(key, 0)
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def summary(self) -> Dict:
+        """Hit/miss counters and the size of the cache."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(self._entries),
+            "bytes": self._size,
+        }
+
+
+class MemoryCache:
+    """
+    In-memory LRU of decoded images capped by their total size.
+
+    :param max_bytes: Max total size of the images in bytes.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max(int(max_bytes), 0)
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._size = 0
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        with self._lock:
+            img = self._entries.get(key)
+            if img is not None:
+                self._entries.move_to_end(key)
+            return img
+
+    def put(self, key: str, img: np.ndarray) -> None:
+        if img.nbytes > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= old.nbytes
+            self._entries[key] = img
+            self._size += img.nbytes
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= evicted.nbytes
+
+
+class SpilledImage(np.memmap):
+    """
+    A decoded image kept in a temporary `.npy` file instead of memory (see `spill_image`).
+    Worker processes open the file by its path, so the image is not copied into shared memory.
+    The file is removed when the image is garbage collected.
+    """
+
+
+def spill_image(img: np.ndarray) -> SpilledImage:
+    """
+    Write the image to a temporary `.npy` file and return it memory-mapped. The pages are read
+    from the file on access, so only the parts of the image in use (e.g. the tiles of a large
+    label) stay in memory.
+    """
+    with tempfile.NamedTemporaryFile(prefix="stats-image-", suffix=".npy", delete=False) as f:
+        path = f.name
+    try:
+        mmap = np.lib.format.open_memmap(path, mode="w+", dtype=img.dtype, shape=img.shape)
+        mmap[...] = img
+        mmap.flush()
+    except Exception:
+        os.remove(path)
+        raise
+    spilled = mmap.view(SpilledImage)
+    weakref.finalize(spilled, os.remove, path)
+    return spilled
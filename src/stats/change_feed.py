@@ -0,0 +1,79 @@
+from typing import Dict, Iterator, List, Optional
+
+from src.stats.timestamps import NEVER, format_timestamp
+from supervisely.api.api import Api
+from supervisely.api.dataset_api import DatasetInfo
+from supervisely.api.image_api import ImageInfo
+from supervisely.api.module_api import ApiField
+
+
+class ChangeFeed:
+    """
+    Incremental feed of updated images.
+
+    For every dataset the feed keeps a cursor: the high-water mark of `updated_at` of the images
+    that were already processed. Only images updated at or after the cursor are requested,
+    using the server-side filter by `updatedAt`, so an idle project costs a few requests per tick
+    instead of listing every image. Images with the same timestamp as the cursor are listed
+    again, they must be deduplicated by the caller (e.g. by their own "last update" state).
+
+    The feed uses only `api.dataset` and `api.image.get_list_generator`, so it can be tested
+    against any local stand-in of the API.
+
+    :param api: Supervisely API.
+    :param project_id: The project ID.
+    :param dataset_id: If set, only this dataset is watched.
+    :param page_size: Number of images requested per page.
+    """
+
+    def __init__(
+        self,
+        api: Api,
+        project_id: int,
+        dataset_id: Optional[int] = None,
+        page_size: int = 500,
+    ):
+        self.api = api
+        self.project_id = project_id
+        self.dataset_id = dataset_id
+        self.page_size = page_size
+        self.cursors: Dict[int, int] = {}
+
+    def list_datasets(self) -> List[DatasetInfo]:
+        """Returns the watched datasets (one request)."""
+        if self.dataset_id is not None:
+            dataset = self.api.dataset.get_info_by_id(self.dataset_id)
+            if dataset.project_id != self.project_id:
+                raise ValueError(
+                    f"Dataset {self.dataset_id} does not belong to project {self.project_id}."
+                )
+            return [dataset]
+        return self.api.dataset.get_list(self.project_id, recursive=True)
+
+    def iter_changes(self, dataset: DatasetInfo) -> Iterator[List[ImageInfo]]:
+        """
+        Yields pages of images of the dataset updated since its cursor.
+        All images are listed if the dataset has no cursor yet.
+        """
+        filters = None
+        cursor = self.cursors.get(dataset.id, NEVER)
+        if cursor != NEVER:
+            filters = [
+                {
+                    ApiField.FIELD: ApiField.UPDATED_AT,
+                    ApiField.OPERATOR: ">=",
+                    ApiField.VALUE: format_timestamp(cursor),
+                }
+            ]
+        for page in self.api.image.get_list_generator(
+            dataset.id, filters=filters, batch_size=self.page_size
+        ):
+            if page:
+                yield page
+
+    def advance(self, dataset_id: int, cursor: int) -> None:
+        """Move the cursor of the dataset forward (never backward)."""
+        self.cursors[dataset_id] = max(self.cursors.get(dataset_id, NEVER), int(cursor))
+
+    def reset(self) -> None:
+        self.cursors = {}
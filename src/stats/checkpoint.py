@@ -0,0 +1,114 @@
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from src.stats.store import StatsStore
+from supervisely.sly_logger import logger
+
+
+class StatsCheckpoint:
+    """
+    Durable per-batch checkpoint of the statistics calculation, stored in a local JSON file
+    (and the statistics store saved next to it as `.npz` file).
+
+    The "last updates" of a batch are staged when the batch is computed and committed only
+    after the tags of the batch are uploaded (see `TagWriter.mark`). A restarted task resumes
+    from the last committed batch, images of uncommitted batches are calculated again.
+
+    :param path: Path to the checkpoint file. If None, the state is committed in memory only.
+    :param state_fn: Function that returns a JSON-serializable snapshot of the rest of the
+        state to be saved in the file. The "rows" value of the snapshot is the number of
+        store rows to be saved.
+    :param store: The statistics store.
+    :param min_interval: Minimum number of seconds between two writes of the file.
+    """
+
+    VERSION = 2
+
+    def __init__(
+        self,
+        path: Optional[str],
+        state_fn: Callable[[], Dict],
+        store: Optional[StatsStore] = None,
+        min_interval: float = 30.0,
+    ):
+        self.path = path
+        self.state_fn = state_fn
+        self.store = store
+        self.min_interval = min_interval
+        self.meta: Dict = {}
+        self._apply_fn: Optional[Callable[[Any], None]] = None
+        self._pending: Dict[int, list] = {}
+        self._lock = threading.Lock()
+        self._saved_at = 0.0
+
+    @property
+    def store_path(self) -> Optional[str]:
+        if self.path is None:
+            return None
+        return f"{os.path.splitext(self.path)[0]}.npz"
+
+    def load(self) -> Optional[Dict]:
+        """
+        Load the checkpoint file.
+
+        :return: The saved state or None if there is no valid checkpoint.
+        """
+        if self.path is None or not os.path.isfile(self.path):
+            return None
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Failed to read statistics checkpoint {self.path}: {e}")
+            return None
+        if data.get("version") != self.VERSION:
+            logger.warning(f"Unsupported statistics checkpoint version, ignoring {self.path}.")
+            return None
+        return data
+
+    def start(self, apply_fn: Callable[[Any], None], **meta) -> None:
+        """
+        Start a new run.
+
+        :param apply_fn: Function that applies a staged payload to the state on commit.
+        :param meta: Additional values to be saved in the file (e.g. target class).
+        """
+        with self._lock:
+            self._apply_fn = apply_fn
+            self.meta = meta
+            self._pending = {}
+
+    def stage(self, seq: int, payload: Any) -> None:
+        """Stage the "last updates" of the batch with the sequence number `seq`."""
+        with self._lock:
+            self._pending.setdefault(seq, []).append(payload)
+
+    def commit(self, seq: int) -> None:
+        """Commit all staged batches up to `seq` (inclusive) and save the file if it is due."""
+        with self._lock:
+            for s in sorted(k for k in self._pending if k <= seq):
+                for payload in self._pending.pop(s):
+                    self._apply_fn(payload)
+        self.save(force=False)
+
+    def save(self, force: bool = True) -> None:
+        """Write the committed state to the file atomically."""
+        if self.path is None:
+            return
+        if not force and time.monotonic() - self._saved_at < self.min_interval:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with self._lock:
+            data = {"version": self.VERSION, **self.meta, "saved_at": time.time()}
+            data.update(self.state_fn())
+            if self.store is not None:
+                self.store.save(self.store_path, size=data.get("rows"))
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.path)
+        self._saved_at = time.monotonic()
+        logger.debug(f"Statistics checkpoint saved: {data.get('rows')} rows.")
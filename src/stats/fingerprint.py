@@ -0,0 +1,52 @@
+import hashlib
+import json
+from typing import Dict, List, Optional
+
+from supervisely.annotation.label import Label
+from supervisely.geometry.constants import (
+    CLASS_ID,
+    CREATED_AT,
+    ID,
+    LABELER_LOGIN,
+    UPDATED_AT,
+)
+
+# The value of the "fingerprint" column for images that were never calculated
+NO_FINGERPRINT = 0
+
+# Keys of the geometry JSON that do not describe the shape
+_SERVICE_KEYS = (ID, CLASS_ID, LABELER_LOGIN, CREATED_AT, UPDATED_AT)
+
+
+def image_fingerprint(
+    image_hash: Optional[str],
+    labels_by_class: Dict[str, List[Label]],
+    metrics: List[str],
+    variant: str = "",
+) -> int:
+    """
+    Cheap fingerprint of everything the statistics of the image depend on: the image content
+    (its hash), the geometry of the labels of the calculated classes, the classes and the
+    calculated metrics. Changes that do not affect the statistics (e.g. tags written by the app
+    itself, labels of other classes) do not change the fingerprint.
+
+    :param image_hash: Hash of the image (ImageInfo.hash).
+    :param labels_by_class: Labels of each calculated class, by class name.
+    :param metrics: Names of the calculated metrics.
+    :param variant: Settings the values depend on (e.g. the intensity channel), empty for defaults.
+    :return: Signed 64-bit fingerprint (never equal to NO_FINGERPRINT).
+    """
+    h = hashlib.blake2b(digest_size=8)
+    h.update(f"{image_hash}|{','.join(sorted(metrics))}".encode())
+    if variant:
+        h.update(f"|{variant}".encode())
+    for class_name in sorted(labels_by_class):
+        h.update(f"|{class_name}|".encode())
+        for label in labels_by_class[class_name]:
+            data = label.geometry.to_json()
+            for key in _SERVICE_KEYS:
+                data.pop(key, None)
+            h.update(label.geometry.geometry_name().encode())
+            h.update(json.dumps(data, sort_keys=True).encode())
+    res = int.from_bytes(h.digest(), "little", signed=True)
+    return res if res != NO_FINGERPRINT else 1
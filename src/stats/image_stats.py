@@ -0,0 +1,59 @@
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from src.stats.metrics import calculate_metrics, metric_names
+from supervisely.annotation.label import Label
+
+
+def calculate_image_statistics(
+    img: Optional[np.ndarray],
+    target_labels: List[Label],
+    metrics: Optional[List[str]] = None,
+    img_size: Optional[Tuple[int, int]] = None,
+    tile_size: int = 0,
+) -> Dict:
+    """
+    Calculate statistics for a single image.
+    Module-level function, so it can be executed in worker processes.
+
+    :param img: The image. Can be None if none of the metrics requires pixels
+        or there are no target labels in the image.
+    :param target_labels: The labels of the target class.
+    :param metrics: Names of the registered metrics to calculate (see `metrics.register_metric`).
+        The default metrics by default.
+    :param img_size: Original (height, width) of the image. If the image is downscaled
+        (e.g. a preview), the labels are rescaled to it for the intensity metrics,
+        areas are always calculated at the original resolution.
+    :param tile_size: If set, labels larger than a tile of this size are processed tile by tile
+        (see `intensity.tiled_sums`), so the memory does not grow with the label size.
+    :return: A dictionary containing the requested statistics for the image.
+    """
+    if metrics is None:
+        metrics = metric_names(default_only=True)
+    return calculate_metrics(img, target_labels, metrics, img_size, tile_size)
+
+
+def calculate_class_statistics(
+    img: Optional[np.ndarray],
+    labels_by_class: Dict[str, List[Label]],
+    metrics: Optional[List[str]] = None,
+    img_size: Optional[Tuple[int, int]] = None,
+    tile_size: int = 0,
+) -> Dict[str, Dict]:
+    """
+    Calculate statistics of several classes for a single image (the image is decoded once).
+
+    :param img: The image. Can be None if none of the metrics requires pixels
+        or there are no labels of the classes in the image.
+    :param labels_by_class: The labels of each class, by class name.
+    :param metrics: Names of the metrics to calculate. The default metrics by default
+        (see `calculate_image_statistics`).
+    :param img_size: Original (height, width) of the image (see `calculate_image_statistics`).
+    :param tile_size: Tile size for large labels (see `calculate_image_statistics`).
+    :return: Statistics dictionaries by class name.
+    """
+    return {
+        class_name: calculate_image_statistics(img, labels, metrics, img_size, tile_size)
+        for class_name, labels in labels_by_class.items()
+    }
@@ -0,0 +1,80 @@
+import threading
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+
+
+class ImageIndex:
+    """
+    Compact mapping of image ID to the row of the statistics store.
+
+    IDs are kept in a sorted int64 array (with the rows in a parallel array) and are looked up
+    with `np.searchsorted`, which takes a fraction of the memory of a Python dict. New IDs go
+    to a small tail dict that is merged into the sorted arrays when it grows, so adding is
+    cheap amortized. Since the index can be rebuilt from the `image_ids` column of the store,
+    it does not need to be serialized and the ID type never drifts.
+
+    :param ids: Image IDs in row order (e.g. the `image_ids` column of the store).
+    """
+
+    MIN_TAIL_SIZE = 1024
+
+    def __init__(self, ids: Optional[Iterable[int]] = None):
+        self._lock = threading.Lock()
+        ids = np.asarray([] if ids is None else ids, dtype=np.int64)
+        order = np.argsort(ids, kind="stable")
+        self._ids = ids[order]
+        self._rows = order.astype(np.int64)
+        self._tail: Dict[int, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._ids) + len(self._tail)
+
+    def __contains__(self, image_id: int) -> bool:
+        return self.get(image_id) is not None
+
+    def get(self, image_id: int, default: Optional[int] = None) -> Optional[int]:
+        """Returns the row of the image or `default` if the image is not in the index."""
+        row = int(self.lookup([image_id])[0])
+        return default if row < 0 else row
+
+    def lookup(self, image_ids: Iterable[int]) -> np.ndarray:
+        """
+        Batch lookup of the rows.
+
+        :param image_ids: Image IDs.
+        :return: Array of rows, -1 for IDs that are not in the index.
+        """
+        ids = np.asarray(image_ids, dtype=np.int64).reshape(-1)
+        with self._lock:
+            rows = np.full(len(ids), -1, dtype=np.int64)
+            if len(self._ids) > 0:
+                pos = np.searchsorted(self._ids, ids)
+                pos = np.minimum(pos, len(self._ids) - 1)
+                found = self._ids[pos] == ids
+                rows[found] = self._rows[pos[found]]
+            if self._tail:
+                for i in np.flatnonzero(rows < 0):
+                    rows[i] = self._tail.get(int(ids[i]), -1)
+        return rows
+
+    def add(self, image_ids: Iterable[int], rows: Iterable[int]) -> None:
+        """Add new images to the index."""
+        with self._lock:
+            for image_id, row in zip(image_ids, rows):
+                self._tail[int(image_id)] = int(row)
+            if len(self._tail) > max(self.MIN_TAIL_SIZE, len(self._ids) // 8):
+                self._merge()
+
+    def _merge(self) -> None:
+        tail_ids = np.fromiter(self._tail.keys(), dtype=np.int64, count=len(self._tail))
+        tail_rows = np.fromiter(self._tail.values(), dtype=np.int64, count=len(self._tail))
+        ids = np.concatenate([self._ids, tail_ids])
+        rows = np.concatenate([self._rows, tail_rows])
+        order = np.argsort(ids, kind="stable")
+        self._ids = ids[order]
+        self._rows = rows[order]
+        self._tail = {}
+
+    def nbytes(self) -> int:
+        return self._ids.nbytes + self._rows.nbytes
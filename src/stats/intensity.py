@@ -0,0 +1,199 @@
+import tempfile
+from typing import Iterator, NamedTuple, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from supervisely.geometry.bitmap import Bitmap
+from supervisely.geometry.geometry import Geometry
+from supervisely.geometry.polygon import Polygon
+
+# 3x3 kernel used to build the 1-pixel outer border (ring) of the mask
+_RING_KERNEL = np.ones((3, 3), np.uint8)
+
+# Margin (in pixels) added around the label bounding box, enough to hold the ring
+ROI_MARGIN = 1
+
+Box = Tuple[int, int, int, int]
+
+
+def get_roi(geometry: Geometry, img_shape: Tuple[int, ...]) -> Optional[Tuple[int, int, int, int]]:
+    """
+    Returns the region of interest of the geometry in the image coordinates.
+    The region is the bounding box of the geometry extended by ROI_MARGIN pixels
+    and clipped to the image borders.
+
+    :param geometry: The geometry of the label.
+    :param img_shape: The shape of the image.
+    :return: Tuple (top, left, bottom, right) with exclusive bottom/right or None if
+        the geometry does not intersect the image.
+    """
+    bbox = geometry.to_bbox()
+    height, width = img_shape[:2]
+    top = max(bbox.top - ROI_MARGIN, 0)
+    left = max(bbox.left - ROI_MARGIN, 0)
+    bottom = min(bbox.bottom + ROI_MARGIN + 1, height)
+    right = min(bbox.right + ROI_MARGIN + 1, width)
+    if top >= bottom or left >= right:
+        return None
+    return top, left, bottom, right
+
+
+def draw_roi_mask(
+    geometry: Geometry, roi: Tuple[int, int, int, int], config: Optional[dict] = None
+) -> np.ndarray:
+    """
+    Rasterizes the geometry into a boolean mask of the ROI size.
+    The geometry is shifted by an integer offset, so the pixels are exactly the same
+    as if the geometry was drawn on the full-resolution canvas and then cropped.
+    """
+    top, left, bottom, right = roi
+    mask = np.full((bottom - top, right - left), fill_value=False)
+    if isinstance(geometry, Bitmap):
+        # `Bitmap.draw` does not clip the data to the canvas (e.g. a tile of a large bitmap)
+        row, col = geometry.origin.row, geometry.origin.col
+        height, width = geometry.data.shape
+        box = _intersect((row, col, row + height, col + width), roi)
+        if box is not None:
+            mask[box[0] - top : box[2] - top, box[1] - left : box[3] - left] = geometry.data[
+                box[0] - row : box[2] - row, box[1] - col : box[3] - col
+            ]
+        return mask
+    geometry.translate(-top, -left).draw(mask, color=True, thickness=0, config=config)
+    return mask
+
+
+def draw_outer_border(mask: np.ndarray) -> np.ndarray:
+    """Returns the 1-pixel outer border (ring) of the mask."""
+    outer_border = cv2.dilate(mask.astype(np.uint8), _RING_KERNEL, iterations=1) > 0
+    outer_border &= ~mask
+    return outer_border
+
+
+def masked_intensity_diff(crop: np.ndarray, mask: np.ndarray, outer_border: np.ndarray) -> float:
+    """
+    The absolute difference between the mean intensity inside the mask and the mean intensity
+    of its outer border (0 for an empty border). Multi-channel images are averaged over all
+    channels, which equals the mean of the per-pixel channel average.
+    """
+    mask_intensity = crop[mask].mean()
+    border_intensity = crop[outer_border].mean() if np.any(outer_border) else 0.0
+    return float(abs(mask_intensity - border_intensity))
+
+
+def _intersect(a: Box, b: Box) -> Optional[Box]:
+    top, left = max(a[0], b[0]), max(a[1], b[1])
+    bottom, right = min(a[2], b[2]), min(a[3], b[3])
+    if top >= bottom or left >= right:
+        return None
+    return top, left, bottom, right
+
+
+def iter_tiles(box: Box, tile_size: int) -> Iterator[Box]:
+    """Yields the tiles (top, left, bottom, right) covering the box, row by row."""
+    top, left, bottom, right = box
+    for row in range(top, bottom, tile_size):
+        for col in range(left, right, tile_size):
+            yield row, col, min(row + tile_size, bottom), min(col + tile_size, right)
+
+
+def _draw_roi_canvas(geometry: Geometry, roi: Box, config: Optional[dict] = None) -> np.ndarray:
+    """
+    Rasterizes the geometry into a file-backed uint8 mask of the ROI size: the pages are
+    allocated only where the mask is drawn and can be written back to disk under memory
+    pressure. The geometry is drawn on the whole ROI at once, because cv2 rasterization
+    of the clipped outline differs from the unclipped one (tile canvases change the pixels).
+    """
+    top, left, bottom, right = roi
+    canvas = np.memmap(tempfile.TemporaryFile(), np.uint8, "w+", shape=(bottom - top, right - left))
+    if isinstance(geometry, Bitmap):
+        canvas[:] = draw_roi_mask(geometry, roi)  # the data of a bitmap is in memory anyway
+    elif isinstance(geometry, Polygon):
+        # `Polygon.draw` allocates two more canvases of the same size
+        geometry = geometry.translate(-top, -left)
+        cv2.fillPoly(canvas, pts=[geometry.exterior_np[:, ::-1]], color=1)
+        cv2.fillPoly(canvas, pts=[x[:, ::-1] for x in geometry.interior_np], color=0)
+    else:
+        geometry.translate(-top, -left).draw(canvas, color=1, thickness=0, config=config)
+    return canvas
+
+
+class PixelSums(NamedTuple):
+    """
+    Sums of the image values inside the label mask and its outer border, over all channels.
+
+    :param mask_count: Number of values inside the mask (pixels x channels).
+    :param mask_sum: Sum of the values inside the mask.
+    :param mask_sumsq: Sum of the squared values inside the mask.
+    :param border_count: Number of values in the outer border.
+    :param border_sum: Sum of the values in the outer border.
+    """
+
+    mask_count: int = 0
+    mask_sum: float = 0.0
+    mask_sumsq: float = 0.0
+    border_count: int = 0
+    border_sum: float = 0.0
+
+    def intensity_diff(self) -> float:
+        """Same as `masked_intensity_diff` (0 for an empty mask)."""
+        if self.mask_count == 0:
+            return 0.0
+        border_intensity = self.border_sum / self.border_count if self.border_count > 0 else 0.0
+        return float(abs(self.mask_sum / self.mask_count - border_intensity))
+
+    def mask_std(self) -> float:
+        """Standard deviation of the values inside the mask (0 for an empty mask)."""
+        if self.mask_count == 0:
+            return 0.0
+        mean = self.mask_sum / self.mask_count
+        return float(np.sqrt(max(self.mask_sumsq / self.mask_count - mean * mean, 0.0)))
+
+
+def is_large(roi: Optional[Box], tile_size: int) -> bool:
+    """Returns True if the ROI is larger than a tile, i.e. it should be processed by tiles."""
+    if roi is None or tile_size <= 0:
+        return False
+    return (roi[2] - roi[0]) * (roi[3] - roi[1]) > tile_size * tile_size
+
+
+def tiled_sums(
+    img: np.ndarray, geometry: Geometry, tile_size: int, config: Optional[dict] = None
+) -> PixelSums:
+    """
+    Accumulates the sums of the label mask and its outer border with memory bounded by the tile
+    size instead of the label size. The mask is rasterized on a file-backed canvas (see
+    `_draw_roi_canvas`), then the mask and the image (which can be memory-mapped, see
+    `ImageCache`) are read tile by tile with a 1-pixel halo (the reach of the ring kernel),
+    and only the pixels inside each tile are counted.
+
+    :param img: The image (H x W or H x W x C).
+    :param geometry: The geometry of the label.
+    :param tile_size: Side of the tiles in pixels.
+    :param config: The geometry config of the object class (used for drawing).
+    """
+    roi = get_roi(geometry, img.shape)
+    if roi is None:
+        return PixelSums()
+    canvas = _draw_roi_canvas(geometry, roi, config)
+    channels = img.shape[2] if img.ndim == 3 else 1
+    top, left = roi[0], roi[1]
+    sums = np.zeros(3, dtype=np.float64)
+    mask_count = border_count = 0
+    for tile in iter_tiles(roi, tile_size):
+        halo = _intersect((tile[0] - 1, tile[1] - 1, tile[2] + 1, tile[3] + 1), roi)
+        mask = canvas[halo[0] - top : halo[2] - top, halo[1] - left : halo[3] - left] > 0
+        if not np.any(mask):
+            continue
+        outer_border = draw_outer_border(mask)
+        # only the pixels of the tile are counted, the halo belongs to the neighbours
+        rows = slice(tile[0] - halo[0], tile[2] - halo[0])
+        cols = slice(tile[1] - halo[1], tile[3] - halo[1])
+        mask, outer_border = mask[rows, cols], outer_border[rows, cols]
+        crop = img[tile[0] : tile[2], tile[1] : tile[3]]
+        values = crop[mask].astype(np.float64).ravel()
+        # sums of integer values are exact, so the order of the tiles does not matter
+        sums += (values.sum(), values @ values, crop[outer_border].sum(dtype=np.float64))
+        mask_count += values.size
+        border_count += np.count_nonzero(outer_border) * channels
+    return PixelSums(mask_count, sums[0], sums[1], border_count, sums[2])
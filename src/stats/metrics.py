@@ -0,0 +1,331 @@
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from src.stats import intensity
+from supervisely.annotation.label import Label
+from supervisely.annotation.tag_meta import TagValueType
+from supervisely.collection.str_enum import StrEnum
+from supervisely.geometry.bitmap import Bitmap
+from supervisely.geometry.geometry import Geometry
+from supervisely.geometry.polygon import Polygon
+from supervisely.geometry.polyline import Polyline
+from supervisely.geometry.rectangle import Rectangle
+
+
+class DefaultImgTags(StrEnum):
+    MAX_AREA = "_max_area"
+    TOTAL_AREA = "_total_area"
+    NUMBER_OF_LABELS = "_labels"
+    AVG_INTENSITY_DIFF = "_avg_intensity_diff"
+    MIN_INTENSITY_DIFF = "_min_intensity_diff"
+    MAX_INTENSITY_DIFF = "_max_intensity_diff"
+
+
+class MetricInput(StrEnum):
+    """The data a metric is calculated from (see `Metric.inputs`)."""
+
+    GEOMETRY = "geometry"  # the label geometry at the original resolution
+    MASK = "mask"  # the rasterized label mask
+    BORDER = "border"  # the 1-pixel outer border (ring) of the mask
+    PIXELS = "pixels"  # the decoded image
+
+
+def geometry_perimeter(geometry: Geometry) -> float:
+    """
+    Perimeter of the geometry in pixels: the length of the polygon rings, the contours of the
+    bitmap or the polyline. 0 for the geometries without a perimeter (e.g. points).
+    """
+    if isinstance(geometry, Rectangle):
+        return 2.0 * (geometry.width + geometry.height)
+    if isinstance(geometry, Polygon):
+        rings = [geometry.exterior_np] + list(geometry.interior_np)
+        return float(sum(_line_length(np.vstack([r, r[:1]])) for r in rings if len(r) > 1))
+    if isinstance(geometry, Polyline):
+        return _line_length(geometry.exterior_np)
+    if isinstance(geometry, Bitmap):
+        contours, _ = cv2.findContours(
+            geometry.data.astype(np.uint8), cv2.RETR_CCOMP, cv2.CHAIN_APPROX_NONE
+        )
+        return float(sum(cv2.arcLength(c, True) for c in contours))
+    return 0.0
+
+
+def _line_length(points: np.ndarray) -> float:
+    return float(np.linalg.norm(np.diff(points.astype(np.float64), axis=0), axis=1).sum())
+
+
+class LabelContext:
+    """
+    Intermediates of a label shared by all metrics of the image. Each intermediate is built
+    on first use and cached, so e.g. the mask is drawn once for all pixel metrics and is not
+    drawn at all if only geometry metrics are calculated.
+
+    :param label: The label (at the original resolution).
+    :param img: The image. Can be None if no metric requires pixels.
+    :param img_size: Original (height, width) of the image, if it is downscaled.
+    :param tile_size: Labels larger than a tile are processed by tiles (see `intensity.tiled_sums`).
+    """
+
+    def __init__(
+        self,
+        label: Label,
+        img: Optional[np.ndarray] = None,
+        img_size: Optional[Tuple[int, int]] = None,
+        tile_size: int = 0,
+    ):
+        self.label = label
+        self.img = img
+        self.img_size = img_size
+        self.tile_size = tile_size
+        self._cache: Dict[str, object] = {}
+
+    def _get(self, key: str, build: Callable[[], object]):
+        if key not in self._cache:
+            self._cache[key] = build()
+        return self._cache[key]
+
+    @property
+    def config(self) -> Optional[dict]:
+        return self.label.obj_class.geometry_config
+
+    @property
+    def area(self) -> float:
+        return self._get("area", lambda: self.label.geometry.area)
+
+    @property
+    def perimeter(self) -> float:
+        return self._get("perimeter", lambda: geometry_perimeter(self.label.geometry))
+
+    @property
+    def pixel_geometry(self) -> Geometry:
+        """The geometry in the image coordinates (rescaled if the image is downscaled)."""
+
+        def build():
+            shape = self.img.shape[:2]
+            if self.img_size is not None and tuple(shape) != tuple(self.img_size):
+                return self.label.resize(tuple(self.img_size), shape).geometry
+            return self.label.geometry
+
+        return self._get("pixel_geometry", build)
+
+    @property
+    def roi(self) -> Optional[intensity.Box]:
+        return self._get("roi", lambda: intensity.get_roi(self.pixel_geometry, self.img.shape))
+
+    @property
+    def tiled(self) -> bool:
+        return intensity.is_large(self.roi, self.tile_size)
+
+    @property
+    def mask(self) -> Optional[np.ndarray]:
+        """The mask of the ROI (None if the label is outside the image or processed by tiles)."""
+
+        def build():
+            if self.roi is None or self.tiled:
+                return None
+            return intensity.draw_roi_mask(self.pixel_geometry, self.roi, self.config)
+
+        return self._get("mask", build)
+
+    @property
+    def border(self) -> Optional[np.ndarray]:
+        return self._get(
+            "border", lambda: None if self.mask is None else intensity.draw_outer_border(self.mask)
+        )
+
+    @property
+    def crop(self) -> Optional[np.ndarray]:
+        def build():
+            if self.roi is None:
+                return None
+            top, left, bottom, right = self.roi
+            return self.img[top:bottom, left:right]
+
+        return self._get("crop", build)
+
+    @property
+    def sums(self) -> intensity.PixelSums:
+        """Sums of the mask and border values of a label processed by tiles."""
+        return self._get(
+            "sums",
+            lambda: intensity.tiled_sums(
+                self.img, self.pixel_geometry, self.tile_size, self.config
+            ),
+        )
+
+    @property
+    def intensity_diff(self) -> float:
+        """
+        Absolute difference between the mean intensity inside the mask and the mean intensity
+        of its 1-pixel outer border (see `intensity.masked_intensity_diff`).
+        """
+
+        def build():
+            if self.tiled:
+                return self.sums.intensity_diff()
+            if self.mask is None or not np.any(self.mask):
+                return 0.0
+            return intensity.masked_intensity_diff(self.crop, self.mask, self.border)
+
+        return self._get("intensity_diff", build)
+
+    @property
+    def contrast_std(self) -> float:
+        """Standard deviation of the image values inside the mask."""
+
+        def build():
+            if self.tiled:
+                return self.sums.mask_std()
+            if self.mask is None or not np.any(self.mask):
+                return 0.0
+            return float(self.crop[self.mask].std())
+
+        return self._get("contrast_std", build)
+
+
+class Metric(NamedTuple):
+    """
+    An image-level metric: a value is calculated for each label of the class, then the values
+    are reduced to a single value of the image (stored as the image tag `name`).
+
+    :param name: Name of the metric and of its image tag.
+    :param title: Title of the metric in the UI.
+    :param inputs: The data the metric requires (values of MetricInput). The image is downloaded
+        only if a calculated metric requires PIXELS.
+    :param value: Per-label value, calculated from the shared intermediates of the label.
+    :param reducer: Reduces the array of per-label values to the value of the image.
+    :param empty: The value of the image without labels of the class.
+    :param tag_type: Value type of the image tag.
+    :param default: Calculated by default (when the metrics are not configured).
+    """
+
+    name: str
+    title: str
+    inputs: Tuple[str, ...]
+    value: Callable[[LabelContext], float]
+    reducer: Callable[[np.ndarray], float]
+    empty: float = 0
+    tag_type: str = TagValueType.ANY_NUMBER
+    default: bool = True
+
+    @property
+    def needs_pixels(self) -> bool:
+        return MetricInput.PIXELS.value in self.inputs
+
+
+# Metrics by name, in the order of registration
+_REGISTRY: Dict[str, Metric] = {}
+
+
+def register_metric(metric: Metric) -> Metric:
+    """
+    Register a metric, so it can be configured (e.g. `STATS_METRICS`), calculated,
+    stored as an image tag and used for sorting.
+    """
+    if metric.name in _REGISTRY:
+        raise ValueError(f"Metric {metric.name} is already registered.")
+    _REGISTRY[metric.name] = metric
+    return metric
+
+
+def get_metric(name: str) -> Metric:
+    if name not in _REGISTRY:
+        raise ValueError(f"Unknown metric: {name}")
+    return _REGISTRY[name]
+
+
+def metric_names(default_only: bool = False) -> List[str]:
+    """Names of the registered metrics (only the default ones if `default_only`)."""
+    return [m.name for m in _REGISTRY.values() if m.default or not default_only]
+
+
+def needs_pixels(metrics: List[str]) -> bool:
+    """Returns True if any of the metrics requires image pixels."""
+    return any(get_metric(m).needs_pixels for m in metrics)
+
+
+_GEOMETRY = (MetricInput.GEOMETRY.value,)
+_INTENSITY = (MetricInput.MASK.value, MetricInput.BORDER.value, MetricInput.PIXELS.value)
+
+register_metric(
+    Metric(DefaultImgTags.MAX_AREA.value, "Maximum Area", _GEOMETRY, lambda c: c.area, np.max)
+)
+register_metric(
+    Metric(DefaultImgTags.TOTAL_AREA.value, "Total area", _GEOMETRY, lambda c: c.area, np.sum)
+)
+register_metric(
+    Metric(DefaultImgTags.NUMBER_OF_LABELS.value, "Number of Labels", (), lambda c: 1, len)
+)
+for _name, _title, _reducer in (
+    (DefaultImgTags.AVG_INTENSITY_DIFF.value, "Average Intensity Difference", np.mean),
+    (DefaultImgTags.MIN_INTENSITY_DIFF.value, "Minimum Intensity Difference", np.min),
+    (DefaultImgTags.MAX_INTENSITY_DIFF.value, "Maximum Intensity Difference", np.max),
+):
+    register_metric(
+        Metric(_name, _title, _INTENSITY, lambda c: c.intensity_diff, _reducer, empty=0.0)
+    )
+
+# Additional metrics, calculated only if configured
+register_metric(
+    Metric(
+        "_total_perimeter",
+        "Total Perimeter",
+        _GEOMETRY,
+        lambda c: c.perimeter,
+        np.sum,
+        empty=0.0,
+        default=False,
+    )
+)
+register_metric(
+    Metric(
+        "_min_compactness",
+        "Minimum Compactness",
+        _GEOMETRY,
+        # 4 * pi * area / perimeter^2: 1 for a circle, lower for elongated or ragged objects
+        lambda c: 4 * np.pi * c.area / c.perimeter**2 if c.perimeter > 0 else 0.0,
+        np.min,
+        empty=0.0,
+        default=False,
+    )
+)
+register_metric(
+    Metric(
+        "_avg_contrast_std",
+        "Average Contrast Std",
+        (MetricInput.MASK.value, MetricInput.PIXELS.value),
+        lambda c: c.contrast_std,
+        np.mean,
+        empty=0.0,
+        default=False,
+    )
+)
+
+
+def calculate_metrics(
+    img: Optional[np.ndarray],
+    labels: List[Label],
+    metrics: List[str],
+    img_size: Optional[Tuple[int, int]] = None,
+    tile_size: int = 0,
+) -> Dict:
+    """
+    Calculate the metrics of the labels of a class in a single image.
+    The intermediates of each label are built once and shared by the metrics (see `LabelContext`).
+
+    :param img: The image. Can be None if none of the metrics requires pixels.
+    :param labels: The labels of the class.
+    :param metrics: Names of the metrics to calculate.
+    :param img_size: Original (height, width) of the image, if it is downscaled.
+    :param tile_size: Labels larger than a tile are processed by tiles, 0 to disable.
+    :return: The value of each metric by name.
+    """
+    metrics = [get_metric(name) for name in metrics]
+    if not labels:
+        return {m.name: m.empty for m in metrics}
+    if img is None and any(m.needs_pixels for m in metrics):
+        raise ValueError("Image pixels are required to calculate intensity statistics.")
+    contexts = [LabelContext(label, img, img_size, tile_size) for label in labels]
+    return {m.name: m.reducer(np.array([m.value(c) for c in contexts])) for m in metrics}
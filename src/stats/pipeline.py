@@ -0,0 +1,107 @@
+import queue
+import threading
+from typing import Any, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from src.stats.ann_decoder import TargetAnnotation
+from supervisely.annotation.label import Label
+from supervisely.api.dataset_api import DatasetInfo
+from supervisely.api.image_api import ImageInfo
+
+_DONE = object()
+
+
+class Prefetcher:
+    """
+    Runs a producer in a background thread and yields its items through a bounded queue.
+    While the consumer processes item N, the producer already prepares the next `depth` items.
+    Exceptions raised by the producer are re-raised in the consumer thread.
+
+    :param producer: A function that returns an iterable of items (e.g. a generator).
+    :param depth: Maximum number of prepared items waiting in the queue.
+    """
+
+    def __init__(self, producer: Callable[[], Iterable], depth: int = 2):
+        self.producer = producer
+        self.depth = max(int(depth), 1)
+        self._queue = queue.Queue(maxsize=self.depth)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stats-prefetch", daemon=True)
+
+    def _put(self, item) -> bool:
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _run(self) -> None:
+        try:
+            for item in self.producer():
+                if not self._put(item):
+                    return
+        except BaseException as e:  # pylint: disable=broad-except
+            self._put(e)
+            return
+        self._put(_DONE)
+
+    def __iter__(self) -> Iterator:
+        self._thread.start()
+        try:
+            while True:
+                item = self._queue.get()
+                if item is _DONE:
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        self._stop.set()
+        # drain the queue to unblock the producer
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                break
+
+
+class StatsBatch(NamedTuple):
+    """
+    A unit of work passed from the prefetch thread to the statistics loop.
+
+    :param dataset: The dataset the batch belongs to.
+    :param infos: Infos of the images that need to be (re)calculated.
+    :param imgs: Decoded images for `infos` (None where pixels are not needed).
+    :param img_sizes: Original (height, width) of the images that were downscaled
+        (see `PixelSource`), None for the originals.
+    :param anns: Decoded annotations (target-class labels and metric tags) for `infos`.
+    :param labels: Labels of each calculated class (by class name) for `infos`.
+    :param fingerprints: Content fingerprints of `infos` (see `image_fingerprint`).
+    :param unchanged: Ids of the images that were updated, but their fingerprint did not
+        change: only their "last update" time is committed.
+    :param restored: Store values of new images restored from their tags (see `WarmStart`),
+        by image ID.
+    :param skipped: Number of images skipped because they were not updated.
+    :param dataset_done: True for the last item of the dataset.
+    :param cursor: For the last item of the dataset: the max `updated_at` (epoch microseconds)
+        of the listed images, to be committed as the change feed cursor.
+    """
+
+    dataset: DatasetInfo
+    infos: List[ImageInfo] = []
+    imgs: List[Optional[np.ndarray]] = []
+    anns: List[TargetAnnotation] = []
+    labels: List[Dict[str, List[Label]]] = []
+    fingerprints: List[int] = []
+    img_sizes: List[Optional[Tuple[int, int]]] = []
+    unchanged: List[int] = []
+    restored: Dict[int, Dict[str, Any]] = {}
+    skipped: int = 0
+    dataset_done: bool = False
+    cursor: int = 0
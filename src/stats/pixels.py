@@ -0,0 +1,301 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+import requests
+
+from src.stats.cache import ImageCache, MemoryCache, spill_image
+from supervisely.api.api import Api
+from supervisely.api.image_api import ImageInfo
+from supervisely.imaging import image as sly_image
+from supervisely.io.network_exceptions import process_requests_exception
+from supervisely.sly_logger import logger
+
+# Image planes the intensity metrics can be calculated on (see README, "Intensity difference")
+CHANNEL_ALL = "all"
+CHANNEL_LUMA = "luma"
+CHANNELS = (CHANNEL_ALL, CHANNEL_LUMA, "red", "green", "blue")
+
+# cv2 decodes color images in BGR order
+_BGR_INDEX = {"blue": 0, "green": 1, "red": 2}
+_RGB_INDEX = {"red": 0, "green": 1, "blue": 2}
+
+
+def to_channel(img: np.ndarray, channel: str) -> np.ndarray:
+    """
+    Reduce the decoded RGB image to the plane of the intensity metrics.
+
+    :param img: The image as returned by `sly_image.read_bytes` (H x W x 3, RGB).
+    :param channel: One of CHANNELS. With "all" the image is returned as is.
+    :return: H x W uint8 plane (or the image itself for "all").
+    """
+    if channel == CHANNEL_ALL or img.ndim == 2:
+        return img
+    if channel == CHANNEL_LUMA:
+        return cv2.cvtColor(img, cv2.COLOR_RGB2GRAY)
+    return np.ascontiguousarray(img[:, :, _RGB_INDEX[channel]])
+
+
+def decode_channel(img_bytes: bytes, channel: str) -> np.ndarray:
+    """
+    Decode the image straight to a single plane, the full color image is not kept.
+    "luma" is decoded as grayscale by the codec (for JPEG the Y plane is used without the
+    color conversion). Formats that cv2 can't decode fall back to `sly_image.read_bytes`.
+
+    :param img_bytes: The encoded image.
+    :param channel: One of CHANNELS except "all".
+    :return: H x W uint8 plane.
+    """
+    buf = np.frombuffer(img_bytes, dtype=np.uint8)
+    flag = cv2.IMREAD_GRAYSCALE if channel == CHANNEL_LUMA else cv2.IMREAD_COLOR
+    img = cv2.imdecode(buf, flag) if buf.size else None
+    if img is None:
+        return to_channel(sly_image.read_bytes(img_bytes), channel)
+    if channel == CHANNEL_LUMA:
+        return img
+    return np.ascontiguousarray(img[:, :, _BGR_INDEX[channel]])
+
+
+def preview_size(width: int, height: int, max_side: int) -> Tuple[int, int]:
+    """
+    Size of the downscaled image with the longest side not larger than `max_side`.
+
+    :return: (height, width) of the preview. The original size if it is small enough.
+    """
+    if not max_side or max(width, height) <= max_side:
+        return height, width
+    scale = max_side / max(width, height)
+    return max(int(round(height * scale)), 1), max(int(round(width * scale)), 1)
+
+
+class PixelSource:
+    """
+    Downloads the decoded images for the pixel metrics.
+
+    By default the originals are downloaded. With `max_side` set, images with a larger
+    side are downloaded as server-side resized previews (at most `max_side` pixels on the
+    longest side), which cuts transfer and decode time for large images. The label geometry
+    is rescaled to the preview by the statistics function, areas are not affected
+    (see `calculate_image_statistics`).
+
+    Decoded images are looked up in the `cache` (if set) by the image hash first, so images
+    whose pixels did not change (e.g. only the annotation was edited) are not downloaded again.
+    Identical images (re-uploads, copies in other datasets) are downloaded once per batch and
+    the recently downloaded images are kept in memory (up to `memory_mb`) to be shared with
+    the copies in the next batches.
+
+    With `channel` other than "all" the images are decoded straight to that plane (see
+    `decode_channel`), so only a third of the memory of the RGB image is kept and shared with
+    the workers.
+
+    With `tile_size` set, originals larger than a tile are downloaded and decoded one at a time
+    and spilled to a temporary file (see `spill_image`), so a batch of large frames does not
+    stay in memory: the labels are processed tile by tile and read only their part of the frame.
+    Large originals read from the cache are spilled as well.
+
+    :param api: Supervisely API.
+    :param max_side: Max size of the longest side of the downloaded image, 0 for originals.
+    :param quality: JPEG quality of the previews.
+    :param threads: Number of concurrent preview downloads.
+    :param cache: Cache of the decoded images.
+    :param memory_mb: Max size of the recently downloaded images kept in memory.
+    :param channel: The plane of the intensity metrics, one of CHANNELS.
+    :param tile_size: Originals with more pixels than a tile of this size are spilled to disk,
+        0 to keep all images in memory.
+    """
+
+    def __init__(
+        self,
+        api: Api,
+        max_side: int = 0,
+        quality: int = 95,
+        threads: int = 8,
+        cache: Optional[ImageCache] = None,
+        memory_mb: int = 256,
+        channel: str = CHANNEL_ALL,
+        tile_size: int = 0,
+    ):
+        if channel not in CHANNELS:
+            raise ValueError(f"Unknown intensity channel {channel!r}, expected one of {CHANNELS}.")
+        self.api = api
+        self.max_side = max(int(max_side or 0), 0)
+        self.quality = quality
+        self.threads = max(int(threads), 1)
+        self.cache = cache
+        self.recent = MemoryCache(memory_mb * 1024 * 1024)
+        self.channel = channel
+        self.tile_size = max(int(tile_size or 0), 0)
+        # copies of an image in the same batch, served by one download
+        self.deduplicated = 0
+        # images served by the recently downloaded ones (see `memory_mb`)
+        self.recent_hits = 0
+
+    def download(
+        self, dataset_id: int, infos: List[ImageInfo]
+    ) -> Tuple[List[np.ndarray], List[Optional[Tuple[int, int]]]]:
+        """
+        Download the images in the same order as `infos`. Identical images (with the same
+        hash) are downloaded once and the same array is returned for all of them.
+
+        :return: The images and the original (height, width) of the images that were
+            downscaled (None for the originals).
+        """
+        imgs: List[Optional[np.ndarray]] = [None] * len(infos)
+        sizes: List[Optional[Tuple[int, int]]] = [None] * len(infos)
+        keys: List[Optional[str]] = [None] * len(infos)
+        # indices of the images with the same content, the first one is downloaded
+        copies: Dict[str, List[int]] = {}
+        previews, originals = [], []
+        for i, info in enumerate(infos):
+            size = preview_size(info.width, info.height, self.max_side)
+            is_preview = size != (info.height, info.width) and bool(info.full_storage_url)
+            if is_preview:
+                sizes[i] = (info.height, info.width)
+            if info.hash:
+                variant = f"{size[0]}x{size[1]}q{self.quality}" if is_preview else "original"
+                if self.channel != CHANNEL_ALL:
+                    variant = f"{variant}|{self.channel}"
+                key = keys[i] = ImageCache.key(info.hash, variant)
+                if key in copies:
+                    copies[key].append(i)
+                    self.deduplicated += 1
+                    continue
+                copies[key] = [i]
+                imgs[i] = self.recent.get(key)
+                if imgs[i] is not None:
+                    self.recent_hits += 1
+                    continue
+                if self.cache is not None:
+                    imgs[i] = self.cache.get(key)
+                    if imgs[i] is not None:
+                        if not is_preview and self._is_large(info):
+                            # shared with the workers as a file, not copied to shared memory
+                            imgs[i] = spill_image(imgs[i])
+                        self.recent.put(key, imgs[i])
+                        continue
+            if is_preview:
+                previews.append((i, size))
+            else:
+                originals.append(i)
+        if originals:
+            nps = self.download_originals(dataset_id, [infos[i] for i in originals])
+            for i, img in zip(originals, nps):
+                imgs[i] = img
+        if previews:
+            with ThreadPoolExecutor(min(self.threads, len(previews))) as executor:
+                futures = {
+                    i: executor.submit(self._download_preview, infos[i], size)
+                    for i, size in previews
+                }
+                for i, future in futures.items():
+                    imgs[i] = future.result()
+        for i in originals + [i for i, _ in previews]:
+            if keys[i] is not None:
+                self.recent.put(keys[i], imgs[i])
+                if self.cache is not None:
+                    self.cache.put_async(keys[i], imgs[i])
+        for idxs in copies.values():
+            for i in idxs[1:]:
+                imgs[i] = imgs[idxs[0]]
+        return imgs, sizes
+
+    def download_originals(self, dataset_id: int, infos: List[ImageInfo]) -> List[np.ndarray]:
+        """
+        Download and decode the full resolution images (bypassing the caches).
+        Images larger than a tile are spilled to disk one by one (see `tile_size`).
+        """
+        imgs: List[Optional[np.ndarray]] = [None] * len(infos)
+        small = [i for i, info in enumerate(infos) if not self._is_large(info)]
+        if small:
+            ids = [infos[i].id for i in small]
+            if self.channel == CHANNEL_ALL:
+                nps = self.api.image.download_nps(dataset_id=dataset_id, ids=ids)
+            else:
+                nps = [
+                    decode_channel(img_bytes, self.channel)
+                    for img_bytes in self.api.image.download_bytes(dataset_id=dataset_id, ids=ids)
+                ]
+            for i, img in zip(small, nps):
+                imgs[i] = img
+        for i, info in enumerate(infos):
+            if imgs[i] is None:
+                # only one large frame is decoded in memory at a time
+                img_bytes = self.api.image.download_bytes(dataset_id=dataset_id, ids=[info.id])[0]
+                imgs[i] = spill_image(self._decode(img_bytes))
+        return imgs
+
+    def _is_large(self, info: ImageInfo) -> bool:
+        return self.tile_size > 0 and info.width * info.height > self.tile_size * self.tile_size
+
+    def _decode(self, img_bytes: bytes) -> np.ndarray:
+        if self.channel == CHANNEL_ALL:
+            return sly_image.read_bytes(img_bytes)
+        return decode_channel(img_bytes, self.channel)
+
+    def _download_preview(self, info: ImageInfo, size: Tuple[int, int]) -> np.ndarray:
+        height, width = size
+        url = self.api.image.preview_url(
+            info.full_storage_url,
+            width=width,
+            height=height,
+            quality=self.quality,
+            ext="jpeg",
+            method="force",
+        )
+        img = self._decode(self._get(url).content)
+        if img.shape[:2] != size:
+            img = sly_image.resize(img, size)
+        return img
+
+    def _get(self, url: str) -> requests.Response:
+        """GET the URL with the retry policy of the API requests (see `Api.get`)."""
+        retries = max(int(self.api.retry_count), 1)
+        for retry_idx in range(retries):
+            response = None
+            try:
+                response = requests.get(url, headers=self.api.headers, timeout=60)
+                response.raise_for_status()
+                return response
+            except requests.RequestException as exc:
+                # retryable errors are logged and retried after a backoff, the others are raised
+                process_requests_exception(
+                    logger,
+                    exc,
+                    "image preview",
+                    url,
+                    swallow_exc=retry_idx + 1 < retries,
+                    sleep_sec=min(self.api.retry_sleep_sec * (2**retry_idx), 60),
+                    response=response,
+                    retry_info={"retry_idx": retry_idx + 2, "retry_limit": retries},
+                )
+
+
+def accuracy_report(
+    reference: List[Dict[str, float]], approx: List[Dict[str, float]]
+) -> Dict[str, Dict[str, float]]:
+    """
+    Compare the statistics calculated on downscaled images with the full resolution ones.
+
+    :param reference: Statistics of the sample images at full resolution.
+    :param approx: Statistics of the same images calculated on previews.
+    :return: Errors by metric: mean and max absolute error and max relative error
+        (relative to the full resolution value, images with zero values are skipped).
+    """
+    report = {}
+    metrics = set().union(*reference) if reference else set()
+    for metric in sorted(metrics):
+        ref = np.array([r.get(metric, np.nan) for r in reference], dtype=np.float64)
+        val = np.array([a.get(metric, np.nan) for a in approx], dtype=np.float64)
+        valid = ~np.isnan(ref) & ~np.isnan(val)
+        if not valid.any():
+            continue
+        err = np.abs(val[valid] - ref[valid])
+        nonzero = ref[valid] != 0
+        rel = err[nonzero] / np.abs(ref[valid][nonzero])
+        report[metric] = {
+            "mean_abs_error": float(err.mean()),
+            "max_abs_error": float(err.max()),
+            "max_rel_error": float(rel.max()) if rel.size else 0.0,
+        }
+    return report
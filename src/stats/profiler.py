@@ -0,0 +1,150 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+
+# Stages of a statistics run (see README, "Profiling")
+STAGE_LISTING = "listing"  # listing of the updated images
+STAGE_ANNOTATIONS = "annotations"  # download of the annotations
+STAGE_DECODE = "decode"  # decoding of the annotations
+STAGE_DOWNLOAD = "download"  # download and decoding of the images
+STAGE_METRICS = "metrics"  # calculation of the metrics
+STAGE_TAG_UPLOAD = "tag_upload"  # upload of the statistics tags
+STAGE_SEND_CHANGES = "send_changes"  # synchronisation of the widget state with the frontend
+STAGES = (
+    STAGE_LISTING,
+    STAGE_ANNOTATIONS,
+    STAGE_DECODE,
+    STAGE_DOWNLOAD,
+    STAGE_METRICS,
+    STAGE_TAG_UPLOAD,
+    STAGE_SEND_CHANGES,
+)
+
+
+class StageProfiler:
+    """
+    Cumulative and per-batch timers and counters of the stages of a statistics run.
+
+    A stage is timed with `stage` (or `iterate` for a generator), which adds the elapsed time,
+    one call and the number of processed items to the totals of the run and of the current
+    batch. `end_batch` closes the current batch. The stages run in several threads (listing,
+    downloads and decoding in the prefetch thread, tag uploads in the writer thread), so a batch
+    covers the stage time spent by all threads between two completed batches, and the shares of
+    the stages in the wall time of the run can add up to more than 100%.
+
+    The overhead is two `perf_counter` calls and a lock per timed call, stages are timed per
+    batch, not per image.
+
+    :param max_batches: Number of the recent batches kept for the per-batch percentiles.
+    """
+
+    def __init__(self, max_batches: int = 1000):
+        self._lock = threading.Lock()
+        self._batches = deque(maxlen=max_batches)
+        self._start = time.perf_counter()
+        self._end: Optional[float] = None
+        self._reset()
+
+    def _reset(self) -> None:
+        self._seconds = dict.fromkeys(STAGES, 0.0)
+        self._calls = dict.fromkeys(STAGES, 0)
+        self._items = dict.fromkeys(STAGES, 0)
+        self._batch = dict.fromkeys(STAGES, 0.0)
+
+    def start(self) -> None:
+        """Start a new run: resets the timers."""
+        with self._lock:
+            self._reset()
+            self._batches.clear()
+            self._start = time.perf_counter()
+            self._end = None
+
+    def stop(self) -> None:
+        """Stop the wall clock of the run."""
+        self._end = time.perf_counter()
+
+    def add(self, name: str, seconds: float, items: int = 0) -> None:
+        """Add a timed call of the stage."""
+        with self._lock:
+            self._seconds[name] = self._seconds.get(name, 0.0) + seconds
+            self._calls[name] = self._calls.get(name, 0) + 1
+            self._items[name] = self._items.get(name, 0) + items
+            self._batch[name] = self._batch.get(name, 0.0) + seconds
+
+    @contextmanager
+    def stage(self, name: str, items: int = 0) -> Iterator[None]:
+        """
+        Time the block as a call of the stage.
+
+        :param name: The stage, one of STAGES.
+        :param items: Number of items (e.g. images) processed by the call.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start, items)
+
+    def iterate(self, name: str, iterable: Iterable[List]) -> Iterator[List]:
+        """
+        Time the production of each page of the iterable (e.g. a paginated listing) as a call
+        of the stage. The items of the call are the size of the page.
+        """
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                page = next(iterator)
+            except StopIteration:
+                self.add(name, time.perf_counter() - start)
+                return
+            self.add(name, time.perf_counter() - start, len(page))
+            yield page
+
+    def end_batch(self) -> Dict[str, float]:
+        """
+        Close the current batch.
+
+        :return: Seconds spent in each stage during the batch.
+        """
+        with self._lock:
+            batch, self._batch = self._batch, dict.fromkeys(STAGES, 0.0)
+            self._batches.append(batch)
+        return batch
+
+    @property
+    def wall_time(self) -> float:
+        """Seconds since the start of the run (until `stop` if the run is stopped)."""
+        end = self._end if self._end is not None else time.perf_counter()
+        return end - self._start
+
+    def summary(self) -> Dict:
+        """
+        Profile of the run: the wall time, the number of batches and for each stage the total
+        seconds, calls, items, share of the wall time and the median and max seconds per batch.
+        """
+        wall = self.wall_time
+        with self._lock:
+            batches = list(self._batches)
+            stages = {}
+            for name, seconds in self._seconds.items():
+                per_batch = np.array([b.get(name, 0.0) for b in batches] or [0.0])
+                stages[name] = {
+                    "seconds": round(seconds, 3),
+                    "calls": self._calls[name],
+                    "items": self._items[name],
+                    "share": round(seconds / wall, 3) if wall > 0 else 0.0,
+                    "batch_p50_s": round(float(np.median(per_batch)), 3),
+                    "batch_max_s": round(float(per_batch.max()), 3),
+                }
+        return {"wall_s": round(wall, 3), "batches": len(batches), "stages": stages}
+
+    def slowest(self, count: int = 3) -> List[str]:
+        """Names of the stages with the most time, the slowest first (idle stages are skipped)."""
+        with self._lock:
+            ranked = sorted(self._seconds.items(), key=lambda kv: kv[1], reverse=True)
+        return [name for name, seconds in ranked[:count] if seconds > 0]
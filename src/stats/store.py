@@ -0,0 +1,198 @@
+import os
+import threading
+from typing import Any, Dict, Optional
+
+import numpy as np
+from numpy.lib.format import open_memmap
+
+from supervisely.sly_logger import logger
+
+
+def _fill_value(dtype: np.dtype):
+    return np.nan if np.issubdtype(dtype, np.floating) else 0
+
+
+class StatsStore:
+    """
+    Columnar store of per-image statistics backed by typed numpy arrays.
+
+    Rows are appended in O(1) amortized time (the capacity grows geometrically) and
+    updated in place by row index. Optionally the columns are memory-mapped `.npy` files
+    in `mmap_dir`, so the statistics of huge projects do not have to fit in RAM.
+
+    :param columns: Mapping of column name to dtype.
+    :param capacity: Initial number of rows to allocate.
+    :param mmap_dir: Directory for memory-mapped columns. If None, columns are kept in memory.
+    """
+
+    GROWTH_FACTOR = 2
+
+    def __init__(
+        self,
+        columns: Dict[str, Any],
+        capacity: int = 1024,
+        mmap_dir: Optional[str] = None,
+    ):
+        self.mmap_dir = mmap_dir
+        self._capacity = max(int(capacity), 1)
+        self._size = 0
+        self._lock = threading.RLock()
+        self._columns: Dict[str, np.ndarray] = {}
+        if mmap_dir is not None:
+            os.makedirs(mmap_dir, exist_ok=True)
+        for name, dtype in columns.items():
+            self.add_column(name, dtype)
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def columns(self):
+        return list(self._columns.keys())
+
+    def _allocate(self, name: str, dtype: np.dtype, capacity: int) -> np.ndarray:
+        if self.mmap_dir is None:
+            return np.full(capacity, _fill_value(dtype), dtype=dtype)
+        path = os.path.join(self.mmap_dir, f"{name}.npy")
+        tmp_path = f"{path}.tmp"
+        arr = open_memmap(tmp_path, mode="w+", dtype=dtype, shape=(capacity,))
+        arr[:] = _fill_value(dtype)
+        old = self._columns.get(name)
+        if old is not None:
+            arr[: self._size] = old[: self._size]
+        arr.flush()
+        del arr
+        os.replace(tmp_path, path)
+        return open_memmap(path, mode="r+")
+
+    def add_column(self, name: str, dtype: Any) -> None:
+        """Add a new column. Existing rows are filled with NaN (floats) or 0."""
+        with self._lock:
+            if name in self._columns:
+                return
+            self._columns[name] = self._allocate(name, np.dtype(dtype), self._capacity)
+
+    def _grow(self, min_capacity: int) -> None:
+        capacity = self._capacity
+        while capacity < min_capacity:
+            capacity *= self.GROWTH_FACTOR
+        for name, arr in list(self._columns.items()):
+            if self.mmap_dir is None:
+                new = np.full(capacity, _fill_value(arr.dtype), dtype=arr.dtype)
+                new[: self._size] = arr[: self._size]
+                self._columns[name] = new
+            else:
+                self._columns[name] = self._allocate(name, arr.dtype, capacity)
+        self._capacity = capacity
+
+    def append(self, values: Dict[str, Any]) -> int:
+        """
+        Append a row. Columns missing in `values` are filled with NaN (floats) or 0.
+
+        :return: The index of the new row.
+        """
+        with self._lock:
+            if self._size >= self._capacity:
+                self._grow(self._size + 1)
+            row = self._size
+            for name, value in values.items():
+                self._columns[name][row] = value
+            # the size is increased after all values are written, so readers never see partial rows
+            self._size += 1
+            return row
+
+    def update(self, row: int, values: Dict[str, Any]) -> None:
+        """Update values of an existing row in place."""
+        with self._lock:
+            if not 0 <= row < self._size:
+                raise IndexError(f"Row {row} is out of range [0, {self._size}).")
+            for name, value in values.items():
+                self._columns[name][row] = value
+
+    def update_many(self, name: str, rows: np.ndarray, values: Any) -> None:
+        """Vectorised in-place update of one column for several rows."""
+        rows = np.asarray(rows, dtype=np.int64)
+        with self._lock:
+            if rows.size > 0 and (rows.min() < 0 or rows.max() >= self._size):
+                raise IndexError(f"Rows are out of range [0, {self._size}).")
+            self._columns[name][rows] = values
+
+    def take(self, name: str, rows: np.ndarray, default: Any = None) -> np.ndarray:
+        """
+        Vectorised read of one column for several rows.
+
+        :param rows: Row indices, negative values mean "no row".
+        :param default: Value for the negative rows. NaN (floats) or 0 by default.
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        with self._lock:
+            arr = self._columns[name]
+            if default is None:
+                default = _fill_value(arr.dtype)
+            res = np.full(rows.shape, default, dtype=arr.dtype)
+            valid = (rows >= 0) & (rows < self._size)
+            res[valid] = arr[rows[valid]]
+        return res
+
+    def column(self, name: str) -> np.ndarray:
+        """Returns a read-only view of the column."""
+        view = self._columns[name][: self._size]
+        view = view.view()
+        view.flags.writeable = False
+        return view
+
+    def to_dict(self, size: Optional[int] = None) -> Dict[str, np.ndarray]:
+        """
+        Returns a copy of all columns.
+
+        :param size: Number of rows to copy. All rows by default.
+        """
+        with self._lock:
+            size = self._size if size is None else min(size, self._size)
+            return {name: np.array(arr[:size]) for name, arr in self._columns.items()}
+
+    def clear(self) -> None:
+        with self._lock:
+            self._size = 0
+            for arr in self._columns.values():
+                arr[:] = _fill_value(arr.dtype)
+
+    def summary(self) -> Dict:
+        """Small summary of the store that can be shown in the UI."""
+        return {"rows": self._size, "columns": self.columns}
+
+    def save(self, path: str, size: Optional[int] = None) -> None:
+        """Save the (first `size` rows of the) store to `.npz` file atomically."""
+        data = self.to_dict(size)
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(tmp_path, **data)
+        os.replace(tmp_path, path)
+
+    def load(self, path: str) -> bool:
+        """
+        Replace the content of the store with the data saved by `save`.
+
+        :return: True if the data was loaded.
+        """
+        if not os.path.isfile(path):
+            return False
+        try:
+            with np.load(path) as data:
+                columns = {name: data[name] for name in data.files}
+        except (OSError, ValueError) as e:
+            logger.warning(f"Failed to load statistics store from {path}: {e}")
+            return False
+        sizes = {len(arr) for arr in columns.values()}
+        if len(sizes) > 1:
+            logger.warning(f"Statistics store {path} is corrupted: columns have different sizes.")
+            return False
+        size = sizes.pop() if sizes else 0
+        with self._lock:
+            self.clear()
+            if size > self._capacity:
+                self._grow(size)
+            for name, arr in columns.items():
+                self.add_column(name, arr.dtype)
+                self._columns[name][:size] = arr
+            self._size = size
+        return True
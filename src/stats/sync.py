@@ -0,0 +1,87 @@
+import threading
+import time
+from copy import deepcopy
+from typing import Any, Dict
+
+import numpy as np
+
+from supervisely.app.content import DataJson
+from supervisely.sly_logger import logger
+
+
+class Throttle:
+    """
+    Allows an action at most once per `min_interval` seconds.
+
+    :param min_interval: Minimum number of seconds between two actions.
+    """
+
+    def __init__(self, min_interval: float = 1.0):
+        self.min_interval = min_interval
+        self._last = 0.0
+
+    def ready(self, force: bool = False) -> bool:
+        now = time.monotonic()
+        if not force and now - self._last < self.min_interval:
+            return False
+        self._last = now
+        return True
+
+
+class DataJsonSync:
+    """
+    Throttled synchronisation of the widget state with the frontend.
+
+    Values are recorded with `set` and only the keys whose values really changed are written to
+    `DataJson()[widget_id]`. Changes are sent to the frontend at most once per `min_interval`
+    seconds, so a JSON patch contains only the changed keys and is coalesced over many batches.
+    Bulk data (numpy arrays, large collections) is rejected: it must stay out of the UI channel.
+
+    :param widget_id: The widget ID.
+    :param min_interval: Minimum number of seconds between two `send_changes` calls.
+    :param max_items: Maximum size of a collection that can be sent to the frontend.
+    """
+
+    def __init__(self, widget_id: str, min_interval: float = 2.0, max_items: int = 1000):
+        self.widget_id = widget_id
+        self.max_items = max_items
+        self._throttle = Throttle(min_interval)
+        self._sent: Dict[str, Any] = {}
+        self._dirty: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def set(self, key: str, value: Any) -> None:
+        """Record the new value of the key. It is sent with the next flush if it has changed."""
+        self._check_size(key, value)
+        with self._lock:
+            if key in self._sent and self._sent[key] == value:
+                self._dirty.pop(key, None)
+                return
+            self._dirty[key] = deepcopy(value)
+
+    def flush(self, force: bool = False) -> bool:
+        """
+        Send the changed keys to the frontend if the throttling interval has passed.
+
+        :param force: Send the changes regardless of the interval.
+        :return: True if the changes were sent.
+        """
+        with self._lock:
+            if not self._dirty or not self._throttle.ready(force):
+                return False
+            dirty, self._dirty = self._dirty, {}
+            for key, value in dirty.items():
+                DataJson()[self.widget_id][key] = value
+            self._sent.update(dirty)
+        DataJson().send_changes()
+        logger.debug(f"State synchronised: {list(dirty.keys())}")
+        return True
+
+    def _check_size(self, key: str, value: Any) -> None:
+        if isinstance(value, np.ndarray):
+            raise TypeError(f"Numpy arrays can not be synchronised with the frontend: '{key}'.")
+        if isinstance(value, (list, tuple, dict, set)) and len(value) > self.max_items:
+            raise ValueError(
+                f"Value of '{key}' is too large to be synchronised with the frontend "
+                f"({len(value)} > {self.max_items} items)."
+            )
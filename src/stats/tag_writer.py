@@ -0,0 +1,270 @@
+import queue
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from typing import Callable, Dict, List, NamedTuple, Optional, Set
+
+from src.stats.profiler import STAGE_TAG_UPLOAD, StageProfiler
+from supervisely.api.api import Api
+from supervisely.sly_logger import logger
+from supervisely.task.progress import tqdm_sly
+
+_STOP = object()
+
+
+class TagUpdate(NamedTuple):
+    """
+    A new value of an image tag.
+
+    :param tag_meta_id: ID of the tag meta.
+    :param image_id: ID of the image.
+    :param tag_id: ID of the existing tag instance, None if it is unknown.
+    :param value: The new value.
+    """
+
+    tag_meta_id: int
+    image_id: int
+    tag_id: Optional[int]
+    value: float
+
+
+class TagWriter:
+    """
+    Streams tag changes to the server from a background thread.
+
+    New tag values are buffered and flushed when the buffer reaches `max_buffer` tags
+    or the oldest buffered tag is older than `max_age` seconds, so memory usage is bounded
+    and the work that is already uploaded survives a crash.
+
+    Changed values of existing tags are updated in place, so only the true delta is written.
+    If a batch has more than `max_inplace` changed values (one request per tag), the changed
+    tags are removed with grouped bulk requests (only the changed tag metas of each image)
+    and uploaded again with the new values. Tags that fail to update in place (e.g. deleted
+    since their ID was stored) are re-added the same way. Updates are executed in the order of submission,
+    i.e. always before the new values of the same batch.
+
+    :param api: Supervisely API.
+    :param project_id: The project ID.
+    :param max_buffer: Flush the buffer when it contains this number of tags.
+    :param max_age: Flush the buffer when the oldest tag is waiting for this number of seconds.
+    :param depth: Maximum number of operations waiting in the queue.
+        When the queue is full, the caller is blocked until the writer catches up.
+    :param on_progress: Callback with (flushed, pending) counters, called after each flush.
+    :param on_commit: Callback with the sequence number of the last mark (see `mark`)
+        whose preceding operations are all uploaded.
+    :param on_added: Callback with the uploaded tags and the IDs of the created tag instances
+        (in the same order), called after each upload request.
+    :param max_inplace: Maximum number of in-place value updates per batch.
+    :param update_threads: Number of concurrent in-place update requests.
+    :param profiler: Times the uploads as the "tag_upload" stage.
+    """
+
+    def __init__(
+        self,
+        api: Api,
+        project_id: int,
+        max_buffer: int = 1000,
+        max_age: float = 10.0,
+        depth: int = 4,
+        on_progress: Optional[Callable[[int, int], None]] = None,
+        on_commit: Optional[Callable[[int], None]] = None,
+        max_inplace: int = 100,
+        update_threads: int = 8,
+        profiler: Optional[StageProfiler] = None,
+        on_added: Optional[Callable[[List[Dict], List[int]], None]] = None,
+    ):
+        self.api = api
+        self.project_id = project_id
+        self.max_buffer = max(int(max_buffer), 1)
+        self.max_age = max(float(max_age), 0.1)
+        self.on_progress = on_progress
+        self.on_commit = on_commit
+        self.on_added = on_added
+        self.max_inplace = max(int(max_inplace), 0)
+        self.update_threads = max(int(update_threads), 1)
+        self.profiler = profiler
+
+        self._queue = queue.Queue(maxsize=max(int(depth), 1))
+        self._buffer: List[Dict] = []
+        self._buffer_since: Optional[float] = None
+        self._marks: List[int] = []
+        self._lock = threading.Lock()
+        self._submitted = 0
+        self._flushed = 0
+        self._error: Optional[BaseException] = None
+        self._thread = threading.Thread(target=self._run, name="stats-tag-writer", daemon=True)
+        self._thread.start()
+
+    @property
+    def flushed(self) -> int:
+        """Number of tags uploaded to the server."""
+        return self._flushed
+
+    @property
+    def pending(self) -> int:
+        """Number of tags submitted but not uploaded yet."""
+        with self._lock:
+            return self._submitted - self._flushed
+
+    def update(self, updates: List[TagUpdate]) -> None:
+        """
+        Schedule the update of the values of existing tags.
+
+        :param updates: The changed tag values.
+        """
+        if updates:
+            with self._lock:
+                self._submitted += len(updates)
+            self._submit(("update", updates))
+
+    def add(self, tags: List[Dict]) -> None:
+        """
+        Schedule the upload of tags.
+
+        :param tags: List of tag dictionaries in `add_to_entities_json` format.
+        """
+        if tags:
+            with self._lock:
+                self._submitted += len(tags)
+            self._submit(("add", tags))
+
+    def mark(self, seq: int) -> None:
+        """
+        Put a mark after the operations submitted so far. `on_commit(seq)` is called
+        as soon as all of these operations are uploaded.
+
+        :param seq: The sequence number of the mark (e.g. batch number).
+        """
+        self._submit(("mark", seq))
+
+    def join(self) -> None:
+        """Flush the buffer and wait until all operations are finished. Re-raises an upload error."""
+        self._queue.put(_STOP)
+        self._thread.join()
+        if self._error is not None:
+            raise self._error
+
+    def _submit(self, op) -> None:
+        if self._error is not None:
+            raise self._error
+        self._queue.put(op)
+
+    def _run(self) -> None:
+        while True:
+            timeout = None
+            if self._buffer_since is not None:
+                timeout = max(self._buffer_since + self.max_age - time.monotonic(), 0)
+            try:
+                op = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                op = None
+            if self._error is not None:
+                if op is _STOP:
+                    return
+                continue  # skip the rest after failure, the error is raised in join()
+            try:
+                if op is _STOP:
+                    self._flush()
+                    return
+                if op is not None:
+                    kind, payload = op
+                    if kind == "update":
+                        self._update(payload)
+                    elif kind == "mark":
+                        self._marks.append(payload)
+                        if not self._buffer:
+                            self._commit()
+                    else:
+                        if self._buffer_since is None:
+                            self._buffer_since = time.monotonic()
+                        self._buffer.extend(payload)
+                if self._need_flush():
+                    self._flush()
+            except BaseException as e:  # pylint: disable=broad-except
+                logger.error(f"Failed to upload tag changes: {e}", exc_info=True)
+                self._error = e
+
+    def _need_flush(self) -> bool:
+        if not self._buffer:
+            return False
+        if len(self._buffer) >= self.max_buffer:
+            return True
+        return time.monotonic() - self._buffer_since >= self.max_age
+
+    def _flush(self) -> None:
+        while self._buffer:
+            chunk = self._buffer[: self.max_buffer]
+            logger.debug(f"Uploading {len(chunk)} tags to images.")
+            with self._stage(len(chunk)):
+                ids = self.api.image.tag.add_to_entities_json(self.project_id, chunk)
+            if callable(self.on_added) and ids and len(ids) == len(chunk):
+                self.on_added(chunk, ids)
+            del self._buffer[: len(chunk)]
+            with self._lock:
+                self._flushed += len(chunk)
+        self._buffer_since = None
+        self._commit()
+        if callable(self.on_progress):
+            self.on_progress(self.flushed, self.pending)
+
+    def _stage(self, items: int):
+        if self.profiler is None:
+            return nullcontext()
+        return self.profiler.stage(STAGE_TAG_UPLOAD, items)
+
+    def _commit(self) -> None:
+        if not self._marks:
+            return
+        seq = max(self._marks)
+        self._marks = []
+        if callable(self.on_commit):
+            self.on_commit(seq)
+
+    def _update(self, updates: List[TagUpdate]) -> None:
+        inplace = [u for u in updates if u.tag_id is not None]
+        readd = [u for u in updates if u.tag_id is None]
+        if len(inplace) > self.max_inplace:
+            inplace, readd = [], updates
+        if inplace:
+            logger.debug(f"Updating {len(inplace)} tag values in place.")
+            with self._stage(len(inplace)):
+                with ThreadPoolExecutor(min(self.update_threads, len(inplace))) as executor:
+                    updated = list(executor.map(self._update_value, inplace))
+            failed = [u for u, ok in zip(inplace, updated) if not ok]
+            if failed:
+                logger.debug(f"Failed to update {len(failed)} tags in place, re-adding them.")
+                readd.extend(failed)
+            with self._lock:
+                self._flushed += len(inplace) - len(failed)
+        if readd:
+            self._remove(readd)
+            if self._buffer_since is None:
+                self._buffer_since = time.monotonic()
+            self._buffer.extend(
+                {"tagId": u.tag_meta_id, "entityId": u.image_id, "value": u.value} for u in readd
+            )
+
+    def _update_value(self, update: TagUpdate) -> bool:
+        try:
+            self.api.image.update_tag_value(update.tag_id, update.value)
+        except Exception as e:  # pylint: disable=broad-except
+            logger.debug(f"Failed to update tag {update.tag_id}: {e}")
+            return False
+        return True
+
+    def _remove(self, updates: List[TagUpdate]) -> None:
+        # images are grouped by the set of their changed tag metas,
+        # so only the changed tags are removed
+        tag_metas: Dict[int, Set[int]] = defaultdict(set)
+        for u in updates:
+            tag_metas[u.image_id].add(u.tag_meta_id)
+        groups: Dict[frozenset, List[int]] = defaultdict(list)
+        for image_id, tag_meta_ids in tag_metas.items():
+            groups[frozenset(tag_meta_ids)].append(image_id)
+        logger.debug(f"Removing {len(updates)} tags from {len(tag_metas)} images.")
+        p = tqdm_sly(desc="Removing tags from entities", total=len(tag_metas))
+        with self._stage(len(updates)):
+            for tag_meta_ids, img_ids in groups.items():
+                self.api.advanced.remove_tags_from_images(list(tag_meta_ids), img_ids, p.update)
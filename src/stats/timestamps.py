@@ -0,0 +1,33 @@
+import time
+from typing import Iterable
+
+import numpy as np
+
+# Timestamps are stored as int64 microseconds since the Unix epoch (UTC), 0 means "never"
+NEVER = 0
+
+
+def parse_timestamps(values: Iterable[str]) -> np.ndarray:
+    """
+    Vectorised conversion of server timestamps ("%Y-%m-%dT%H:%M:%S.%fZ") to epoch microseconds.
+
+    :param values: ISO 8601 UTC timestamps.
+    :return: int64 array of microseconds since the epoch.
+    """
+    values = [v[:-1] if v.endswith("Z") else v for v in values]
+    return np.array(values, dtype="datetime64[us]").astype(np.int64)
+
+
+def parse_timestamp(value: str) -> int:
+    """Convert a single server timestamp to epoch microseconds."""
+    return int(parse_timestamps([value])[0])
+
+
+def format_timestamp(value: int) -> str:
+    """Convert epoch microseconds to the server timestamp format."""
+    return f"{np.datetime64(int(value), 'us')}Z"
+
+
+def now_us() -> int:
+    """Current time in epoch microseconds."""
+    return time.time_ns() // 1000
@@ -0,0 +1,59 @@
+from typing import Dict, List, Optional
+
+from src.stats.ann_decoder import TargetAnnotation
+
+# Key of the project custom data with the class the statistics tags were calculated for
+STATS_CLASS_KEY = "anomaly_sorter_stats_class"
+# Key of the project custom data with the intensity channel of the statistics tags ("all" if absent)
+STATS_CHANNEL_KEY = "anomaly_sorter_stats_channel"
+# Image tag with the content the statistics tags of the image were calculated for
+# (see `fingerprint_tag_value`), written with the statistics tags when warm start is enabled
+STATS_FINGERPRINT_TAG = "_stats_fingerprint"
+
+
+def fingerprint_tag_value(image_hash: Optional[str], fingerprint: int) -> str:
+    """
+    Value of the fingerprint tag: the content fingerprint of the image (see `image_fingerprint`)
+    and the image hash.
+    """
+    return f"{fingerprint}:{image_hash}"
+
+
+class WarmStart:
+    """
+    Restores the statistics of an image from its statistics tags, so a fresh task does not
+    download and recalculate images with up-to-date tags.
+
+    The tag values are trusted only if all active metrics are present and the fingerprint tag
+    written with them (see `STATS_FINGERPRINT_TAG`) holds the hash of the image and the
+    fingerprint of its current annotation: the labels, the classes, the metrics and the
+    intensity channel (see `image_fingerprint`). Re-uploaded or relabeled images are
+    recalculated, tags added by other nodes do not invalidate the values.
+
+    :param metrics: Names of the active metrics.
+    """
+
+    def __init__(self, metrics: List[str]):
+        self.metrics = list(metrics)
+
+    def tag_values(
+        self, ann: TargetAnnotation, image_hash: Optional[str], fingerprint: int
+    ) -> Optional[Dict[str, float]]:
+        """
+        Get the statistics stored in the tags of the image.
+
+        :param ann: The decoded annotation with the metric and the fingerprint tags.
+        :param image_hash: Hash of the image (ImageInfo.hash).
+        :param fingerprint: Content fingerprint of the image (see `image_fingerprint`).
+        :return: Values of the active metrics or None if the tags are missing or stale.
+        """
+        tag = ann.img_tags.get(STATS_FINGERPRINT_TAG)
+        if tag is None or tag.value != fingerprint_tag_value(image_hash, fingerprint):
+            return None
+        values = {}
+        for name in self.metrics:
+            tag = ann.img_tags.get(name)
+            if tag is None or tag.value is None:
+                return None
+            values[name] = tag.value
+        return values
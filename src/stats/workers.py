@@ -0,0 +1,137 @@
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from src.stats.cache import SpilledImage
+from src.stats.image_stats import calculate_class_statistics
+from supervisely.annotation.label import Label
+from supervisely.sly_logger import logger
+
+
+def _share_array(arr: np.ndarray) -> Tuple[Optional[SharedMemory], Tuple]:
+    """
+    Copy the array into a new shared memory block. Returns the block and its descriptor.
+    Images spilled to disk (see `spill_image`) are not copied, they are shared by the file path
+    (the block is None).
+    """
+    if isinstance(arr, SpilledImage):
+        return None, ("file", arr.filename)
+    arr = np.ascontiguousarray(arr)
+    shm = SharedMemory(create=True, size=max(arr.nbytes, 1))
+    view = np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)
+    view[...] = arr
+    return shm, ("shm", shm.name, arr.shape, arr.dtype.str)
+
+
+def _attach_array(desc: Tuple) -> Tuple[Optional[SharedMemory], np.ndarray]:
+    """Attach to the shared memory block (or map the file) created by the parent process."""
+    if desc[0] == "file":
+        return None, np.load(desc[1], mmap_mode="r")
+    _, name, shape, dtype = desc
+    shm = SharedMemory(name=name)
+    return shm, np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+
+
+def _worker_calculate(
+    desc: Optional[Tuple],
+    labels: Dict[str, List[Label]],
+    metrics: Optional[List[str]],
+    img_size: Optional[Tuple[int, int]],
+    tile_size: int = 0,
+) -> Dict[str, Dict]:
+    if desc is None:
+        return calculate_class_statistics(None, labels, metrics, img_size, tile_size)
+    # the block is owned (and unlinked) by the parent process, the worker only closes it
+    shm, img = _attach_array(desc)
+    try:
+        return calculate_class_statistics(img, labels, metrics, img_size, tile_size)
+    finally:
+        del img
+        if shm is not None:
+            shm.close()
+
+
+class StatsWorkerPool:
+    """
+    Computes per-image statistics in a pool of worker processes.
+    Decoded images are handed off to the workers through shared memory (or by the file path
+    for images spilled to disk), so the arrays are not pickled. Results are returned in the
+    order of the input images.
+
+    :param workers: Number of worker processes. With 1 (or less) worker statistics
+        are calculated in the current process.
+    :param tile_size: Labels larger than a tile of this size are processed tile by tile,
+        0 to process every label at once (see `calculate_image_statistics`).
+    """
+
+    def __init__(self, workers: int = 1, tile_size: int = 0):
+        self.workers = max(int(workers or 1), 1)
+        self.tile_size = max(int(tile_size or 0), 0)
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # "spawn" is used because the app process runs threads (scheduler, server)
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=mp.get_context("spawn")
+            )
+            logger.info(f"Statistics worker pool started with {self.workers} processes.")
+        return self._executor
+
+    def map(
+        self,
+        imgs: List[Optional[np.ndarray]],
+        labels: List[Dict[str, List[Label]]],
+        metrics: Optional[List[str]] = None,
+        img_sizes: Optional[List[Tuple[int, int]]] = None,
+    ) -> List[Dict[str, Dict]]:
+        """
+        Calculate statistics for each image and class.
+
+        :param imgs: The images (None for images whose pixels are not needed).
+        :param labels: The labels of each class (by class name) for each image.
+        :param metrics: Names of the metrics to calculate. The default metrics by default.
+        :param img_sizes: Original (height, width) of each image, if the images are downscaled.
+        :return: A list of statistics dictionaries by class name, in the same order as the images.
+        """
+        if img_sizes is None:
+            img_sizes = [None] * len(imgs)
+        if self.workers == 1 or sum(img is not None for img in imgs) < 2:
+            return [
+                calculate_class_statistics(img, lbls, metrics, size, self.tile_size)
+                for img, lbls, size in zip(imgs, labels, img_sizes)
+            ]
+
+        blocks = []
+        # identical images (see `PixelSource`) are the same array, it is shared once
+        descs: Dict[int, Tuple] = {}
+        try:
+            futures = []
+            for img, lbls, size in zip(imgs, labels, img_sizes):
+                desc = None
+                if img is not None:
+                    desc = descs.get(id(img))
+                    if desc is None:
+                        shm, desc = _share_array(img)
+                        if shm is not None:
+                            blocks.append(shm)
+                        descs[id(img)] = desc
+                futures.append(
+                    self.executor.submit(
+                        _worker_calculate, desc, lbls, metrics, size, self.tile_size
+                    )
+                )
+            return [f.result() for f in futures]
+        finally:
+            for shm in blocks:
+                shm.close()
+                shm.unlink()
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,60 @@
+import contextlib
+import importlib.util
+import sys
+import types
+
+import supervisely.app.widgets as widgets
+from supervisely.app.content import DataJson
+
+
+def _stub_solution_sdk() -> None:
+    """
+    Minimal stand-ins for the solution elements and widgets of the SDK branch the app is built
+    with (see dev_requirements.txt), so the pipeline tests also run with the released SDK.
+    Only what the statistics node touches is provided, the UI calls do nothing.
+    """
+
+    class _Widget:
+        def __init__(self, *args, **kwargs):
+            self.widget_id = f"widget_{id(self)}"
+
+        def __getattr__(self, name):
+            return lambda *args, **kwargs: None
+
+        def click(self, func):
+            return func
+
+    class SolutionCard(_Widget):
+        class Tooltip(_Widget):
+            pass
+
+    class SlyTqdm(_Widget):
+        @contextlib.contextmanager
+        def __call__(self, total=0, message=""):
+            yield types.SimpleNamespace(update=lambda n: None)
+
+    class SolutionElement:
+        def __init__(self, *args, **kwargs):
+            self.widget_id = f"solution_element_{id(self)}"
+            DataJson()[self.widget_id] = {}
+
+    class Automation:
+        def __init__(self):
+            self.scheduler = None
+
+    base_node = types.ModuleType("supervisely.solution.base_node")
+    base_node.SolutionElement = SolutionElement
+    base_node.SolutionCardNode = _Widget
+    base_node.Automation = Automation
+    solution = types.ModuleType("supervisely.solution")
+    solution.base_node = base_node
+    sys.modules["supervisely.solution"] = solution
+    sys.modules["supervisely.solution.base_node"] = base_node
+    widgets.SolutionCard = SolutionCard
+    widgets.SlyTqdm = SlyTqdm
+    widgets.Button = _Widget
+    widgets.Icons = _Widget
+
+
+if importlib.util.find_spec("supervisely.solution") is None:
+    _stub_solution_sdk()
@@ -0,0 +1,51 @@
+from benchmarks.fake_api import FakeApi, ProjectSpec
+from src.stats.change_feed import ChangeFeed
+from src.stats.timestamps import NEVER, parse_timestamps
+
+
+def _listed(feed: ChangeFeed):
+    """IDs of the listed images by dataset and the max `updated_at` of each dataset."""
+    listed, cursors = {}, {}
+    for dataset in feed.list_datasets():
+        for page in feed.iter_changes(dataset):
+            assert len(page) <= feed.page_size
+            listed.setdefault(dataset.id, []).extend(info.id for info in page)
+            curr = int(parse_timestamps([info.updated_at for info in page]).max())
+            cursors[dataset.id] = max(cursors.get(dataset.id, NEVER), curr)
+    return listed, cursors
+
+
+def test_only_updated_images_are_listed():
+    api = FakeApi(ProjectSpec(images=60, datasets=2, width=32, height=32))
+    api.edit_images(0.1, seed=1)
+    feed = ChangeFeed(api, api.project_id, page_size=7)
+
+    # all images are listed without a cursor
+    listed, cursors = _listed(feed)
+    assert sorted(sum(listed.values(), [])) == sorted(api.server.images)
+    for dataset_id, cursor in cursors.items():
+        feed.advance(dataset_id, cursor)
+    # nothing is updated: only the images with the timestamp of the cursor are listed again
+    listed, _ = _listed(feed)
+    for dataset_id, ids in listed.items():
+        updated_at = [api.server.images[i]["updated_at"] for i in ids]
+        assert updated_at == [feed.cursors[dataset_id]] * len(ids)
+
+    edited = api.edit_images(0.2, seed=2)
+    listed, _ = _listed(feed)
+    listed = set(sum(listed.values(), []))
+    assert set(edited) <= listed
+    assert all(api.server.images[i]["updated_at"] >= min(feed.cursors.values()) for i in listed)
+    assert len(listed) < len(api.server.images)
+
+
+def test_cursor_never_moves_backward():
+    api = FakeApi(ProjectSpec(images=4, datasets=1, width=32, height=32))
+    feed = ChangeFeed(api, api.project_id)
+    feed.advance(1, 100)
+    feed.advance(1, 50)
+    assert feed.cursors == {1: 100}
+    feed.reset()
+    assert feed.cursors == {}
+    listed, _ = _listed(feed)
+    assert sorted(listed[1]) == sorted(api.server.images)
@@ -0,0 +1,74 @@
+import json
+
+import numpy as np
+
+from src.stats.checkpoint import StatsCheckpoint
+from src.stats.store import StatsStore
+
+
+class _State:
+    """Minimal state of a statistics run: the committed "last updates" of the images."""
+
+    def __init__(self, store: StatsStore):
+        self.store = store
+        self.updates = {}
+
+    def apply(self, payload):
+        image_id, updated_at = payload
+        self.updates[image_id] = updated_at
+
+    def snapshot(self):
+        return {"rows": len(self.store), "updates": sorted(self.updates.items())}
+
+
+def _store():
+    return StatsStore({"image_ids": np.int64, "_labels.1": np.float64})
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / "stats.json")
+    store = _store()
+    state = _State(store)
+    checkpoint = StatsCheckpoint(path, state.snapshot, store=store)
+    checkpoint.start(state.apply, classes=[1])
+    for image_id in (10, 11, 12):
+        store.append({"image_ids": image_id, "_labels.1": image_id / 2})
+    checkpoint.stage(1, (10, 100))
+    checkpoint.stage(1, (11, 110))
+    checkpoint.commit(1)
+    checkpoint.save()
+
+    restored_store = _store()
+    restored = StatsCheckpoint(path, lambda: {}, store=restored_store)
+    data = restored.load()
+    assert data["classes"] == [1]
+    assert data["updates"] == [[10, 100], [11, 110]]
+    assert restored_store.load(restored.store_path)
+    assert restored_store.column("image_ids").tolist() == [10, 11, 12]
+    np.testing.assert_array_equal(restored_store.column("_labels.1"), [5.0, 5.5, 6.0])
+
+
+def test_resume_skips_uncommitted_batches(tmp_path):
+    path = str(tmp_path / "stats.json")
+    store = _store()
+    state = _State(store)
+    checkpoint = StatsCheckpoint(path, state.snapshot, store=store, min_interval=0)
+    checkpoint.start(state.apply)
+    checkpoint.stage(1, (10, 100))
+    checkpoint.stage(2, (11, 110))
+    checkpoint.stage(3, (12, 120))
+    # the tags of the batches 1 and 2 are uploaded, the task crashes before the batch 3
+    checkpoint.commit(2)
+
+    data = StatsCheckpoint(path, lambda: {}).load()
+    assert data["updates"] == [[10, 100], [11, 110]]
+
+
+def test_load_ignores_invalid_files(tmp_path):
+    path = tmp_path / "stats.json"
+    checkpoint = StatsCheckpoint(str(path), lambda: {})
+    assert checkpoint.load() is None
+    path.write_text("{not json")
+    assert checkpoint.load() is None
+    path.write_text(json.dumps({"version": StatsCheckpoint.VERSION - 1}))
+    assert checkpoint.load() is None
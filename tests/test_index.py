@@ -0,0 +1,34 @@
+import numpy as np
+
+from src.stats.index import ImageIndex
+
+
+def test_lookup_after_inserts():
+    rng = np.random.default_rng(0)
+    ids = rng.choice(10**9, size=5000, replace=False)
+    index = ImageIndex(ids[:1000])
+    expected = {int(image_id): row for row, image_id in enumerate(ids[:1000])}
+    # several chunks, so the tail is merged into the sorted arrays more than once
+    for start in range(1000, len(ids), 700):
+        chunk = ids[start : start + 700]
+        rows = list(range(start, start + len(chunk)))
+        index.add(chunk, rows)
+        expected.update({int(image_id): row for image_id, row in zip(chunk, rows)})
+        assert len(index) == len(expected)
+
+    assert index.lookup(ids).tolist() == [expected[int(i)] for i in ids]
+    assert index.lookup([]).tolist() == []
+    missing = [-1, 10**9 + 1, 0]
+    assert index.lookup(missing).tolist() == [-1, -1, -1]
+    assert index.get(int(ids[4321])) == 4321
+    assert index.get(10**9 + 1, default=-5) == -5
+    assert int(ids[42]) in index
+    assert 10**9 + 1 not in index
+
+
+def test_lookup_in_tail_and_sorted_part():
+    index = ImageIndex([30, 10, 20])
+    index.add([5, 25], [3, 4])
+    assert index.lookup([10, 20, 30, 5, 25, 15]).tolist() == [1, 2, 0, 3, 4, -1]
+    index._merge()
+    assert index.lookup([10, 20, 30, 5, 25, 15]).tolist() == [1, 2, 0, 3, 4, -1]
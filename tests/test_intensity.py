@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+from src.stats.cache import spill_image
+from src.stats.metrics import calculate_metrics
+from supervisely.annotation.label import Label
+from supervisely.annotation.obj_class import ObjClass
+from supervisely.geometry.bitmap import Bitmap
+from supervisely.geometry.point_location import PointLocation
+from supervisely.geometry.polygon import Polygon
+from supervisely.geometry.rectangle import Rectangle
+
+HEIGHT, WIDTH = 157, 211
+
+
+def _labels(rng: np.random.Generator):
+    labels = []
+    for _ in range(10):
+        top, left = rng.integers(-10, HEIGHT), rng.integers(-10, WIDTH)
+        height, width = rng.integers(1, 120, 2)
+        rect = Rectangle(top, left, top + height, left + width)
+        labels.append(Label(rect, ObjClass("rect", Rectangle)))
+        points = [
+            PointLocation(int(row), int(col))
+            for row, col in zip(rng.integers(-5, HEIGHT + 5, 6), rng.integers(-5, WIDTH + 5, 6))
+        ]
+        labels.append(Label(Polygon(points), ObjClass("poly", Polygon)))
+        data = rng.random((int(height), int(width))) > 0.5
+        if data.any():
+            origin = PointLocation(int(max(top, 0)), int(max(left, 0)))
+            labels.append(Label(Bitmap(data, origin=origin), ObjClass("bitmap", Bitmap)))
+    # the whole frame
+    labels.append(Label(Rectangle(0, 0, HEIGHT - 1, WIDTH - 1), ObjClass("rect", Rectangle)))
+    return labels
+
+
+@pytest.fixture(params=[3, 1], ids=["rgb", "plane"])
+def img(request):
+    rng = np.random.default_rng(0)
+    shape = (HEIGHT, WIDTH, 3) if request.param == 3 else (HEIGHT, WIDTH)
+    return rng.integers(0, 256, shape, dtype=np.uint8)
+
+
+@pytest.mark.parametrize("tile_size", [1, 7, 32, 100, 1000])
+def test_tiled_labels_match_full(img, tile_size):
+    metrics = ["_avg_intensity_diff", "_avg_contrast_std"]
+    for label in _labels(np.random.default_rng(1)):
+        # one label per call, so each label is compared (not only the aggregates)
+        expected = calculate_metrics(img, [label], metrics)
+        actual = calculate_metrics(img, [label], metrics, tile_size=tile_size)
+        for name in metrics:
+            assert actual[name] == pytest.approx(expected[name], rel=1e-9, abs=1e-9)
+
+
+def test_tiled_metrics_match_full(img):
+    labels = _labels(np.random.default_rng(2))
+    metrics = ["_avg_intensity_diff", "_min_intensity_diff", "_max_intensity_diff"]
+    metrics.append("_avg_contrast_std")
+    expected = calculate_metrics(img, labels, metrics)
+    actual = calculate_metrics(img, labels, metrics, tile_size=16)
+    assert actual.keys() == expected.keys()
+    for name in metrics:
+        assert actual[name] == pytest.approx(expected[name], rel=1e-9, abs=1e-9)
+
+
+def test_tiled_metrics_on_spilled_image(img):
+    labels = _labels(np.random.default_rng(3))
+    metrics = ["_avg_intensity_diff", "_max_intensity_diff"]
+    expected = calculate_metrics(img, labels, metrics)
+    actual = calculate_metrics(spill_image(img), labels, metrics, tile_size=16)
+    for name in metrics:
+        assert actual[name] == pytest.approx(expected[name], rel=1e-9, abs=1e-9)
@@ -0,0 +1,71 @@
+import types
+
+import numpy as np
+import pytest
+import requests
+
+from benchmarks.fake_api import FakeApi, ProjectSpec
+from src.stats import pixels
+from src.stats.cache import ImageCache, SpilledImage
+from src.stats.pixels import PixelSource
+
+
+def _api(retry_count: int = 3):
+    return types.SimpleNamespace(headers={}, retry_count=retry_count, retry_sleep_sec=0)
+
+
+def _flaky_get(monkeypatch, failures: int):
+    """Make `requests.get` fail with a connection error `failures` times, then succeed."""
+    calls = []
+
+    def get(url, headers=None, timeout=None):
+        calls.append(url)
+        if len(calls) <= failures:
+            raise requests.ConnectionError("connection reset")
+        response = requests.Response()
+        response.status_code = 200
+        response._content = b"preview"
+        return response
+
+    monkeypatch.setattr(pixels.requests, "get", get)
+    return calls
+
+
+def test_preview_download_is_retried(monkeypatch):
+    calls = _flaky_get(monkeypatch, failures=2)
+    response = PixelSource(_api(retry_count=3))._get("http://preview")
+    assert response.content == b"preview"
+    assert len(calls) == 3
+
+
+def test_preview_download_fails_after_retry_limit(monkeypatch):
+    calls = _flaky_get(monkeypatch, failures=5)
+    with pytest.raises(requests.ConnectionError):
+        PixelSource(_api(retry_count=3))._get("http://preview")
+    assert len(calls) == 3
+
+
+def test_duplicates_and_recent_hits_are_counted_separately():
+    api = FakeApi(ProjectSpec(images=3, datasets=1, width=32, height=32))
+    infos = [api.server.image_info(i) for i in api.server.images]
+    source = PixelSource(api)
+    imgs, _ = source.download(1, [infos[0], infos[0], infos[1]])
+    assert imgs[0] is imgs[1]
+    assert (source.deduplicated, source.recent_hits) == (1, 0)
+    source.download(1, [infos[0], infos[2]])
+    assert (source.deduplicated, source.recent_hits) == (1, 1)
+
+
+def test_large_cached_images_are_spilled(tmp_path):
+    api = FakeApi(ProjectSpec(images=2, datasets=1, width=64, height=48))
+    infos = [api.server.image_info(i) for i in api.server.images]
+    cache = ImageCache(str(tmp_path), 10 * 1024 * 1024)
+    # nothing is kept in memory, the second download reads the cache
+    source = PixelSource(api, cache=cache, memory_mb=0, tile_size=16)
+    expected, _ = source.download(1, infos)
+    cache.flush()
+    imgs, _ = source.download(1, infos)
+    assert cache.hits == 2
+    for img, exp in zip(imgs, expected):
+        assert isinstance(img, SpilledImage)
+        np.testing.assert_array_equal(img, exp)
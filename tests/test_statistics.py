@@ -0,0 +1,228 @@
+from typing import Dict, List
+
+import numpy as np
+import pytest
+
+from benchmarks.fake_api import FakeApi, ProjectSpec
+from src.components.statistics import Statictics
+from src.stats.image_stats import calculate_image_statistics
+from src.stats.pixels import CHANNEL_ALL, to_channel
+from src.stats.warm_start import STATS_CHANNEL_KEY, STATS_FINGERPRINT_TAG
+from supervisely.annotation.annotation import Annotation
+from supervisely.annotation.tag_meta import TagMeta
+from supervisely.api.module_api import ApiField
+from supervisely.geometry.constants import CLASS_ID
+from supervisely.project.project_meta import ProjectMeta
+
+SPEC = ProjectSpec(images=40, datasets=2, width=96, height=64, labels_per_image=4, label_size=0.3)
+
+
+def _create_node(api: FakeApi, **kwargs) -> Statictics:
+    node = Statictics(api=api, project_id=api.project_id, sync_interval=0, **kwargs)
+    node.set_selected_class(api.target_class())
+    return node
+
+
+def _recompute(
+    api: FakeApi, class_name: str, metrics: List[str], channel: str = CHANNEL_ALL
+) -> Dict[int, Dict]:
+    """Statistics of every image calculated from scratch, image by image."""
+    meta = ProjectMeta.from_json(api.project.get_meta(api.project_id))
+    expected = {}
+    for img_id, img in api.server.images.items():
+        dataset_id = img["dataset_id"]
+        ann_json = api.annotation.download_json_batch(dataset_id, [img_id])[0]
+        ann = Annotation.from_json(ann_json, meta)
+        labels = [label for label in ann.labels if label.obj_class.name == class_name]
+        pixels = to_channel(api.image.download_nps(dataset_id, [img_id])[0], channel)
+        expected[img_id] = calculate_image_statistics(pixels, labels, metrics)
+    return expected
+
+
+def _record_downloads(api: FakeApi, monkeypatch) -> List[int]:
+    """Record the IDs of the downloaded images."""
+    downloaded = []
+    download_bytes = api.image.download_bytes
+
+    def record(dataset_id, ids, progress_cb=None):
+        downloaded.extend(ids)
+        return download_bytes(dataset_id, ids, progress_cb)
+
+    monkeypatch.setattr(api.image, "download_bytes", record)
+    return downloaded
+
+
+def _assert_up_to_date(api: FakeApi, node: Statictics) -> None:
+    """The statistics of the node and the tags on the server match a full recompute."""
+    expected = _recompute(api, node.selected_class, node.metrics, node.pixels.channel)
+    stats = node.stats
+    assert sorted(stats["image_ids"].tolist()) == sorted(expected)
+    tag_names = {api.server.meta.get_tag_meta(name).sly_id: name for name in node.metrics}
+    for row, img_id in enumerate(stats["image_ids"].tolist()):
+        values = expected[img_id]
+        assert {m: stats[m][row] for m in node.metrics} == pytest.approx(values)
+        tags = api.server.images[img_id]["tags"]
+        tags = [tag for tag in tags if tag[ApiField.TAG_ID] in tag_names]
+        # one tag per metric
+        assert sorted(tag_names[tag[ApiField.TAG_ID]] for tag in tags) == sorted(node.metrics)
+        assert {tag_names[tag[ApiField.TAG_ID]]: tag[ApiField.VALUE] for tag in tags} == (
+            pytest.approx(values)
+        )
+
+
+def test_full_and_incremental_runs_match_recompute(monkeypatch):
+    api = FakeApi(SPEC)
+    node = _create_node(api)
+    node.calculate_statistics(node.selected_class)
+    _assert_up_to_date(api, node)
+
+    edited = api.edit_images(0.3)
+    assert edited
+    with monkeypatch.context() as m:
+        downloaded = _record_downloads(api, m)
+        node.calculate_statistics(node.selected_class)
+    # only the edited images are downloaded again
+    assert set(downloaded) <= set(edited)
+    _assert_up_to_date(api, node)
+
+
+def test_class_switch_updates_tags_in_place(monkeypatch):
+    api = FakeApi(SPEC._replace(classes=2))
+    classes = [obj_class.name for obj_class in api.server.meta.obj_classes]
+    node = _create_node(api, classes=["*"])
+    node.calculate_statistics(node.selected_class)
+
+    api.server.reset_calls()
+    with monkeypatch.context() as m:
+        downloaded = _record_downloads(api, m)
+        node.set_selected_class(classes[1])
+        node.calculate_statistics(classes[1])
+    assert downloaded == []
+    assert api.calls.get("image.update_tag_value", 0) > 0
+    assert "advanced.remove_tags_from_images" not in api.calls
+    _assert_up_to_date(api, node)
+
+
+def test_resume_from_checkpoint(tmp_path, monkeypatch):
+    api = FakeApi(SPEC)
+    node = _create_node(api, checkpoint_dir=str(tmp_path))
+    node.calculate_statistics(node.selected_class)
+    stats = node.stats
+
+    # a new task with the same checkpoint does not download the images again
+    with monkeypatch.context() as m:
+        downloaded = _record_downloads(api, m)
+        restarted = _create_node(api, checkpoint_dir=str(tmp_path))
+        restarted.calculate_statistics(restarted.selected_class)
+    assert downloaded == []
+    assert restarted.stats["image_ids"].tolist() == stats["image_ids"].tolist()
+    _assert_up_to_date(api, restarted)
+
+
+def test_added_metric_is_calculated_for_all_images():
+    api = FakeApi(SPEC)
+    node = _create_node(api, metrics=["_labels", "_max_area"])
+    node.run()
+    _assert_up_to_date(api, node)
+
+    # nothing is updated on the server, the added metric is calculated for every image
+    assert node.set_metrics(["_labels", "_max_area", "_total_perimeter"])
+    node.run()
+    assert not np.isnan(node.stats["_total_perimeter"]).any()
+    _assert_up_to_date(api, node)
+
+
+def test_metrics_set_during_run_are_applied_after_it(monkeypatch):
+    api = FakeApi(SPEC)
+    node = _create_node(api, metrics=["_labels"])
+    download_json_batch = api.annotation.download_json_batch
+
+    def switch_metrics(dataset_id, ids, *args, **kwargs):
+        # the filters are saved while the batch is being calculated
+        node.set_metrics(["_labels", "_avg_intensity_diff"])
+        node.run()  # returns at once, the run is in progress
+        return download_json_batch(dataset_id, ids, *args, **kwargs)
+
+    with monkeypatch.context() as m:
+        m.setattr(api.annotation, "download_json_batch", switch_metrics)
+        node.run()
+    assert node.metrics == ["_labels", "_avg_intensity_diff"]
+    assert not node.in_progress
+    _assert_up_to_date(api, node)
+
+
+def test_failed_run_can_be_restarted(monkeypatch):
+    api = FakeApi(SPEC)
+    node = _create_node(api)
+
+    def fail(*args, **kwargs):
+        raise ConnectionError("server is not available")
+
+    with monkeypatch.context() as m:
+        m.setattr(api.annotation, "download_json_batch", fail)
+        with pytest.raises(ConnectionError):
+            node.run()
+    assert not node.in_progress
+    node.run()
+    _assert_up_to_date(api, node)
+
+
+def test_warm_start_restores_up_to_date_tags(monkeypatch):
+    api = FakeApi(SPEC)
+    node = _create_node(api, warm_start=True)
+    node.calculate_statistics(node.selected_class)
+    fingerprint_tag_id = api.server.meta.get_tag_meta(STATS_FINGERPRINT_TAG).sly_id
+    for img in api.server.images.values():
+        assert [tag[ApiField.TAG_ID] for tag in img["tags"]].count(fingerprint_tag_id) == 1
+    api.project.update_meta(
+        api.project_id, api.server.meta.add_tag_meta(TagMeta("reviewed", "none"))
+    )
+
+    # the tags of these images are stale: relabeled images and a re-uploaded one
+    edited = api.edit_images(0.2)
+    reuploaded = next(i for i in api.server.images if i not in edited)
+    api.server.images[reuploaded]["content"] += 1
+    api.server.images[reuploaded]["hash"] = "reuploaded"
+    api.server.touch(reuploaded)
+    # tags added by other nodes do not invalidate the values
+    api.set_image_tag("reviewed", list(api.server.images))
+    stale = set(edited) | {reuploaded}
+
+    with monkeypatch.context() as m:
+        downloaded = _record_downloads(api, m)
+        restarted = _create_node(api, warm_start=True)
+        restarted.calculate_statistics(restarted.selected_class)
+    assert set(downloaded) <= stale
+    assert reuploaded in downloaded
+    _assert_up_to_date(api, restarted)
+
+
+def test_checkpoint_of_other_channel_is_ignored(tmp_path, monkeypatch):
+    api = FakeApi(SPEC)
+    node = _create_node(api, checkpoint_dir=str(tmp_path))
+    node.calculate_statistics(node.selected_class)
+    # the images updated by the tag upload are listed once more
+    node.calculate_statistics(node.selected_class)
+
+    with monkeypatch.context() as m:
+        downloaded = _record_downloads(api, m)
+        restarted = _create_node(api, checkpoint_dir=str(tmp_path), intensity_channel="red")
+        restarted.calculate_statistics(restarted.selected_class)
+    # every image with labels of the class is recalculated on the red plane
+    class_id = api.server.meta.get_obj_class(restarted.selected_class).sly_id
+    labeled = [
+        i for i, objs in api.server.anns.items() if any(o[CLASS_ID] == class_id for o in objs)
+    ]
+    assert sorted(set(downloaded)) == sorted(labeled)
+    assert api.server.custom_data[STATS_CHANNEL_KEY] == "red"
+    _assert_up_to_date(api, restarted)
+
+
+def test_batch_size_defaults():
+    api = FakeApi(SPEC)
+    node = _create_node(api)
+    # without a memory budget the batches keep the size of the listing pages before it
+    assert node.sizer.max_images == 50
+    assert node.feed.page_size == 500
+    assert _create_node(api, memory_budget_mb=1024).sizer.max_images == 500
+    assert _create_node(api, max_batch_size=20, listing_page_size=100).sizer.max_images == 20
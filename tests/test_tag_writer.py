@@ -0,0 +1,112 @@
+from typing import Dict, List, Tuple
+
+import pytest
+
+from benchmarks.fake_api import FakeApi, ProjectSpec
+from src.stats.tag_writer import TagUpdate, TagWriter
+from supervisely.api.module_api import ApiField
+
+TAG_META_ID = 1000
+
+
+@pytest.fixture
+def api() -> FakeApi:
+    return FakeApi(ProjectSpec(images=6, datasets=1, width=32, height=32))
+
+
+def _tags(api: FakeApi, tag_meta_id: int = TAG_META_ID) -> Dict[int, List[Tuple[int, float]]]:
+    """Instances (ID and value) of the tag on each image."""
+    return {
+        img_id: [
+            (tag[ApiField.ID], tag[ApiField.VALUE])
+            for tag in img["tags"]
+            if tag[ApiField.TAG_ID] == tag_meta_id
+        ]
+        for img_id, img in api.server.images.items()
+    }
+
+
+def _upload(api: FakeApi, values: Dict[int, float]) -> Dict[int, int]:
+    """Upload a tag with the value to each image, returns the tag IDs by image ID."""
+    added = {}
+
+    def on_added(tags, ids):
+        added.update({tag["entityId"]: tag_id for tag, tag_id in zip(tags, ids)})
+
+    writer = TagWriter(api, api.project_id, on_added=on_added)
+    writer.add([{"tagId": TAG_META_ID, "entityId": i, "value": v} for i, v in values.items()])
+    writer.join()
+    return added
+
+
+def test_add_reports_tag_ids(api):
+    img_ids = list(api.server.images)
+    added = _upload(api, {i: float(i) for i in img_ids})
+    tags = _tags(api)
+    assert sorted(added) == sorted(img_ids)
+    for img_id in img_ids:
+        assert tags[img_id] == [(added[img_id], float(img_id))]
+
+
+def test_update_in_place(api):
+    img_ids = list(api.server.images)
+    added = _upload(api, {i: 1.0 for i in img_ids})
+    api.server.reset_calls()
+
+    writer = TagWriter(api, api.project_id, max_inplace=10)
+    writer.update([TagUpdate(TAG_META_ID, i, added[i], 2.0) for i in img_ids[:3]])
+    writer.join()
+
+    assert api.calls == {"image.update_tag_value": 3}
+    assert writer.flushed == 3
+    tags = _tags(api)
+    for img_id in img_ids[:3]:
+        assert tags[img_id] == [(added[img_id], 2.0)]
+    for img_id in img_ids[3:]:
+        assert tags[img_id] == [(added[img_id], 1.0)]
+
+
+@pytest.mark.parametrize("known_ids", [True, False], ids=["over-limit", "unknown-ids"])
+def test_update_re_adds_tags(api, known_ids):
+    img_ids = list(api.server.images)
+    added = _upload(api, {i: 1.0 for i in img_ids})
+    api.server.reset_calls()
+
+    writer = TagWriter(api, api.project_id, max_inplace=2)
+    updates = [TagUpdate(TAG_META_ID, i, added[i] if known_ids else None, 3.0) for i in img_ids[:4]]
+    writer.update(updates)
+    writer.join()
+
+    assert "image.update_tag_value" not in api.calls
+    assert api.calls["advanced.remove_tags_from_images"] == 1
+    assert api.calls["image.tag.add_to_entities_json"] == 1
+    assert writer.flushed == 4
+    tags = _tags(api)
+    for img_id in img_ids[:4]:
+        # one instance of the tag with the new value
+        assert len(tags[img_id]) == 1 and tags[img_id][0][1] == 3.0
+    for img_id in img_ids[4:]:
+        assert tags[img_id] == [(added[img_id], 1.0)]
+
+
+def test_stale_tag_id_is_re_added(api):
+    img_ids = list(api.server.images)
+    added = _upload(api, {i: 1.0 for i in img_ids[:2]})
+    api.server.reset_calls()
+
+    writer = TagWriter(api, api.project_id, max_inplace=10)
+    stale_id = max(added.values()) + 1000
+    writer.update(
+        [
+            TagUpdate(TAG_META_ID, img_ids[0], added[img_ids[0]], 4.0),
+            TagUpdate(TAG_META_ID, img_ids[1], stale_id, 4.0),
+        ]
+    )
+    writer.join()
+
+    assert api.calls["image.update_tag_value"] == 2
+    assert api.calls["image.tag.add_to_entities_json"] == 1
+    assert writer.flushed == 2
+    tags = _tags(api)
+    assert tags[img_ids[0]] == [(added[img_ids[0]], 4.0)]
+    assert len(tags[img_ids[1]]) == 1 and tags[img_ids[1]][0][1] == 4.0